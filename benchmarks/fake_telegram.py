@@ -0,0 +1,124 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod, GetFile, GetMe
+from aiogram.methods.base import Response
+from aiogram.types import Update
+
+BOT_ID = 123456
+FAKE_TOKEN = f"{BOT_ID}:benchmark-token-not-used-for-network"
+BOT_USER = {"id": BOT_ID, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия Bot API без сети
+
+    Отвечает на все методы так, как ответил бы Telegram: отправка сообщений
+    возвращает Message, getFile — File, остальные методы — True. Ответ проходит
+    ту же валидацию, что и настоящий (Response[...].model_validate), поэтому
+    обработчики получают привязанные к боту объекты.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.files: Dict[str, bytes] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    def add_file(self, file_id: str, content: bytes):
+        self.files[file_id] = content
+
+    def _result(self, method: TelegramMethod) -> Any:
+        if isinstance(method, GetMe):
+            return BOT_USER
+
+        if isinstance(method, GetFile):
+            return {
+                "file_id": method.file_id,
+                "file_unique_id": method.file_id,
+                "file_size": len(self.files.get(method.file_id, b"")),
+                "file_path": method.file_id,
+            }
+
+        if method.__api_method__.startswith("send"):
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": method.chat_id, "type": "private"},
+                "text": getattr(method, "text", None),
+            }
+
+        return True
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        response = Response[method.__returning__].model_validate(
+            {"ok": True, "result": self._result(method)}, context={"bot": bot}
+        )
+        return response.result
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        content = self.files.get(url.rsplit("/", 1)[-1], b"")
+        for offset in range(0, len(content), chunk_size):
+            yield content[offset:offset + chunk_size]
+
+    async def close(self):
+        pass
+
+
+class UpdateFactory:
+    """Собирает синтетические обновления от имени пользователя"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id: int, **fields: Any) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **fields,
+        }
+
+    def _update(self, **fields: Any) -> Update:
+        return Update.model_validate({"update_id": next(self._update_ids), **fields}, context={"bot": self.bot})
+
+    def text(self, user_id: int, text: str) -> Update:
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else None
+        return self._update(message=self._message(user_id, text=text, entities=entities))
+
+    def document(self, user_id: int, file_id: str, file_name: str, file_size: int) -> Update:
+        return self._update(message=self._message(user_id, document={
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_name": file_name,
+            "file_size": file_size,
+        }))
+
+    def callback(self, user_id: int, data: str) -> Update:
+        return self._update(callback_query={
+            "id": str(next(self._callback_ids)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "message": self._message(user_id, text="...") | {"from": BOT_USER},
+            "data": data,
+        })
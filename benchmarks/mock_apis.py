@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import random
+import socket
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from aiohttp import web
+
+# Сколько суффиксов отдаёт настоящий Pwned Passwords на один префикс (в среднем ~800)
+HIBP_SUFFIXES_PER_PREFIX = 800
+# Маркер «вредоносного» файла для заглушки VirusTotal
+MALICIOUS_MARKER = b"EICAR"
+
+
+class MockApis:
+    """
+    Локальные заглушки VirusTotal и Pwned Passwords
+
+    VirusTotal доступен по /vt (files, files/{sha256}, analyses), Pwned Passwords — по /hibp/range.
+    Каждый ответ задерживается на latency ± jitter секунд; анализ VirusTotal
+    отдаёт статус queued первые queued_polls запросов.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, queued_polls: int = 0,
+                 leaked_passwords: Iterable[str] = (), seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.queued_polls = queued_polls
+        self.requests: Counter = Counter()
+        self._random = random.Random(seed)
+        self._analyses: Dict[str, Dict] = {}
+        # Отчёты по хешам: файл становится известен после загрузки
+        self._reports: Dict[str, bool] = {}
+        self._leaked: Dict[str, Dict[str, int]] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+        for password in leaked_passwords:
+            sha1_hash = hashlib.sha1(password.encode("utf-8")).hexdigest().upper()
+            self._leaked.setdefault(sha1_hash[:5], {})[sha1_hash[5:]] = self._random.randint(1, 100_000)
+
+    async def _delay(self):
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def handle_upload(self, request: web.Request) -> web.Response:
+        self.requests["vt_files"] += 1
+        malicious = False
+        reader = await request.multipart()
+        async for part in reader:
+            content = await part.read()
+            malicious = malicious or MALICIOUS_MARKER in content
+            self._reports[hashlib.sha256(content).hexdigest()] = MALICIOUS_MARKER in content
+        await self._delay()
+
+        analysis_id = f"analysis-{len(self._analyses) + 1}"
+        self._analyses[analysis_id] = {"polls": 0, "malicious": malicious}
+        return web.json_response({"data": {"type": "analysis", "id": analysis_id}})
+
+    async def handle_analysis(self, request: web.Request) -> web.Response:
+        self.requests["vt_analyses"] += 1
+        await self._delay()
+
+        analysis = self._analyses.get(request.match_info["analysis_id"])
+        if analysis is None:
+            return web.json_response({"error": {"code": "NotFoundError"}}, status=404)
+
+        analysis["polls"] += 1
+        if analysis["polls"] <= self.queued_polls:
+            return web.json_response({"data": {"attributes": {"status": "queued"}}})
+
+        detections = 3 if analysis["malicious"] else 0
+        results = {
+            f"Engine{index}": {"category": "malicious", "result": "EICAR-Test-File"} for index in range(detections)
+        }
+        return web.json_response({"data": {"attributes": {
+            "status": "completed",
+            "stats": {"malicious": detections, "suspicious": 0, "undetected": 70 - detections},
+            "results": results,
+        }}})
+
+    async def handle_report(self, request: web.Request) -> web.Response:
+        self.requests["vt_file_report"] += 1
+        await self._delay()
+
+        malicious = self._reports.get(request.match_info["sha256"].lower())
+        if malicious is None:
+            return web.json_response({"error": {"code": "NotFoundError"}}, status=404)
+
+        detections = 3 if malicious else 0
+        return web.json_response({"data": {"attributes": {
+            "last_analysis_stats": {"malicious": detections, "suspicious": 0, "undetected": 70 - detections},
+            "last_analysis_results": {
+                f"Engine{index}": {"category": "malicious", "result": "EICAR-Test-File"} for index in range(detections)
+            },
+        }}})
+
+    async def handle_range(self, request: web.Request) -> web.Response:
+        self.requests["hibp_range"] += 1
+        prefix = request.match_info["prefix"].upper()
+        await self._delay()
+
+        # Ответ детерминирован по префиксу, как у настоящего API
+        digits = random.Random(prefix).randbytes(HIBP_SUFFIXES_PER_PREFIX * 18).hex().upper()
+        lines = {
+            digits[offset:offset + 35]: int(digits[offset + 35], 16) * 60 + 1
+            for offset in range(0, len(digits), 36)
+        }
+        lines.update(self._leaked.get(prefix, {}))
+        return web.Response(text="\r\n".join(f"{suffix}:{count}" for suffix, count in lines.items()))
+
+    async def start(self, host: str = "127.0.0.1") -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/vt/files", self.handle_upload)
+        app.router.add_get("/vt/files/{sha256}", self.handle_report)
+        app.router.add_get("/vt/analyses/{analysis_id}", self.handle_analysis)
+        app.router.add_get("/hibp/range/{prefix}", self.handle_range)
+
+        # Порт выбирает ОС, чтобы параллельные прогоны не конфликтовали
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((host, 0))
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock).start()
+
+        self.base_url = f"http://{host}:{sock.getsockname()[1]}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
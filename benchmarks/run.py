@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_telegram import FakeSession, UpdateFactory, FAKE_TOKEN
+from benchmarks.mock_apis import MockApis, MALICIOUS_MARKER
+
+DEFAULT_MIX = "start=2,quiz=3,phishing=3,progress=2,password=2,upload=1"
+RESULTS_DIR = "bench_results"
+
+LEAKED_PASSWORDS = ("123456", "password", "qwerty123", "iloveyou", "P@ssw0rd!")
+# Тестовая строка EICAR хранится в hex, чтобы сам репозиторий не срабатывал в антивирусах
+EICAR = bytes.fromhex(
+    "58354f2150254041505b345c505a58353428505e2937434329377d2445494341522d"
+    "5354414e444152442d414e544956495255532d544553542d46494c452124482b482a"
+)
+STRONG_PASSWORDS = ("TH3r$_1s_n0_Sp00n!", "correct horse battery staple", "vT9#qL2!mZ7@xR4$")
+
+# Обработчик, выбранный для текущего обновления (заполняет inner middleware)
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("benchmark_current", default=None)
+
+
+async def record_handler(handler, event, data):
+    from middlewares.metrics import get_handler_name
+
+    current = _current.get()
+    if current is not None:
+        current["handler"] = get_handler_name(data)
+    return await handler(event, data)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Метод ближайшего ранга
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in FLOWS:
+            raise SystemExit(f"Неизвестный сценарий нагрузки: {name}. Доступны: {', '.join(FLOWS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class Runner:
+    def __init__(self, args: argparse.Namespace, dp, bot, session: FakeSession):
+        from services.metrics import update_stats
+
+        self.args = args
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.updates = UpdateFactory(bot)
+        self.update_stats = update_stats
+        self.samples: List[Dict[str, Any]] = []
+        self.flows: Counter = Counter()
+
+    async def feed(self, update):
+        current = {"handler": None}
+        stats: Dict[str, float] = {}
+        current_token = _current.set(current)
+        stats_token = self.update_stats.set(stats)
+        started = time.perf_counter()
+        error = False
+
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logging.exception(f"Ошибка обработки обновления {update.update_id}: {str(e)}")
+            error = True
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(current_token)
+            self.update_stats.reset(stats_token)
+
+        self.samples.append({
+            "handler": current["handler"] or "unhandled",
+            "seconds": elapsed,
+            "db_statements": stats.get("db_count", 0),
+            "external_requests": stats.get("external_count", 0),
+            "error": error,
+        })
+
+    async def flow_start(self, user_id: int, rnd: random.Random):
+        await self.feed(self.updates.text(user_id, "/start"))
+
+    async def flow_quiz(self, user_id: int, rnd: random.Random):
+        from services.test_engine import get_themes, get_theme_questions
+
+        theme = rnd.choice(get_themes())
+        await self.feed(self.updates.text(user_id, "/test"))
+        await self.feed(self.updates.callback(user_id, f"theme:{theme['id']}"))
+
+        for question in get_theme_questions(theme["id"]):
+            await self.feed(self.updates.callback(user_id, f"answer:{rnd.randrange(len(question['options']))}"))
+            await self.feed(self.updates.callback(user_id, "next_question"))
+
+        await self.feed(self.updates.callback(user_id, "back_to_start"))
+
+    async def flow_phishing(self, user_id: int, rnd: random.Random):
+        from services.phishing_scenarios import get_scenarios
+
+        scenario_id = rnd.choice([scenario["id"] for scenario in get_scenarios()] + ["random"])
+        await self.feed(self.updates.text(user_id, "/phishing"))
+        await self.feed(self.updates.callback(user_id, f"scenario:{scenario_id}"))
+
+        if rnd.random() < 0.3:
+            await self.feed(self.updates.callback(user_id, "click_phishing"))
+        await self.feed(self.updates.callback(user_id, "report_phishing"))
+        await self.feed(self.updates.callback(user_id, "show_education"))
+
+    async def flow_progress(self, user_id: int, rnd: random.Random):
+        await self.feed(self.updates.text(user_id, "/progress"))
+
+    async def flow_password(self, user_id: int, rnd: random.Random):
+        password = rnd.choice(LEAKED_PASSWORDS if rnd.random() < 0.5 else STRONG_PASSWORDS)
+        await self.feed(self.updates.text(user_id, "/check_password"))
+        await self.feed(self.updates.text(user_id, password))
+
+    async def flow_upload(self, user_id: int, rnd: random.Random):
+        file_id = f"file-{user_id}-{rnd.getrandbits(32):08x}"
+        kind = rnd.random()
+        if kind < 0.2:
+            # Текст: локальная проверка отвечает сама, без VirusTotal
+            content, extension = b"lorem ipsum dolor sit amet\n" * (self.args.file_size // 27), ".txt"
+        elif kind < 0.3:
+            content, extension = EICAR + rnd.randbytes(self.args.file_size), ".com"
+        else:
+            content, extension = rnd.randbytes(self.args.file_size), ".bin"
+            if kind < 0.45:
+                content = MALICIOUS_MARKER + content
+        self.session.add_file(file_id, content)
+
+        await self.feed(self.updates.text(user_id, "/upload"))
+        await self.feed(self.updates.document(user_id, file_id, f"{file_id}{extension}", len(content)))
+
+    async def virtual_user(self, user_id: int, weights: Dict[str, float]):
+        rnd = random.Random(f"{self.args.seed}:{user_id}")
+        names = list(weights)
+
+        for _ in range(self.args.iterations):
+            flow = rnd.choices(names, weights=[weights[name] for name in names])[0]
+            self.flows[flow] += 1
+            await FLOWS[flow](self, user_id, rnd)
+
+    def summary(self) -> Dict[str, Any]:
+        handlers: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for sample in self.samples:
+            handlers[sample["handler"]].append(sample)
+
+        def describe(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+            latencies = sorted(sample["seconds"] for sample in samples)
+            return {
+                "count": len(samples),
+                "errors": sum(sample["error"] for sample in samples),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+                "max_ms": round(latencies[-1] * 1000, 3),
+                "db_statements_per_update": round(sum(s["db_statements"] for s in samples) / len(samples), 2),
+                "external_requests_per_update": round(sum(s["external_requests"] for s in samples) / len(samples), 2),
+            }
+
+        return {
+            "all": describe(self.samples) if self.samples else {},
+            "handlers": {name: describe(samples) for name, samples in sorted(handlers.items())},
+        }
+
+
+FLOWS = {
+    "start": Runner.flow_start,
+    "quiz": Runner.flow_quiz,
+    "phishing": Runner.flow_phishing,
+    "progress": Runner.flow_progress,
+    "password": Runner.flow_password,
+    "upload": Runner.flow_upload,
+}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    weights = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    mock = MockApis(
+        latency=args.api_latency,
+        jitter=args.api_jitter,
+        queued_polls=args.vt_queued_polls,
+        leaked_passwords=LEAKED_PASSWORDS,
+        seed=args.seed
+    )
+    base_url = await mock.start()
+
+    # Настройки должны быть заданы до первого импорта config
+    os.environ.update({
+        "BOT_TOKEN": FAKE_TOKEN,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "VIRUSTOTAL_API_KEY": "benchmark",
+        "VIRUSTOTAL_API_URL": f"{base_url}/vt",
+        "PWNED_PASSWORDS_API_URL": f"{base_url}/hibp",
+        "TRACKING_BASE_URL": "",
+        "METRICS_PORT": "0",
+        "PROFILER_DIR": os.path.join(workdir, "profiles"),
+        "EXPORT_DIR": os.path.join(workdir, "exports"),
+        # Виртуальные пользователи шлют команды чаще живых: ограничение считается, но не срабатывает
+        "THROTTLE_RATE": "1000000",
+    })
+
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+
+    from database import engine, init_db
+    from main import create_dispatcher
+    from services.analysis_poller import POLLER
+    from services.prescan import shutdown_prescan
+    from services.archive import shutdown_archive
+    from services.metrics import instrument_engine
+
+    session = FakeSession(latency=args.telegram_latency)
+    bot = Bot(token=FAKE_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = create_dispatcher()
+    dp.message.middleware(record_handler)
+    dp.callback_query.middleware(record_handler)
+    instrument_engine(engine)
+    await init_db()
+
+    runner = Runner(args, dp, bot, session)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(runner.virtual_user(10_000 + index, weights) for index in range(args.users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await POLLER.stop()
+        shutdown_prescan()
+        shutdown_archive()
+        await mock.stop()
+        await engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = runner.summary()
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {
+            "users": args.users,
+            "iterations": args.iterations,
+            "mix": weights,
+            "api_latency": args.api_latency,
+            "api_jitter": args.api_jitter,
+            "vt_queued_polls": args.vt_queued_polls,
+            "telegram_latency": args.telegram_latency,
+            "file_size": args.file_size,
+            "seed": args.seed,
+        },
+        "seconds": round(elapsed, 3),
+        "updates": len(runner.samples),
+        "throughput_per_second": round(len(runner.samples) / elapsed, 2) if elapsed else 0.0,
+        # ru_maxrss в Linux — в килобайтах
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "flows": dict(runner.flows),
+        "telegram_calls": dict(session.calls),
+        "mock_requests": dict(mock.requests),
+        **summary,
+    }
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    print(
+        f"Обновлений: {result['updates']} за {result['seconds']:.2f} с "
+        f"({result['throughput_per_second']:.1f}/с), пиковый RSS: {result['peak_rss_mb']} МБ"
+    )
+    if baseline:
+        change = (result["throughput_per_second"] / baseline["throughput_per_second"] - 1) * 100
+        print(f"Пропускная способность относительно базового прогона: {change:+.1f}%")
+
+    print(f"\n{'обработчик':<24}{'кол-во':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'SQL/обн':>9}{'ошибки':>8}")
+    for name, stats in result["handlers"].items():
+        line = (
+            f"{name:<24}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+            f"{stats['p99_ms']:>10.2f}{stats['db_statements_per_update']:>9.2f}{stats['errors']:>8}"
+        )
+        previous = (baseline or {}).get("handlers", {}).get(name)
+        if previous and previous["p95_ms"]:
+            line += f"   p95 {(stats['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон диспетчера бота без сети")
+    parser.add_argument("--users", type=int, default=50, help="число одновременных пользователей")
+    parser.add_argument("--iterations", type=int, default=5, help="сценариев на пользователя")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"веса сценариев (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="задержка заглушек VirusTotal/HIBP, с")
+    parser.add_argument("--api-jitter", type=float, default=0.01, help="разброс задержки заглушек, с")
+    parser.add_argument("--vt-queued-polls", type=int, default=0, help="сколько опросов анализ будет в очереди")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка ответов Bot API, с")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="размер загружаемых файлов, байт")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help=f"файл результатов (по умолчанию {RESULTS_DIR}/<время>.json)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("-v", "--verbose", action="store_true", help="логи бота уровня INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+
+    result = asyncio.run(run(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, ensure_ascii=False, indent=2)
+
+    print_report(result, baseline)
+    print(f"\nРезультаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
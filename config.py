@@ -1,10 +1,156 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Несколько ботов в одном процессе: организация=токен через запятую (у каждой своя база)
+BOT_TOKENS = dict(
+    item.split("=", 1) for item in os.getenv("BOT_TOKENS", "").replace(" ", "").split(",") if item
+)
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
 
+# Адреса внешних API (переопределяются для бенчмарков с локальными заглушками)
+VIRUSTOTAL_API_URL = os.getenv("VIRUSTOTAL_API_URL", "https://www.virustotal.com/api/v3")
+PWNED_PASSWORDS_API_URL = os.getenv("PWNED_PASSWORDS_API_URL", "https://api.pwnedpasswords.com")
+
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB max file size
-DATABASE_URL = "sqlite:///bot.db" 
\ No newline at end of file
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+
+# Telegram ID администраторов через запятую
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
+# Выгрузка аналитики
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# Фишинговые кампании: лимит Telegram — около 30 сообщений в секунду на бота
+CAMPAIGN_RATE_LIMIT = float(os.getenv("CAMPAIGN_RATE_LIMIT", "25"))
+CAMPAIGN_CONCURRENCY = int(os.getenv("CAMPAIGN_CONCURRENCY", "10"))
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "200"))
+
+# Сервер учёта переходов по учебным фишинговым ссылкам (выключен, если не задан TRACKING_BASE_URL)
+TRACKING_BASE_URL = os.getenv("TRACKING_BASE_URL", "").rstrip("/")
+TRACKING_HOST = os.getenv("TRACKING_HOST", "0.0.0.0")
+TRACKING_PORT = int(os.getenv("TRACKING_PORT", "8080"))
+TRACKING_SECRET = os.getenv("TRACKING_SECRET") or BOT_TOKEN or next(iter(BOT_TOKENS.values()), "")
+# Куда перенаправлять после перехода; по умолчанию — учебная страница самого сервера
+TRACKING_TRAINING_URL = os.getenv("TRACKING_TRAINING_URL", f"{TRACKING_BASE_URL}/training")
+TRACKING_FLUSH_INTERVAL = float(os.getenv("TRACKING_FLUSH_INTERVAL", "1.0"))
+TRACKING_BATCH_SIZE = int(os.getenv("TRACKING_BATCH_SIZE", "1000"))
+
+# Планировщик обновлений: общий лимит обработчиков, очередь одного пользователя и всех ожидающих
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "64"))
+SCHEDULER_USER_QUEUE = int(os.getenv("SCHEDULER_USER_QUEUE", "5"))
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", "1000"))
+
+# Ограничение частоты дорогих команд: запас в единицах стоимости и пополнение в минуту
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "10"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "20"))
+# Telegram ID без ограничений через запятую (администраторы не ограничиваются всегда)
+THROTTLE_ALLOWLIST = {int(x) for x in os.getenv("THROTTLE_ALLOWLIST", "").replace(" ", "").split(",") if x}
+
+# Метрики в формате Prometheus (0 — не запускать сервер метрик)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Профилирование медленных обновлений (выключено по умолчанию)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0.01"))
+PROFILER_SLOW_THRESHOLD = float(os.getenv("PROFILER_SLOW_THRESHOLD", "1.0"))
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+PROFILER_DIR = os.getenv("PROFILER_DIR", "profiles")
+PROFILER_MAX_REPORTS = int(os.getenv("PROFILER_MAX_REPORTS", "200"))
+
+# Устойчивость запросов к внешним API
+EXTERNAL_RETRIES = int(os.getenv("EXTERNAL_RETRIES", "2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+HIBP_TIMEOUT = float(os.getenv("HIBP_TIMEOUT", "3"))
+# Через сколько секунд дублировать медленный запрос к HIBP (0 — не дублировать)
+HIBP_HEDGE_DELAY = float(os.getenv("HIBP_HEDGE_DELAY", "0.3"))
+HIBP_CACHE_SIZE = int(os.getenv("HIBP_CACHE_SIZE", "512"))
+HIBP_CACHE_TTL = float(os.getenv("HIBP_CACHE_TTL", "86400"))
+# Массовая проверка паролей: одновременных запросов к HIBP и лимит строк в файле
+AUDIT_CONCURRENCY = int(os.getenv("AUDIT_CONCURRENCY", "16"))
+AUDIT_MAX_LINES = int(os.getenv("AUDIT_MAX_LINES", "100000"))
+VIRUSTOTAL_TIMEOUT = float(os.getenv("VIRUSTOTAL_TIMEOUT", "60"))
+VIRUSTOTAL_CACHE_SIZE = int(os.getenv("VIRUSTOTAL_CACHE_SIZE", "1024"))
+VIRUSTOTAL_CACHE_TTL = float(os.getenv("VIRUSTOTAL_CACHE_TTL", "21600"))
+# Сколько обработчик готов ждать ответа внешнего сервиса целиком, с учётом повторов
+PASSWORD_CHECK_DEADLINE = float(os.getenv("PASSWORD_CHECK_DEADLINE", "5"))
+SCAN_DEADLINE = float(os.getenv("SCAN_DEADLINE", "290"))
+
+# Общий опрос результатов анализа VirusTotal
+ANALYSIS_POLL_MIN_INTERVAL = float(os.getenv("ANALYSIS_POLL_MIN_INTERVAL", "3"))
+ANALYSIS_POLL_MAX_INTERVAL = float(os.getenv("ANALYSIS_POLL_MAX_INTERVAL", "30"))
+ANALYSIS_POLL_CONCURRENCY = int(os.getenv("ANALYSIS_POLL_CONCURRENCY", "4"))
+ANALYSIS_MAX_WAIT = float(os.getenv("ANALYSIS_MAX_WAIT", "300"))
+
+# Локальная проверка файлов до отправки в VirusTotal
+PRESCAN_SIGNATURES_FILE = os.getenv("PRESCAN_SIGNATURES_FILE", "signatures.json")
+PRESCAN_WORKERS = int(os.getenv("PRESCAN_WORKERS", "2"))
+
+# Словари для локальной оценки стойкости паролей: *.txt собираются в *.bin при запуске
+PASSWORD_DICTIONARY_DIR = os.getenv("PASSWORD_DICTIONARY_DIR", "dictionaries")
+
+# Проверка содержимого архивов и защита от zip-бомб
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", "4"))
+ARCHIVE_MAX_MEMBERS = int(os.getenv("ARCHIVE_MAX_MEMBERS", "1000"))
+ARCHIVE_MAX_RATIO = float(os.getenv("ARCHIVE_MAX_RATIO", "100"))
+ARCHIVE_MAX_TOTAL_SIZE = int(os.getenv("ARCHIVE_MAX_TOTAL_SIZE", str(512 * 1024 * 1024)))
+ARCHIVE_MAX_DEPTH = int(os.getenv("ARCHIVE_MAX_DEPTH", "3"))
+# Сколько уникальных файлов архива проверять по хешу в VirusTotal
+ARCHIVE_MAX_LOOKUPS = int(os.getenv("ARCHIVE_MAX_LOOKUPS", "20"))
+ARCHIVE_LOOKUP_CONCURRENCY = int(os.getenv("ARCHIVE_LOOKUP_CONCURRENCY", "4"))
+
+# История проверок файлов: отчётов на странице /history
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+# Уже проверенные файлы по file_unique_id: повторная отправка не скачивается (размер и время жизни записи)
+KNOWN_FILES_SIZE = int(os.getenv("KNOWN_FILES_SIZE", "4096"))
+KNOWN_FILES_TTL = float(os.getenv("KNOWN_FILES_TTL", "21600"))
+
+# Логирование: JSON-строки пишет фоновый поток из очереди
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Лимиты для шумных источников: источник=записей в секунду / источник=доля сохраняемых записей
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "aiogram.event=20,services.analysis_poller=10")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "aiogram.event=0.1")
+# Скрывать имена файлов, ответы внешних API и токены
+LOG_REDACT = os.getenv("LOG_REDACT", "true").lower() in ("1", "true", "yes")
+
+# Хранение данных: записи старше RETENTION_DAYS сворачиваются в дневные итоги (0 — хранить всё)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "86400"))
+# Строк в одной транзакции удаления и пауза между ними, чтобы не задерживать запись
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.05"))
+
+# Скетчи распределения результатов для /progress: точность, частота сохранения и имя процесса
+SKETCH_K = int(os.getenv("SKETCH_K", "200"))
+SKETCH_PERSIST_INTERVAL = float(os.getenv("SKETCH_PERSIST_INTERVAL", "60"))
+SKETCH_MIN_COUNT = int(os.getenv("SKETCH_MIN_COUNT", "20"))
+# По умолчанию — хост и PID: процессы на одном хосте не пишут в одну строку. Чтобы после
+# перезапуска процесс продолжил свой скетч, задайте каждому процессу постоянный WORKER_ID
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# Строки процессов, не обновлявшиеся столько секунд, сливаются в одну архивную строку на скетч
+SKETCH_ARCHIVE_AFTER = float(os.getenv("SKETCH_ARCHIVE_AFTER", "86400"))
+
+# Inline-режим: пауза перед запросом к внешнему API (новый ввод отменяет старый) и кэш ответов в Telegram
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.4"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "600"))
+
+# Хранилище FSM: брошенное состояние живёт столько секунд без изменений (состояние или группа=секунд),
+# остальные — FSM_DEFAULT_TTL; больше FSM_MAX_ENTRIES пользователей — вытеснение по LRU
+FSM_STATE_TTLS = os.getenv(
+    "FSM_STATE_TTLS",
+    "PasswordStates:waiting_for_password=300,UrlStates=600,UploadStates:waiting_for_file=1800,"
+    "TestStates=7200,PhishingStates=7200"
+)
+FSM_DEFAULT_TTL = float(os.getenv("FSM_DEFAULT_TTL", "86400"))
+FSM_MAX_ENTRIES = int(os.getenv("FSM_MAX_ENTRIES", "100000"))
+
+# Наблюдение за event loop: период проверки и задержка, с которой снимается стек (0 — выключено)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
@@ -1,4 +1,10 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -6,17 +12,96 @@ from config import DATABASE_URL
 
 Base = declarative_base()
 
+DATABASE_PATH = DATABASE_URL.split(':///')[-1]
+
 # Исправленная строка подключения с использованием sqlite+aiosqlite
-engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_URL.split(':///')[-1]}", echo=False)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_PATH}", echo=False)
+_session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+# Организация (бот), к которой относится текущее обновление; None — основная база
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
+
+# База организации подключается через ATTACH под этим именем, таблицы переименовывает schema_translate_map
+TENANT_SCHEMA = "tenant"
+
+_tenant_engines: Dict[str, AsyncEngine] = {}
+_tenant_factories: Dict[str, sessionmaker] = {}
+
+
+def tenant_database_path(tenant: str) -> str:
+    """Файл базы организации лежит рядом с основным: bot.db -> bot.acme.db"""
+    root, ext = os.path.splitext(DATABASE_PATH)
+    return f"{root}.{tenant}{ext or '.db'}"
+
+
+def register_tenant(tenant: str):
+    """
+    Регистрирует организацию: все они делят один пул соединений engine
+
+    Движок организации — тот же engine с параметрами выполнения, поэтому
+    новые организации не добавляют ни пулов, ни соединений.
+    """
+    if tenant in _tenant_engines:
+        return
+    _tenant_engines[tenant] = engine.execution_options(
+        tenant=tenant, schema_translate_map={None: TENANT_SCHEMA}
+    )
+    _tenant_factories[tenant] = sessionmaker(_tenant_engines[tenant], expire_on_commit=False, class_=AsyncSession)
+
+
+def tenants() -> List[str]:
+    return list(_tenant_engines)
+
+
+@contextmanager
+def use_tenant(tenant: Optional[str]):
+    token = current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+def current_engine() -> AsyncEngine:
+    tenant = current_tenant.get()
+    return engine if tenant is None else _tenant_engines[tenant]
+
+
+def async_session() -> AsyncSession:
+    """Сессия к базе текущей организации"""
+    tenant = current_tenant.get()
+    factory = _session_factory if tenant is None else _tenant_factories[tenant]
+    return factory()
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _attach_tenant(conn, cursor, statement, parameters, context, executemany):
+    # Соединение из общего пула подключает базу нужной организации перед запросом.
+    # Подключена всегда одна база, поэтому лимит SQLite на ATTACH не мешает
+    tenant = conn.get_execution_options().get("tenant")
+    if tenant is None:
+        return
+
+    info = conn.connection.info
+    attached = info.get("tenant")
+    if attached == tenant:
+        return
+
+    if attached is not None:
+        cursor.execute(f"DETACH DATABASE {TENANT_SCHEMA}")
+        info["tenant"] = None
+    cursor.execute(f"ATTACH DATABASE ? AS {TENANT_SCHEMA}", (tenant_database_path(tenant),))
+    info["tenant"] = tenant
+
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    for target in (engine, *_tenant_engines.values()):
+        async with target.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         try:
             yield session
         finally:
-            await session.close() 
\ No newline at end of file
+            await session.close()
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+from config import EXPORT_CHUNK_SIZE
+from database import engine, register_tenant, use_tenant
+from services.export import export_table, EXPORT_TABLES, EXPORT_FORMATS
+
+
+async def run(args: argparse.Namespace):
+    if args.tenant:
+        register_tenant(args.tenant)
+    try:
+        with use_tenant(args.tenant):
+            result = await export_table(
+                args.table,
+                fmt=args.format,
+                compress=args.gzip,
+                output_path=args.output,
+                chunk_size=args.chunk_size
+            )
+    finally:
+        await engine.dispose()
+
+    print(f"{result['path']}: {result['rows']} строк, {result['size']} байт, {result['seconds']:.1f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка аналитики из базы бота")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("-z", "--gzip", action="store_true", help="сжать файл gzip")
+    parser.add_argument("-o", "--output", help="путь к файлу (по умолчанию — EXPORT_DIR)")
+    parser.add_argument("-t", "--tenant", help="организация из BOT_TOKENS (по умолчанию — основная база)")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="строк в одной пачке")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
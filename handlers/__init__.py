@@ -1 +1 @@
-from . import start, test, upload, phishing, progress, password 
\ No newline at end of file
+from . import start, test, upload, phishing, progress, password, admin, history, inline, url_check 
\ No newline at end of file
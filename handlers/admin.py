@@ -0,0 +1,211 @@
+import os
+import html
+import asyncio
+import logging
+from aiogram import Router, F
+from aiogram.types import Message, FSInputFile
+from aiogram.filters import Command, CommandObject
+
+from config import RETENTION_DAYS
+from utils.helpers import is_admin
+from services.export import export_table, EXPORT_TABLES, EXPORT_FORMATS
+from services.phishing_scenarios import get_scenarios
+from services.phishing_variants import get_templates
+from services.profiler import load_reports, summarize_reports
+from services.retention import run_maintenance, format_maintenance
+from services.campaigns import (
+    COHORTS, is_valid_scenario, create_campaign, schedule_campaign, stop_campaign,
+    list_campaigns, get_report, format_report
+)
+
+router = Router()
+
+# Лимит Telegram на отправку файлов ботом
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+
+@router.message(Command("export"), flags={"long_running": True})
+async def cmd_export(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+
+    args = (command.args or "").split()
+    table_name = args[0] if args else None
+    fmt = next((arg for arg in args[1:] if arg in EXPORT_FORMATS), "csv")
+    compress = "gz" in args[1:] or "gzip" in args[1:]
+
+    if table_name not in EXPORT_TABLES:
+        await message.answer(
+            f"<b>Выгрузка аналитики</b>\n\n"
+            f"Использование: <code>/export &lt;таблица&gt; [csv|jsonl] [gz]</code>\n\n"
+            f"Таблицы: {', '.join(sorted(EXPORT_TABLES))}"
+        )
+        return
+
+    status_message = await message.answer(f"<b>Выгружаю {table_name}...</b>")
+
+    try:
+        result = await export_table(table_name, fmt=fmt, compress=compress)
+    except Exception as e:
+        logging.exception(f"Ошибка при выгрузке {table_name}: {str(e)}")
+        await status_message.edit_text(
+            f"<b>Ошибка при выгрузке</b>\n\n"
+            f"{str(e)}"
+        )
+        return
+
+    summary = (
+        f"Строк: {result['rows']:,}\n"
+        f"Размер: {result['size'] // 1024} КБ\n"
+        f"Время: {result['seconds']:.1f} с"
+    )
+
+    if result["size"] > MAX_UPLOAD_SIZE:
+        await status_message.edit_text(
+            f"<b>Выгрузка {table_name} готова</b>\n\n"
+            f"{summary}\n\n"
+            f"Файл слишком большой для отправки в Telegram и сохранён на сервере:\n"
+            f"<code>{result['path']}</code>"
+        )
+        return
+
+    try:
+        await message.answer_document(
+            FSInputFile(result["path"]),
+            caption=f"<b>{table_name}</b>\n\n{summary}"
+        )
+        await status_message.delete()
+    finally:
+        os.remove(result["path"])
+
+
+@router.message(Command("campaign"))
+async def cmd_campaign(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+
+    args = (command.args or "").split()
+    scenario_id = args[0] if args else None
+    cohort = next((arg for arg in args[1:] if arg in COHORTS), "all")
+    delay_minutes = next((int(arg) for arg in args[1:] if arg.isdigit()), 0)
+
+    if not scenario_id or not is_valid_scenario(scenario_id):
+        scenarios_text = "\n".join(f"• <code>{s['id']}</code> — {s['name']}" for s in get_scenarios())
+        templates_text = "\n".join(
+            f"• <code>random:{t['id']}</code> — {t['name']} ({t['variants']} вариантов)" for t in get_templates()
+        )
+        await message.answer(
+            f"<b>Фишинговая кампания</b>\n\n"
+            f"Использование: <code>/campaign &lt;сценарий&gt; [{'|'.join(COHORTS)}] [через_минут]</code>\n\n"
+            f"<b>Сценарии:</b>\n{scenarios_text}\n\n"
+            f"<b>Свой вариант каждому получателю:</b>\n"
+            f"• <code>random</code> — любой шаблон\n{templates_text}"
+        )
+        return
+
+    campaign = await create_campaign(scenario_id, cohort, delay_minutes, created_by=message.from_user.id)
+    schedule_campaign(message.bot, campaign)
+
+    when = f"через {delay_minutes} мин." if delay_minutes else "сейчас"
+    await message.answer(
+        f"<b>Кампания #{campaign.id} запланирована</b>\n\n"
+        f"Сценарий: {scenario_id}\n"
+        f"Получатели: {cohort}\n"
+        f"Старт: {when}\n\n"
+        f"Отчёт придёт по завершении. Остановить: <code>/campaign_stop {campaign.id}</code>"
+    )
+
+
+@router.message(Command("campaigns"))
+async def cmd_campaigns(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+
+    campaigns = await list_campaigns()
+
+    if not campaigns:
+        await message.answer("Кампаний пока не было")
+        return
+
+    await message.answer("\n\n".join(format_report(get_report(campaign)) for campaign in campaigns))
+
+
+@router.message(Command("campaign_stop"))
+async def cmd_campaign_stop(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Использование: <code>/campaign_stop &lt;id&gt;</code>")
+        return
+
+    campaign_id = int(command.args.strip())
+
+    if await stop_campaign(campaign_id):
+        await message.answer(f"Кампания #{campaign_id} остановлена")
+    else:
+        await message.answer(f"Кампания #{campaign_id} не найдена или уже завершена")
+
+
+@router.message(Command("profile_top"))
+async def cmd_profile_top(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+
+    limit = int(command.args) if command.args and command.args.strip().isdigit() else 50
+    reports = await asyncio.to_thread(load_reports, limit)
+
+    if not reports:
+        await message.answer(
+            f"<b>Отчётов профилировщика пока нет</b>\n\n"
+            f"Включите профилирование переменной окружения PROFILER_ENABLED=true"
+        )
+        return
+
+    summary = summarize_reports(reports)
+    breakdown = summary["breakdown"]
+    total_ms = breakdown.get("duration_ms", 0) or 1
+
+    def share(key: str) -> str:
+        return f"{breakdown.get(key, 0) / total_ms * 100:.0f}%"
+
+    handlers_text = "\n".join(
+        f"• {name}: {count} шт., в среднем {avg:.0f} мс" for name, count, avg in summary["handlers"]
+    )
+    self_text = "\n".join(
+        f"{samples:>5}  <code>{html.escape(name)}</code>" for name, samples in summary["self"]
+    )
+    total_text = "\n".join(
+        f"{samples:>5}  <code>{html.escape(name)}</code>" for name, samples in summary["total"]
+    )
+
+    await message.answer(
+        f"<b>Профиль медленных обновлений</b> (отчётов: {summary['reports']})\n\n"
+        f"<b>Куда ушло время:</b>\n"
+        f"Код в event loop: {share('on_loop_ms')}, БД: {share('db_ms')}, "
+        f"внешние API: {share('external_ms')}, FSM: {share('fsm_ms')}\n\n"
+        f"<b>Обработчики:</b>\n{handlers_text}\n\n"
+        f"<b>Горячие строки (собственное время, семплы):</b>\n{self_text}\n\n"
+        f"<b>Функции (с вложенными вызовами):</b>\n{total_text}"
+    )
+
+
+@router.message(Command("maintenance"), flags={"long_running": True})
+async def cmd_maintenance(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+
+    days = int(command.args) if command.args and command.args.strip().isdigit() else RETENTION_DAYS
+    status_message = await message.answer(f"<b>Сворачиваю записи старше {days} дн. и сжимаю базу...</b>")
+
+    try:
+        report = await run_maintenance(days)
+    except Exception as e:
+        logging.exception(f"Ошибка обслуживания базы: {str(e)}")
+        await status_message.edit_text(
+            f"<b>Ошибка обслуживания базы</b>\n\n"
+            f"{str(e)}"
+        )
+        return
+
+    await status_message.edit_text(format_maintenance(report))
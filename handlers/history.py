@@ -0,0 +1,121 @@
+import html
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.scan_history import get_history_page, get_report
+
+router = Router()
+
+# Лимит Telegram — 4096 символов, оставляем запас на заголовок
+REPORT_TEXT_LIMIT = 3800
+
+THREAT_EMOJI = {"Вредоносно": "🔴", "Подозрительно": "🟠", "Безопасно": "🟢"}
+CATEGORY_NAMES = {
+    "malicious": "вредоносно",
+    "suspicious": "подозрительно",
+    "undetected": "не обнаружено",
+    "harmless": "безопасно",
+    "type-unsupported": "тип не поддерживается",
+    "timeout": "таймаут",
+    "failure": "ошибка",
+}
+
+
+async def render_page(session: AsyncSession, user_id: int, at_id: int = None, newer_than: int = None):
+    rows, has_newer, has_older = await get_history_page(session, user_id, at_id=at_id, newer_than=newer_than)
+    
+    if not rows:
+        return "<b>История проверок пуста</b>\n\nПроверьте файл с помощью /upload", None
+    
+    top_id = rows[0].id
+    builder = InlineKeyboardBuilder()
+    for row in rows:
+        emoji = THREAT_EMOJI.get(row.threat_level, "⚪")
+        builder.button(
+            text=f"{emoji} {row.file_name[:40]} · {row.created_at:%d.%m %H:%M}",
+            callback_data=f"history:show:{row.id}:{top_id}"
+        )
+    builder.adjust(1)
+    
+    navigation = []
+    if has_newer:
+        navigation.append(("← Новее", f"history:newer:{top_id}"))
+    if has_older:
+        navigation.append(("Старее →", f"history:at:{rows[-1].id - 1}"))
+    for text, data in navigation:
+        builder.button(text=text, callback_data=data)
+    if navigation:
+        builder.adjust(*([1] * len(rows)), len(navigation))
+    
+    return "<b>История проверок</b>\n\nВыберите файл, чтобы открыть полный отчёт:", builder.as_markup()
+
+
+def format_full_report(record, report: dict) -> str:
+    scan = report.get("scan")
+    local = report.get("local")
+    lines = [
+        f"<b>Отчёт по файлу: {html.escape(record.file_name)}</b>\n\n",
+        f"{THREAT_EMOJI.get(record.threat_level, '⚪')} <b>Статус:</b> {html.escape(record.threat_level)}\n",
+    ]
+    if record.detection_ratio:
+        lines.append(f"Обнаружен: {record.detection_ratio} антивирусами\n")
+    lines.append(f"Проверен: {record.created_at:%d.%m.%Y %H:%M}\n")
+    lines.append(f"SHA-256: <code>{record.sha256}</code>\n")
+    
+    if local:
+        lines.append(f"\n<b>Локальная проверка:</b> {html.escape(local['file_type'])}, энтропия {local['entropy']:.2f}\n")
+        lines.extend(f"• {html.escape(reason)}\n" for reason in local["reasons"])
+    
+    engines = scan.get("engines", []) if scan else []
+    if engines:
+        lines.append("\n<b>Результаты антивирусов:</b>\n")
+        for index, engine in enumerate(engines):
+            line = (
+                f"• {html.escape(engine['name'])}: "
+                f"{html.escape(engine['result'] or CATEGORY_NAMES.get(engine['category'], engine['category']))}\n"
+            )
+            if sum(map(len, lines)) + len(line) > REPORT_TEXT_LIMIT:
+                lines.append(f"• ...и ещё {len(engines) - index}\n")
+                break
+            lines.append(line)
+    
+    return "".join(lines)
+
+
+@router.message(Command("history"))
+async def cmd_history(message: Message, state: FSMContext, session: AsyncSession):
+    await state.clear()
+    text, markup = await render_page(session, message.from_user.id)
+    await message.answer(text, reply_markup=markup)
+
+
+@router.callback_query(F.data.startswith("history:at:") | F.data.startswith("history:newer:"))
+async def history_page(callback: CallbackQuery, session: AsyncSession):
+    _, direction, anchor = callback.data.split(":")
+    if direction == "at":
+        text, markup = await render_page(session, callback.from_user.id, at_id=int(anchor))
+    else:
+        text, markup = await render_page(session, callback.from_user.id, newer_than=int(anchor))
+    
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("history:show:"))
+async def history_show(callback: CallbackQuery, session: AsyncSession):
+    _, _, report_id, top_id = callback.data.split(":")
+    found = await get_report(session, callback.from_user.id, int(report_id))
+    
+    if found is None:
+        await callback.answer("Отчёт не найден")
+        return
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="← К списку", callback_data=f"history:at:{top_id}")
+    
+    await callback.message.edit_text(format_full_report(*found), reply_markup=builder.as_markup())
+    await callback.answer()
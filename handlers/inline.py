@@ -0,0 +1,144 @@
+import asyncio
+import re
+from typing import Dict, Optional
+
+import aiohttp
+from aiogram import Router, F
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+
+from config import INLINE_DEBOUNCE, INLINE_CACHE_TIME, VIRUSTOTAL_CACHE_SIZE
+from services.cache import TTLCache
+from services.pwned_passwords import RANGE_CACHE, fetch_range, find_suffix
+from services.resilience import ServiceUnavailable
+from services.virus_total import VERDICT_CACHE, lookup_hash
+
+router = Router()
+
+FULL_HASH = re.compile(r"^\s*([0-9a-fA-F]{40}|[0-9a-fA-F]{64})\s*$")
+HEX = re.compile(r"^[0-9a-fA-F]+$")
+
+# Подсказки одинаковы для всех и не меняются
+HINT_CACHE_TIME = 86400
+
+# Хеши, которых нет в VirusTotal: lookup_hash их не кэширует, а в inline их набирают повторно
+UNKNOWN_HASHES = TTLCache(VIRUSTOTAL_CACHE_SIZE, 600)
+
+# Последний запрос каждого пользователя: более старые не ходят во внешние API
+_latest: Dict[int, str] = {}
+
+
+def article(result_id: str, title: str, description: str, text: str) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=result_id,
+        title=title,
+        description=description,
+        input_message_content=InputTextMessageContent(message_text=text)
+    )
+
+
+def sha1_article(digest: str, count: Optional[int]) -> InlineQueryResultArticle:
+    if count is None:
+        return article(
+            f"sha1-error-{digest[:16]}", "Сервис проверки утечек недоступен",
+            "Попробуйте позже", "Не удалось проверить хеш: сервис проверки утечек недоступен."
+        )
+    if count:
+        title = f"🔴 Найден в утечках: {count:,} раз"
+        verdict = f"🔴 Пароль с этим хешем встречается в утечках <b>{count:,}</b> раз. Не используйте его."
+    else:
+        title = "🟢 В утечках не найден"
+        verdict = "🟢 Пароль с этим хешем в известных утечках не найден."
+    return article(
+        f"sha1-{digest[:32]}", title, f"SHA-1 {digest[:12]}…",
+        f"<b>Проверка хеша пароля</b>\n\nSHA-1: <code>{digest}</code>\n{verdict}"
+    )
+
+
+def sha256_article(digest: str, result: dict) -> InlineQueryResultArticle:
+    if result["error"]:
+        return article(f"sha256-error-{digest[:16]}", "Не удалось проверить файл", result["message"], result["message"])
+
+    data = result["data"]
+    if data is None:
+        title = "⚪ Файл неизвестен VirusTotal"
+        verdict = "⚪ VirusTotal ещё не проверял этот файл. Отправьте его боту через /upload."
+    else:
+        emoji = {"Вредоносно": "🔴", "Подозрительно": "🟠"}.get(data["threat_level"], "🟢")
+        title = f"{emoji} {data['threat_level']} ({data['detection_ratio']})"
+        verdict = f"{emoji} <b>{data['threat_level']}</b>: обнаружен {data['detection_ratio']} антивирусами."
+    return article(
+        f"sha256-{digest[:32]}", title, f"SHA-256 {digest[:12]}…",
+        f"<b>Проверка файла по хешу</b>\n\nSHA-256: <code>{digest}</code>\n{verdict}"
+    )
+
+
+def cached_article(digest: str) -> Optional[InlineQueryResultArticle]:
+    """Ответ только из кэшей, без обращения к внешним API"""
+    if len(digest) == 40:
+        hashes_data = RANGE_CACHE.get(digest[:5].upper())
+        return sha1_article(digest, find_suffix(hashes_data, digest[5:].upper())) if hashes_data is not None else None
+
+    result = VERDICT_CACHE.get(digest) or UNKNOWN_HASHES.get(digest)
+    return sha256_article(digest, result) if result is not None else None
+
+
+async def fetch_article(digest: str) -> InlineQueryResultArticle:
+    async with aiohttp.ClientSession() as session:
+        if len(digest) == 40:
+            # В HIBP уходит только префикс из пяти символов
+            try:
+                hashes_data = await fetch_range(session, digest[:5].upper())
+            except ServiceUnavailable:
+                hashes_data = None
+            return sha1_article(digest, find_suffix(hashes_data, digest[5:].upper()) if hashes_data is not None else None)
+
+        result = await lookup_hash(digest, session)
+        if not result["error"] and result["data"] is None:
+            UNKNOWN_HASHES.set(digest, result)
+        return sha256_article(digest, result)
+
+
+@router.inline_query(F.query.regexp(FULL_HASH), flags={"cost": 1, "long_running": True})
+async def inline_hash(inline_query: InlineQuery):
+    digest = inline_query.query.strip().lower()
+
+    result = cached_article(digest)
+    if result is None:
+        # Запросы приходят на каждое нажатие клавиши: во внешний API идёт только
+        # последний запрос пользователя, простоявший INLINE_DEBOUNCE секунд
+        user_id = inline_query.from_user.id
+        _latest[user_id] = inline_query.id
+        try:
+            await asyncio.sleep(INLINE_DEBOUNCE)
+            if _latest.get(user_id) != inline_query.id:
+                return
+            result = await fetch_article(digest)
+        finally:
+            if _latest.get(user_id) == inline_query.id:
+                del _latest[user_id]
+
+    # Ошибки не кэшируем, чтобы повторный ввод попробовал снова
+    cache_time = 0 if result.id.startswith(("sha1-error", "sha256-error")) else INLINE_CACHE_TIME
+    await inline_query.answer([result], cache_time=cache_time, is_personal=False)
+
+
+@router.inline_query()
+async def inline_hint(inline_query: InlineQuery):
+    # Неполный ввод никогда не уходит во внешние API
+    query = inline_query.query.strip()
+
+    if not query:
+        title = "Проверка хеша"
+        description = "Введите SHA-1 хеш пароля или SHA-256 хеш файла"
+    elif HEX.match(query) and len(query) < 64:
+        target = "SHA-1" if len(query) < 40 else "SHA-256"
+        title = f"Продолжайте ввод: {target}"
+        description = f"Введено {len(query)} из {40 if len(query) < 40 else 64} символов"
+    else:
+        title = "Это не хеш"
+        description = "Нужен SHA-1 (40 шестнадцатеричных символов) или SHA-256 (64)"
+
+    await inline_query.answer(
+        [article("hint", title, description, f"<b>{title}</b>\n\n{description}")],
+        cache_time=HINT_CACHE_TIME, is_personal=False
+    )
@@ -1,21 +1,33 @@
+import io
+import csv
+import time
+import asyncio
+import logging
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import PASSWORD_CHECK_DEADLINE, MAX_FILE_SIZE, AUDIT_MAX_LINES
 from utils.helpers import get_or_create_user
-from services.pwned_passwords import check_password
+from services.pwned_passwords import check_password, hash_audit_lines, audit_hashes
+from services.password_strength import estimate_strength, format_crack_time, ATTACK_SCENARIOS
+from services.resilience import deadline
 
 router = Router()
 
+# Как часто обновлять сообщение о ходе массовой проверки, секунд
+AUDIT_PROGRESS_INTERVAL = 2.0
+
 
 class PasswordStates(StatesGroup):
     waiting_for_password = State()
+    waiting_for_audit_file = State()
 
 
-@router.message(Command("check_password"))
+@router.message(Command("check_password"), flags={"cost": 1})
 async def cmd_check_password(message: Message, state: FSMContext):
     await state.clear()
     
@@ -37,6 +49,23 @@ async def cmd_check_password(message: Message, state: FSMContext):
     )
 
 
+def format_strength(strength: dict) -> str:
+    bars = "🟥🟧🟨🟩🟩"[strength["score"]] * (strength["score"] + 1) + "⬜" * (4 - strength["score"])
+    crack_times = "".join(
+        f"• {title}: {format_crack_time(strength['crack_times'][key])}\n"
+        for key, title, _ in ATTACK_SCENARIOS
+    )
+    warnings = "".join(f"• {warning}\n" for warning in strength["warnings"])
+    
+    return (
+        f"<b>Стойкость:</b> {bars} {strength['label']}\n"
+        f"Примерно 10^{strength['guesses_log10']:.0f} попыток подбора\n\n"
+        f"<b>Время подбора:</b>\n"
+        f"{crack_times}"
+        f"{warnings}"
+    )
+
+
 @router.message(PasswordStates.waiting_for_password)
 async def process_password(message: Message, state: FSMContext, session: AsyncSession):
     # Пытаемся удалить сообщение пользователя для безопасности
@@ -59,18 +88,23 @@ async def process_password(message: Message, state: FSMContext, session: AsyncSe
         )
         return
     
+    # Оценка стойкости считается локально, пароль никуда не отправляется
+    strength_text = format_strength(estimate_strength(password))
+    
     # Отправляем временное сообщение
     status_message = await message.answer(
         f"<b>Проверяю пароль...</b>"
     )
     
-    # Проверяем пароль через API
-    result = await check_password(password)
+    # Проверяем пароль через API, не заставляя пользователя ждать дольше срока
+    with deadline(PASSWORD_CHECK_DEADLINE):
+        result = await check_password(password)
     
     if not result["success"]:
         await status_message.edit_text(
             f"<b>Ошибка при проверке</b>\n\n"
             f"{result['message']}\n\n"
+            f"{strength_text}\n"
             f"Попробуйте позже или используйте другой пароль."
         )
         return
@@ -82,6 +116,7 @@ async def process_password(message: Message, state: FSMContext, session: AsyncSe
         await status_message.edit_text(
             f"<b>{level}</b>\n\n"
             f"Этот пароль найден в <code>{count:,}</code> утечках данных!\n\n"
+            f"{strength_text}\n"
             f"<b>Рекомендации:</b>\n"
             f"• Немедленно смените этот пароль везде, где вы его используете\n"
             f"• Не используйте одинаковые пароли на разных сайтах\n"
@@ -93,6 +128,7 @@ async def process_password(message: Message, state: FSMContext, session: AsyncSe
         await status_message.edit_text(
             f"<b>Пароль не найден в утечках</b>\n\n"
             f"Хорошая новость! Этот пароль не обнаружен в известных утечках данных.\n\n"
+            f"{strength_text}\n"
             f"<b>Помните:</b>\n"
             f"• Даже если пароль не найден, он может быть ненадёжным\n"
             f"• Используйте уникальные пароли для каждого сервиса\n"
@@ -101,6 +137,121 @@ async def process_password(message: Message, state: FSMContext, session: AsyncSe
         )
 
 
+@router.message(Command("audit_passwords"), flags={"cost": 10})
+async def cmd_audit_passwords(message: Message, state: FSMContext):
+    await state.clear()
+    await state.set_state(PasswordStates.waiting_for_audit_file)
+    
+    await message.answer(
+        f"<b>Массовая проверка паролей на утечки</b>\n\n"
+        f"Отправьте текстовый файл: один пароль или SHA-1 хеш в строке, "
+        f"не больше {AUDIT_MAX_LINES:,} строк.\n\n"
+        f"<i>Пароли хешируются на сервере, в сервис уходят только первые 5 символов хешей.</i>\n"
+        f"<i>Файл и пароли не сохраняются, а сообщение с файлом будет удалено.</i>\n\n"
+        f"Для отмены: /cancel"
+    )
+
+
+@router.message(PasswordStates.waiting_for_audit_file, F.document, flags={"long_running": True})
+async def process_audit_file(message: Message, state: FSMContext, session: AsyncSession):
+    await state.clear()
+    
+    user = await get_or_create_user(session, message.from_user.id)
+    document = message.document
+    
+    if document.file_size > MAX_FILE_SIZE:
+        await message.answer(
+            f"<b>Файл слишком большой</b>\n\n"
+            f"Лимит размера: {MAX_FILE_SIZE // (1024 * 1024)} МБ\n"
+            f"Попробуйте снова: /audit_passwords"
+        )
+        return
+    
+    status_message = await message.answer(f"<b>Читаю файл...</b>")
+    
+    file = await message.bot.get_file(document.file_id)
+    content = (await message.bot.download_file(file.file_path)).read()
+    
+    # Файл с паролями не должен оставаться в чате
+    try:
+        await message.delete()
+    except Exception:
+        pass
+    
+    hashes, line_numbers, stats = await asyncio.to_thread(hash_audit_lines, content)
+    del content
+    
+    if not hashes or stats["lines"] > AUDIT_MAX_LINES:
+        await status_message.edit_text(
+            f"<b>Ошибка</b>\n\n"
+            f"В файле должно быть от 1 до {AUDIT_MAX_LINES:,} непустых строк, а в нём {stats['lines']:,}.\n"
+            f"Попробуйте снова: /audit_passwords"
+        )
+        return
+    
+    last_update = time.monotonic()
+    
+    async def show_progress(done: int, total: int):
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update < AUDIT_PROGRESS_INTERVAL or done == total:
+            return
+        last_update = now
+        # Сообщение могли удалить или упереться в лимит Telegram — проверка продолжается
+        try:
+            await status_message.edit_text(
+                f"<b>Проверяю пароли... {done * 100 // total}%</b>\n\n"
+                f"Строк: {stats['lines']:,}\n"
+                f"Проверено групп хешей: {done:,} из {total:,}"
+            )
+        except Exception:
+            pass
+    
+    try:
+        result = await audit_hashes(hashes, show_progress)
+    except Exception as e:
+        logging.exception(f"Ошибка массовой проверки паролей: {str(e)}")
+        await status_message.edit_text(
+            f"<b>Ошибка при проверке</b>\n\n"
+            f"Попробуйте позже: /audit_passwords"
+        )
+        return
+    
+    counts = result["counts"]
+    leaked = sum(1 for count in counts if count > 0)
+    critical = sum(1 for count in counts if count > 1000)
+    failed = sum(1 for count in counts if count < 0)
+    
+    summary = (
+        f"<b>Массовая проверка завершена</b>\n\n"
+        f"Строк: {stats['lines']:,} (паролей: {stats['passwords']:,}, хешей: {stats['hashes']:,})\n"
+        f"Уникальных: {result['unique']:,}\n"
+        f"Найдено в утечках: <b>{leaked:,}</b> ({leaked * 100 / len(counts):.1f}%)\n"
+        f"Из них в более чем 1000 утечек: {critical:,}\n"
+    )
+    if failed:
+        summary += f"Не удалось проверить: {failed:,} — сервис был недоступен\n"
+    summary += f"\nЗапросов к сервису: {result['prefixes']:,}, время: {result['seconds']:.1f} с"
+    
+    if not leaked:
+        await status_message.edit_text(summary)
+        return
+    
+    # В отчёт попадают только номера строк и число утечек, без паролей и хешей
+    report = io.StringIO()
+    writer = csv.writer(report)
+    writer.writerow(["line", "breaches"])
+    for number, count in zip(line_numbers, counts):
+        if count > 0:
+            writer.writerow([number, count])
+    
+    await message.answer_document(
+        BufferedInputFile(report.getvalue().encode("utf-8"), filename="password_audit.csv"),
+        caption=summary
+    )
+    await status_message.delete()
+
+
 @router.message(Command("cancel"))
 async def cmd_cancel(message: Message, state: FSMContext):
     current_state = await state.get_state()
@@ -112,4 +263,13 @@ async def cmd_cancel(message: Message, state: FSMContext):
     await message.answer(
         f"<b>Операция отменена</b>\n\n"
         f"Вы можете начать заново, используя соответствующую команду."
-    ) 
\ No newline at end of file
+    )
+
+
+@router.message(PasswordStates.waiting_for_audit_file)
+async def wrong_audit_file(message: Message):
+    await message.answer(
+        f"<b>Нужен файл</b>\n\n"
+        f"Отправьте текстовый файл с паролями или SHA-1 хешами.\n"
+        f"Для отмены используйте /cancel"
+    )
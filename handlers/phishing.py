@@ -1,5 +1,5 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, URLInputFile
+from aiogram.types import Message, CallbackQuery, URLInputFile, LinkPreviewOptions
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -9,6 +9,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from models.models import PhishingLog
 from utils.helpers import get_or_create_user, generate_phishing_link
 from services.phishing_scenarios import get_scenarios, get_scenario
+from services.phishing_variants import random_variant_id
+from services.campaigns import record_answer
+from services.percentiles import record_phishing_answers
 
 router = Router()
 
@@ -36,6 +39,7 @@ async def cmd_phishing(message: Message, state: FSMContext, session: AsyncSessio
     for scenario in scenarios:
         builder.button(text=scenario["name"], callback_data=f"scenario:{scenario['id']}")
     
+    builder.button(text="Случайный сценарий", callback_data="scenario:random")
     builder.adjust(1)
     
     await state.set_state(PhishingStates.selecting_scenario)
@@ -48,13 +52,15 @@ async def cmd_phishing(message: Message, state: FSMContext, session: AsyncSessio
 @router.callback_query(PhishingStates.selecting_scenario, F.data.startswith("scenario:"))
 async def select_scenario(callback: CallbackQuery, state: FSMContext):
     scenario_id = callback.data.split(":", 1)[1]
+    if scenario_id == "random":
+        scenario_id = random_variant_id()
     scenario = get_scenario(scenario_id)
     
     if not scenario:
         await callback.answer("Сценарий не найден", show_alert=True)
         return
     
-    phishing_link = generate_phishing_link()
+    phishing_link = generate_phishing_link(callback.from_user.id, scenario_id)
     
     await state.update_data(
         scenario_id=scenario_id,
@@ -68,19 +74,33 @@ async def select_scenario(callback: CallbackQuery, state: FSMContext):
     builder.button(text="Это фишинг?", callback_data="report_phishing")
     
     await state.set_state(PhishingStates.simulating)
-    await callback.message.answer(message_text, reply_markup=builder.as_markup())
+    await callback.message.answer(
+        message_text,
+        reply_markup=builder.as_markup(),
+        link_preview_options=LinkPreviewOptions(is_disabled=True)
+    )
     await callback.answer()
 
 
 @router.callback_query(PhishingStates.simulating, F.data == "click_phishing")
 async def click_phishing(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
-    phishing_log = PhishingLog(user_id=callback.from_user.id, clicked=True)
+    data = await state.get_data()
+    phishing_log = PhishingLog(
+        user_id=callback.from_user.id,
+        clicked=True,
+        scenario_id=data.get("scenario_id"),
+        status="clicked"
+    )
     session.add(phishing_log)
     await session.commit()
+    await record_phishing_answers(session, [callback.from_user.id])
     
     await callback.answer("Вы перешли по фишинговой ссылке!", show_alert=True)
-    
-    await callback.message.answer(
+    await send_click_warning(callback.message)
+
+
+async def send_click_warning(message: Message):
+    await message.answer(
         f"<b>Внимание! Вы перешли по фишинговой ссылке!</b>\n\n"
         f"В реальной ситуации это могло привести к:\n"
         f"• Краже личных данных\n"
@@ -96,9 +116,15 @@ async def report_phishing(callback: CallbackQuery, state: FSMContext, session: A
     scenario_id = data["scenario_id"]
     scenario = get_scenario(scenario_id)
     
-    phishing_log = PhishingLog(user_id=callback.from_user.id, clicked=False)
+    phishing_log = PhishingLog(
+        user_id=callback.from_user.id,
+        clicked=False,
+        scenario_id=scenario_id,
+        status="reported"
+    )
     session.add(phishing_log)
     await session.commit()
+    await record_phishing_answers(session, [callback.from_user.id])
     
     await callback.answer("Верно! Вы распознали фишинг.", show_alert=True)
     
@@ -119,21 +145,56 @@ async def report_phishing(callback: CallbackQuery, state: FSMContext, session: A
 async def show_education(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     scenario_id = data["scenario_id"]
-    scenario = get_scenario(scenario_id)
     
+    await send_education(callback.message, get_scenario(scenario_id))
+    await callback.answer()
+
+
+async def send_education(message: Message, scenario: dict):
     signs_text = "\n".join([f"• {sign}" for sign in scenario["signs"]])
     
     builder = InlineKeyboardBuilder()
     builder.button(text="Попробовать другой сценарий", callback_data="restart_phishing")
     
-    await callback.message.answer(
+    await message.answer(
         f"<b>Признаки фишинга — {scenario['name']}</b>:\n\n"
         f"{signs_text}\n\n"
         f"<i>Запомните эти признаки для защиты в реальных ситуациях</i>",
         reply_markup=builder.as_markup()
     )
+
+
+@router.callback_query(F.data.startswith("campaign_click:"))
+async def campaign_click(callback: CallbackQuery, session: AsyncSession):
+    campaign_id = int(callback.data.split(":", 1)[1])
+    scenario_id = await record_answer(session, campaign_id, callback.from_user.id, clicked=True)
     
-    await callback.answer()
+    if scenario_id is None:
+        await callback.answer("Вы уже ответили на это сообщение")
+        return
+    
+    await callback.answer("Вы перешли по фишинговой ссылке!", show_alert=True)
+    await send_click_warning(callback.message)
+    
+    scenario = get_scenario(scenario_id)
+    if scenario:
+        await send_education(callback.message, scenario)
+
+
+@router.callback_query(F.data.startswith("campaign_report:"))
+async def campaign_report(callback: CallbackQuery, session: AsyncSession):
+    campaign_id = int(callback.data.split(":", 1)[1])
+    scenario_id = await record_answer(session, campaign_id, callback.from_user.id, clicked=False)
+    
+    if scenario_id is None:
+        await callback.answer("Вы уже ответили на это сообщение")
+        return
+    
+    await callback.answer("Верно! Вы распознали фишинг.", show_alert=True)
+    
+    scenario = get_scenario(scenario_id)
+    if scenario:
+        await send_education(callback.message, scenario)
 
 
 @router.callback_query(F.data == "restart_phishing")
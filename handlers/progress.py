@@ -3,15 +3,23 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func
 from sqlalchemy.future import select
 
-from models.models import User, TestResult, PhishingLog
+from models.models import PhishingLog, PhishingDailyStat
 from utils.helpers import get_or_create_user, get_user_progress
 from services.test_engine import get_themes, get_recommendations
+from services.campaigns import answered_filter
+from services.percentiles import PHISHING_SKETCH, percentile_rank, test_sketch_name
 
 router = Router()
 
 
+def format_standing(sketch_name: str, value: float) -> str:
+    percent = percentile_rank(sketch_name, value)
+    return f" — лучше, чем у {percent}% пользователей" if percent is not None else ""
+
+
 @router.message(Command("progress"))
 async def cmd_progress(message: Message, state: FSMContext, session: AsyncSession):
     await state.clear()
@@ -21,27 +29,34 @@ async def cmd_progress(message: Message, state: FSMContext, session: AsyncSessio
     progress = await get_user_progress(session, message.from_user.id)
     
     # Получаем статистику по фишингу
-    phishing_query = select(PhishingLog).where(PhishingLog.user_id == message.from_user.id)
+    phishing_query = select(PhishingLog).where(
+        PhishingLog.user_id == message.from_user.id,
+        answered_filter()
+    )
     phishing_result = await session.execute(phishing_query)
     phishing_logs = phishing_result.scalars().all()
     
     total_phishing = len(phishing_logs)
     clicked_phishing = sum(1 for log in phishing_logs if log.clicked)
     
+    # Старые ответы свёрнуты обслуживанием базы в дневные итоги
+    rolled_up = (await session.execute(
+        select(func.sum(PhishingDailyStat.answered), func.sum(PhishingDailyStat.clicked))
+        .where(PhishingDailyStat.user_id == message.from_user.id)
+    )).one()
+    total_phishing += rolled_up[0] or 0
+    clicked_phishing += rolled_up[1] or 0
+    
     # Формируем текст сообщения
     themes = get_themes()
     theme_names = {theme["id"]: theme["name"] for theme in themes}
     
-    # Получаем результаты тестов напрямую из БД
-    test_results_query = select(TestResult).where(TestResult.user_id == message.from_user.id)
-    test_results = await session.execute(test_results_query)
-    test_results_list = test_results.scalars().all()
-    
+    # Лучший результат по каждой теме, включая свёрнутые старые попытки
     completed_themes_text = ""
-    if test_results_list:
-        for result in test_results_list:
-            theme_name = theme_names.get(result.theme, result.theme)
-            completed_themes_text += f"• {theme_name}: {result.score:.1f}%\n"
+    if progress["scores"]:
+        for theme, score in progress["scores"].items():
+            theme_name = theme_names.get(theme, theme)
+            completed_themes_text += f"• {theme_name}: {score:.1f}%{format_standing(test_sketch_name(theme), score)}\n"
     else:
         completed_themes_text = "Вы еще не прошли ни одного теста\n"
     
@@ -51,7 +66,8 @@ async def cmd_progress(message: Message, state: FSMContext, session: AsyncSessio
         success_rate = 100 - (clicked_phishing / total_phishing * 100)
         phishing_text = (
             f"Симуляции: {total_phishing}\n"
-            f"Распознано: {total_phishing - clicked_phishing} ({success_rate:.1f}%)\n"
+            f"Распознано: {total_phishing - clicked_phishing} ({success_rate:.1f}%)"
+            f"{format_standing(PHISHING_SKETCH, success_rate)}\n"
         )
     else:
         phishing_text = "Вы еще не проходили симуляции фишинга\n"
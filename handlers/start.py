@@ -26,7 +26,10 @@ async def cmd_start(message: Message, session: AsyncSession, state: FSMContext):
         f"<b>Команды:</b>\n"
         f"/test — пройти тест\n"
         f"/upload — проверить файл\n"
+        f"/history — история проверок файлов\n"
         f"/check_password — проверить пароль\n"
+        f"/audit_passwords — проверить файл с паролями\n"
+        f"/check_url — проверить ссылку\n"
         f"/phishing — симуляция фишинга\n"
         f"/progress — ваш прогресс\n"
         f"/help — справка"
@@ -43,7 +46,10 @@ async def cmd_help(message: Message):
         f"  • Фишинг\n"
         f"  • Сетевая безопасность\n\n"
         f"<b>/upload</b> — проверка файла через VirusTotal\n\n"
+        f"<b>/history</b> — история проверок с полными отчётами\n\n"
         f"<b>/check_password</b> — безопасная проверка пароля на утечки\n\n"
+        f"<b>/audit_passwords</b> — проверка файла с паролями или SHA-1 хешами\n\n"
+        f"<b>/check_url</b> — проверка ссылки на фишинг\n\n"
         f"<b>/phishing</b> — учимся распознавать фишинг\n\n"
         f"<b>/progress</b> — ваша статистика и рекомендации\n\n"
         f"<i>Практические тренировки — лучший способ научиться защищаться</i>"
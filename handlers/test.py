@@ -7,6 +7,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from utils.helpers import get_or_create_user, get_or_create_session, update_session, save_test_result
+from services.percentiles import record_value, test_sketch_name
 from services.test_engine import (
     get_themes, get_theme_questions, get_question, check_answer, 
     get_explanation, calculate_score, get_recommendations
@@ -155,6 +156,7 @@ async def finish_test(message: Message, state: FSMContext, session: AsyncSession
     
     user_id = message.chat.id
     await save_test_result(session, user_id, theme_id, score)
+    record_value(test_sketch_name(theme_id), score)
     
     theme_name = next((t["name"] for t in get_themes() if t["id"] == theme_id), "Неизвестная тема")
     
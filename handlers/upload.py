@@ -1,6 +1,9 @@
 import os
+import html
 import asyncio
+import hashlib
 import logging
+from typing import Dict
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
@@ -9,19 +12,30 @@ from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from config import MAX_FILE_SIZE
+from config import MAX_FILE_SIZE, SCAN_DEADLINE
 from utils.helpers import get_or_create_user, sanitize_filename
 from services.virus_total import scan_file
+from services.prescan import prescan
+from services.archive import inspect_archive, is_archive
+from services.scan_history import save_report, remember_file, recall_file
+from services.metrics import ACTIVE_SCANS
+from services.resilience import deadline
 
 router = Router()
 
+# Сколько файлов архива показывать в отчёте
+ARCHIVE_REPORT_LIMIT = 15
+
+# Текущая проверка каждого пользователя, чтобы её можно было отменить
+_scan_tasks: Dict[int, asyncio.Task] = {}
+
 
 class UploadStates(StatesGroup):
     waiting_for_file = State()
     processing = State()
 
 
-@router.message(Command("upload"))
+@router.message(Command("upload"), flags={"cost": 4})
 async def cmd_upload(message: Message, state: FSMContext):
     await state.clear()
     await state.set_state(UploadStates.waiting_for_file)
@@ -33,7 +47,96 @@ async def cmd_upload(message: Message, state: FSMContext):
     )
 
 
-@router.message(UploadStates.waiting_for_file, F.document)
+def format_prescan(local: dict) -> str:
+    verdicts = {
+        "malicious": "🔴 Вредоносно",
+        "suspicious": "🟠 Подозрительно",
+        "clean": "🟢 Безопасно",
+        "unknown": "Явных признаков угрозы нет",
+    }
+    reasons = "".join(f"• {html.escape(reason)}\n" for reason in local["reasons"])
+    
+    return (
+        f"<b>Локальная проверка:</b> {verdicts[local['verdict']]}\n"
+        f"Тип: {local['file_type']}\n"
+        f"Энтропия: {local['entropy']:.2f} бит/байт\n"
+        f"{reasons}"
+    )
+
+
+def format_archive(report: dict) -> str:
+    if report["error"]:
+        return f"<b>Архив:</b> {html.escape(report['error'])}\n"
+    if report["bomb"]:
+        # Лимиты превышают и обычные архивы (сжатый журнал), поэтому это не вердикт
+        return (
+            f"<b>Архив:</b> 🟠 Превышены лимиты проверки, содержимое не проверено\n"
+            f"• {html.escape(report['bomb'])}\n"
+        )
+    
+    lines = []
+    for member in report["members"][:ARCHIVE_REPORT_LIMIT]:
+        verdict = member.get("verdict")
+        if verdict:
+            status = f"{verdict['threat_level']} ({verdict['detection_ratio']})"
+        elif member.get("error"):
+            status = member["error"]
+        else:
+            status = "нет отчёта"
+        lines.append(f"• {html.escape(member['name'])}: {html.escape(status)}\n")
+    
+    hidden = len(report["members"]) - ARCHIVE_REPORT_LIMIT
+    if hidden > 0:
+        lines.append(f"• ...и ещё {hidden}\n")
+    
+    return (
+        f"<b>Архив:</b> {len(report['members'])} файлов, уникальных {report['unique']}, "
+        f"найдено отчётов по хешу {sum(1 for m in report['members'] if m.get('verdict'))}\n"
+        f"{''.join(lines)}"
+    )
+
+
+def archive_conclusive(report: dict) -> bool:
+    # Архив с известным вредоносным файлом в VirusTotal не отправляем
+    return any(
+        member.get("verdict", {}).get("malicious", 0) > 0 for member in report["members"]
+    )
+
+
+def local_threat_level(local: dict, archive: dict) -> str:
+    if (local and local["verdict"] == "malicious") or (archive and archive_conclusive(archive)):
+        return "Вредоносно"
+    if (local and local["verdict"] == "suspicious") or (archive and archive["bomb"]):
+        return "Подозрительно"
+    return "Безопасно"
+
+
+async def save_to_history(session: AsyncSession, user_id: int, filename: str, sha256: str,
+                          threat_level: str, detection_ratio: str, report: dict):
+    # История не должна ломать выдачу результата
+    try:
+        await save_report(session, user_id, filename, sha256, threat_level, detection_ratio, report)
+    except Exception as e:
+        logging.exception(f"Не удалось сохранить отчёт в историю: {str(e)}")
+
+
+async def answer_known_file(message: Message, state: FSMContext, session: AsyncSession, known: dict):
+    # Пересланная копия уже проверенного файла: без get_file, скачивания и хеширования
+    filename = sanitize_filename(message.document.file_name)
+    await message.answer(
+        f"<b>Отчёт по файлу: {filename}</b>\n\n"
+        f"{known['text']}\n"
+        f"<i>Этот файл недавно уже проверялся, показан сохранённый результат.</i>\n\n"
+        f"Для проверки другого файла используйте /upload, историю проверок — /history"
+    )
+    await state.clear()
+    await save_to_history(
+        session, message.from_user.id, filename, known["sha256"],
+        known["threat_level"], known["detection_ratio"], known["report"]
+    )
+
+
+@router.message(UploadStates.waiting_for_file, F.document, flags={"long_running": True})
 async def process_file(message: Message, state: FSMContext, session: AsyncSession):
     user = await get_or_create_user(session, message.from_user.id)
     
@@ -45,6 +148,11 @@ async def process_file(message: Message, state: FSMContext, session: AsyncSessio
         )
         return
     
+    known = recall_file(message.document.file_unique_id)
+    if known:
+        await answer_known_file(message, state, session, known)
+        return
+    
     await state.set_state(UploadStates.processing)
     
     await state.update_data(
@@ -66,6 +174,7 @@ async def process_file(message: Message, state: FSMContext, session: AsyncSessio
     
     await state.update_data(status_message_id=status_message.message_id)
     
+    ACTIVE_SCANS.inc()
     try:
         file = await message.bot.get_file(message.document.file_id)
         file_path = file.file_path
@@ -78,61 +187,82 @@ async def process_file(message: Message, state: FSMContext, session: AsyncSessio
             reply_markup=builder.as_markup()
         )
         
-        file_content = await message.bot.download_file(file_path)
+        file_content = (await message.bot.download_file(file_path)).read()
         filename = sanitize_filename(message.document.file_name)
+        sha256 = await asyncio.to_thread(lambda: hashlib.sha256(file_content).hexdigest())
+        
+        # Локальная проверка в пуле процессов: результат показываем сразу
+        try:
+            local = await prescan(file_content, filename)
+        except Exception as e:
+            logging.exception(f"Ошибка локальной проверки файла: {str(e)}")
+            local = None
+        
+        local_text = format_prescan(local) if local else ""
+        
+        archive = None
+        if is_archive(file_content):
+            # Файлы архива проверяются по хешам без распаковки на диск
+            archive = await inspect_archive(file_content)
+            local_text += "\n" + format_archive(archive)
+        
+        if (local and local["conclusive"]) or (archive and archive_conclusive(archive)):
+            # Вердикт однозначный — VirusTotal не нужен
+            await status_message.edit_text(
+                f"<b>Отчёт по файлу: {filename}</b>\n\n"
+                f"{local_text}\n"
+                f"Для проверки другого файла используйте /upload"
+            )
+            threat_level = local_threat_level(local, archive)
+            report = {"scan": None, "local": local, "archive": archive}
+            await save_to_history(session, message.from_user.id, filename, sha256, threat_level, None, report)
+            remember_file(message.document.file_unique_id, sha256, threat_level, None, report, local_text)
+            return
         
         await status_message.edit_text(
             f"<b>Анализирую файл...</b>\n\n"
+            f"{local_text}\n"
             f"Файл загружен и отправлен на анализ в VirusTotal.\n"
             f"Ожидаем результаты сканирования...\n\n"
             f"<i>Это может занять несколько минут для больших файлов.</i>",
             reply_markup=builder.as_markup()
         )
         
-        scan_task = asyncio.create_task(scan_file(file_content.read(), filename))
-        
-        dots = 0
-        for i in range(30):
-            if scan_task.done():
-                break
-                
-            dots = (dots + 1) % 4
-            dot_text = "." * dots
-            
-            current_state = await state.get_state()
-            if current_state != UploadStates.processing:
-                scan_task.cancel()
-                logging.info(f"Сканирование отменено пользователем: {message.from_user.id}")
-                return
-                
-            try:
-                await status_message.edit_text(
-                    f"<b>Анализирую файл{dot_text}</b>\n\n"
-                    f"Файл загружен и отправлен на анализ в VirusTotal.\n"
-                    f"Ожидаем результаты сканирования... ({i+1}/30)\n\n"
-                    f"<i>Это может занять несколько минут для больших файлов.</i>",
-                    reply_markup=builder.as_markup()
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при обновлении статуса: {e}")
-            
-            await asyncio.sleep(10)
-        
-        if not scan_task.done():
-            scan_task.cancel()
+        async def show_progress(status: str, polls: int):
+            status_text = "в очереди" if status == "queued" else "анализируется"
             await status_message.edit_text(
-                f"<b>Превышено время ожидания</b>\n\n"
-                f"Сканирование файла заняло слишком много времени.\n"
-                f"Попробуйте файл меньшего размера или повторите позже с помощью команды /upload"
+                f"<b>Анализирую файл{'.' * (polls % 4)}</b>\n\n"
+                f"{local_text}\n"
+                f"Файл загружен и отправлен на анализ в VirusTotal.\n"
+                f"Статус: {status_text} (проверка {polls})\n\n"
+                f"<i>Это может занять несколько минут для больших файлов.</i>",
+                reply_markup=builder.as_markup()
             )
+        
+        # Задача наследует срок ожидания; отменить её может cancel_scan
+        with deadline(SCAN_DEADLINE):
+            scan_task = asyncio.create_task(scan_file(file_content, filename, show_progress))
+        _scan_tasks[message.from_user.id] = scan_task
+        
+        try:
+            result = await scan_task
+        except asyncio.CancelledError:
+            # cancel_scan убирает задачу из _scan_tasks до отмены; если она ещё там,
+            # отменили сам обработчик (остановка бота)
+            if _scan_tasks.get(message.from_user.id) is scan_task:
+                scan_task.cancel()
+                raise
+            logging.info(f"Сканирование отменено пользователем: {message.from_user.id}")
             return
-            
-        result = await scan_task
+        finally:
+            if _scan_tasks.get(message.from_user.id) is scan_task:
+                del _scan_tasks[message.from_user.id]
         
         if result["error"]:
             await status_message.edit_text(
                 f"<b>Ошибка при сканировании</b>\n\n"
                 f"{result['message']}\n\n"
+                f"{local_text}\n"
                 f"Попробуйте другой файл или повторите позже с помощью команды /upload"
             )
         else:
@@ -151,13 +281,20 @@ async def process_file(message: Message, state: FSMContext, session: AsyncSessio
                 for engine in result["data"]["detection_engines"]:
                     detections += f"• {engine['name']}: {engine['result']}\n"
             
-            await status_message.edit_text(
-                f"<b>Отчёт по файлу: {filename}</b>\n\n"
+            report_text = (
                 f"{status_emoji} <b>Статус:</b> {threat_level}\n"
                 f"Обнаружен: {detection_ratio} антивирусами\n"
                 f"{detections}\n"
-                f"Для проверки другого файла используйте /upload"
+                f"{local_text}"
             )
+            await status_message.edit_text(
+                f"<b>Отчёт по файлу: {filename}</b>\n\n"
+                f"{report_text}\n"
+                f"Для проверки другого файла используйте /upload, историю проверок — /history"
+            )
+            report = {"scan": result["data"], "local": local, "archive": archive}
+            await save_to_history(session, message.from_user.id, filename, sha256, threat_level, detection_ratio, report)
+            remember_file(message.document.file_unique_id, sha256, threat_level, detection_ratio, report, report_text)
     
     except Exception as e:
         logging.exception(f"Ошибка при обработке файла: {str(e)}")
@@ -168,11 +305,16 @@ async def process_file(message: Message, state: FSMContext, session: AsyncSessio
         )
     
     finally:
+        ACTIVE_SCANS.dec()
         await state.clear()
 
 
 @router.callback_query(UploadStates.processing, F.data == "cancel_scan")
 async def cancel_scan(callback: CallbackQuery, state: FSMContext):
+    scan_task = _scan_tasks.pop(callback.from_user.id, None)
+    if scan_task:
+        scan_task.cancel()
+    
     await callback.answer("Операция отменена")
     await state.clear()
     
@@ -0,0 +1,112 @@
+import html
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from config import SCAN_DEADLINE
+from services.url_check import analyze_url, extract_url
+from services.virus_total import check_url
+from services.resilience import deadline
+
+router = Router()
+
+LOCAL_VERDICTS = {
+    "malicious": "🔴 Похоже на фишинг",
+    "suspicious": "🟠 Подозрительно",
+    "clean": "🟢 Официальный сайт",
+    "unknown": "Явных признаков фишинга нет",
+}
+
+
+class UrlStates(StatesGroup):
+    waiting_for_url = State()
+
+
+@router.message(Command("check_url"), flags={"cost": 1, "long_running": True})
+async def cmd_check_url(message: Message, command: CommandObject, state: FSMContext):
+    await state.clear()
+
+    if command.args:
+        await check_and_reply(message, command.args)
+        return
+
+    await state.set_state(UrlStates.waiting_for_url)
+    await message.answer(
+        f"<b>Проверка ссылки</b>\n\n"
+        f"Отправьте ссылку, которую хотите проверить.\n"
+        f"<i>Не открывайте подозрительную ссылку до проверки.</i>\n\n"
+        f"Для отмены: /cancel"
+    )
+
+
+@router.message(UrlStates.waiting_for_url, F.text, flags={"long_running": True})
+async def process_url(message: Message, state: FSMContext):
+    await state.clear()
+    await check_and_reply(message, message.text)
+
+
+def format_local(local: dict) -> str:
+    reasons = "".join(f"• {html.escape(reason)}\n" for reason in local["reasons"])
+    return (
+        f"Адрес: <code>{html.escape(local['host'])}</code>\n\n"
+        f"<b>Локальная проверка:</b> {LOCAL_VERDICTS[local['verdict']]}\n"
+        f"{reasons}"
+    )
+
+
+async def check_and_reply(message: Message, text: str):
+    url = extract_url(text)
+    local = analyze_url(url) if url else None
+    if local is None:
+        await message.answer(
+            f"<b>Это не похоже на ссылку</b>\n\n"
+            f"Отправьте адрес вида <code>example.com</code> или <code>https://example.com/page</code>.\n"
+            f"Попробуйте снова: /check_url"
+        )
+        return
+
+    local_text = format_local(local)
+
+    if local["conclusive"]:
+        # Официальный домен или явная подделка — VirusTotal не нужен
+        await message.answer(
+            f"<b>Проверка ссылки</b>\n\n"
+            f"{local_text}\n"
+            f"<i>Проверить другую ссылку: /check_url</i>"
+        )
+        return
+
+    status_message = await message.answer(
+        f"<b>Проверка ссылки</b>\n\n"
+        f"{local_text}\n"
+        f"Проверяю ссылку в VirusTotal..."
+    )
+
+    with deadline(SCAN_DEADLINE):
+        result = await check_url(local["url"])
+
+    if result["error"]:
+        await status_message.edit_text(
+            f"<b>Проверка ссылки</b>\n\n"
+            f"{local_text}\n"
+            f"<b>VirusTotal:</b> {html.escape(result['message'])}\n\n"
+            f"<i>Если сомневаетесь — не открывайте ссылку.</i>"
+        )
+        return
+
+    data = result["data"]
+    status_emoji = {"Вредоносно": "🔴", "Подозрительно": "🟠"}.get(data["threat_level"], "🟢")
+    detections = "".join(
+        f"• {engine['name']}: {html.escape(str(engine['result']))}\n" for engine in data["detection_engines"]
+    )
+
+    await status_message.edit_text(
+        f"<b>Проверка ссылки</b>\n\n"
+        f"{local_text}\n"
+        f"<b>VirusTotal:</b> {status_emoji} {data['threat_level']}\n"
+        f"Обнаружена: {data['detection_ratio']} антивирусами\n"
+        f"{detections}\n"
+        f"<i>Проверить другую ссылку: /check_url</i>"
+    )
@@ -1,37 +1,47 @@
 import asyncio
 import logging
-import sys
+import re
+from typing import Dict, Optional
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import BOT_TOKEN
-from database import init_db, get_session
-from handlers import start, test, upload, phishing, progress, password
+from config import BOT_TOKEN, BOT_TOKENS, TRACKING_BASE_URL, METRICS_HOST, METRICS_PORT, PROFILER_ENABLED
+from database import engine, init_db, get_session, register_tenant, use_tenant
+from services.campaigns import resume_campaigns
+from services.tracking import start_tracking_server, stop_tracking_server
+from services.analysis_poller import POLLER
+from services.prescan import shutdown_prescan
+from services.archive import shutdown_archive
+from services.password_strength import load_dictionaries
+from services.metrics import instrument_engine, start_metrics_server
+from services.fsm_storage import InstrumentedStorage, ExpiringStorage
+from services.profiler import StackSampler
+from services.retention import start_maintenance, stop_maintenance
+from services.percentiles import start_sketches, stop_sketches
+from services.structured_logging import setup_logging, stop_logging
+from services.loop_watchdog import start_watchdog, stop_watchdog
+from middlewares.metrics import MetricsMiddleware
+from middlewares.profiler import ProfilerMiddleware
+from middlewares.scheduler import SchedulerMiddleware, DetachMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.tenant import TenantMiddleware
+from middlewares.log_context import LogContextMiddleware
+from handlers import start, test, upload, phishing, progress, password, admin, history, inline, url_check
 
 
-async def main():
-    # Настраиваем логирование
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        stream=sys.stdout
-    )
-    
-    # Устанавливаем уровень логирования для наших модулей
-    logging.getLogger('services').setLevel(logging.DEBUG)
-    logging.getLogger('handlers').setLevel(logging.DEBUG)
-    
-    if not BOT_TOKEN:
-        logging.error("BOT_TOKEN не найден в переменных окружения")
-        return
-    
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+# Имя организации попадает в имя файла базы и в учебные ссылки
+TENANT_NAME = re.compile(r"[a-z0-9_]+")
+
+
+def create_dispatcher(storage: BaseStorage = None, bot_tenants: Dict[int, Optional[str]] = None) -> Dispatcher:
+    # Брошенные состояния FSM удаляются по сроку и лимиту записей
+    dp = Dispatcher(storage=InstrumentedStorage(ExpiringStorage(storage or MemoryStorage())))
     
     @asynccontextmanager
     async def session_middleware():
@@ -42,9 +52,13 @@ async def main():
     dp.include_router(start.router)
     dp.include_router(test.router)
     dp.include_router(upload.router)
+    dp.include_router(history.router)
     dp.include_router(phishing.router)
     dp.include_router(progress.router)
     dp.include_router(password.router)
+    dp.include_router(url_check.router)
+    dp.include_router(admin.router)
+    dp.include_router(inline.router)
     
     # Middleware для передачи сессии БД в хендлеры
     async def db_session_middleware(handler, event, data):
@@ -52,14 +66,110 @@ async def main():
             data["session"] = session
             return await handler(event, data)
     
+    # База организации выбирается по боту раньше всего остального
+    if bot_tenants:
+        dp.update.outer_middleware(TenantMiddleware(bot_tenants))
+    
+    # Контекст журнала: update_id, пользователь, организация и обработчик
+    log_context = LogContextMiddleware()
+    dp.update.outer_middleware(log_context)
+    dp.message.middleware(log_context)
+    dp.callback_query.middleware(log_context)
+    dp.inline_query.middleware(log_context)
+    
+    # Очередь обновлений каждого пользователя; outer — чтобы ожидающие не держали сессию БД
+    dp.update.outer_middleware(SchedulerMiddleware())
     dp.update.middleware(db_session_middleware)
     
+    # Дорогие команды (флаг cost) ограничиваются до того, как освободят очередь
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    dp.inline_query.middleware(throttling)
+    dp.message.middleware(DetachMiddleware())
+    dp.callback_query.middleware(DetachMiddleware())
+    dp.inline_query.middleware(DetachMiddleware())
+    
+    # Метрики обработчиков: inner middleware видит, какой обработчик выбран
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.inline_query.middleware(MetricsMiddleware())
+    
+    if PROFILER_ENABLED:
+        sampler = StackSampler()
+        sampler.start()
+        dp.message.middleware(ProfilerMiddleware(sampler))
+        dp.callback_query.middleware(ProfilerMiddleware(sampler))
+    
+    return dp
+
+
+async def main():
+    # JSON-журнал пишет фоновый поток: event loop не ждёт вывода
+    setup_logging()
+    
+    # Задержка event loop и стек кода, который его блокирует
+    start_watchdog()
+    
+    # Без BOT_TOKENS работает один бот с основной базой
+    tokens = BOT_TOKENS or ({None: BOT_TOKEN} if BOT_TOKEN else {})
+    if not tokens:
+        logging.error("BOT_TOKEN не найден в переменных окружения")
+        return
+    
+    for tenant in tokens:
+        if tenant is not None and not TENANT_NAME.fullmatch(tenant):
+            logging.error(f"Недопустимое имя организации в BOT_TOKENS: {tenant!r}")
+            return
+    
+    # Боты делят одну HTTP-сессию, пул соединений БД, кэши и пулы проверки
+    http_session = AiohttpSession()
+    bots: Dict[Optional[str], Bot] = {}
+    for tenant, token in tokens.items():
+        if tenant is not None:
+            register_tenant(tenant)
+        bots[tenant] = Bot(token=token, session=http_session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    
+    dp = create_dispatcher(bot_tenants={bot.id: tenant for tenant, bot in bots.items()} if BOT_TOKENS else None)
+    instrument_engine(engine)
+    
     # Инициализация базы данных
     await init_db()
     
-    logging.info("Бот запущен")
-    await dp.start_polling(bot, skip_updates=True)
+    # Собираем словари паролей заранее, чтобы первая проверка не ждала
+    load_dictionaries()
+    
+    # Возобновляем фишинговые кампании, прерванные перезапуском
+    for tenant, bot in bots.items():
+        with use_tenant(tenant):
+            await resume_campaigns(bot)
+    
+    # Распределения результатов для сравнения с другими пользователями в /progress
+    await start_sketches()
+    
+    # Свёртка старых записей и сжатие базы по расписанию
+    start_maintenance()
+    
+    # Сервер учёта переходов по учебным ссылкам
+    tracking_runner = await start_tracking_server() if TRACKING_BASE_URL else None
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    
+    logging.info(f"Бот запущен: {', '.join(tenant or 'основной' for tenant in bots)}")
+    try:
+        await dp.start_polling(*bots.values(), skip_updates=True)
+    finally:
+        await POLLER.stop()
+        await stop_maintenance()
+        await stop_sketches()
+        shutdown_prescan()
+        shutdown_archive()
+        if tracking_runner:
+            await stop_tracking_server(tracking_runner)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await stop_watchdog()
+        stop_logging()
 
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
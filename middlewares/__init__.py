@@ -0,0 +1 @@
+from . import metrics, profiler, scheduler, throttling, tenant, log_context
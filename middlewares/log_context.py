@@ -0,0 +1,40 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from middlewares.metrics import get_handler_name
+from services.structured_logging import log_context
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Добавляет к записям журнала контекст обновления
+
+    Как outer middleware на update запоминает update_id, пользователя и
+    организацию, как inner middleware на message и callback_query — имя
+    выбранного обработчика.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context = dict(log_context.get())
+        if isinstance(event, Update):
+            context["update_id"] = event.update_id
+            user = data.get("event_from_user")
+            if user:
+                context["user_id"] = user.id
+            if data.get("tenant"):
+                context["tenant"] = data["tenant"]
+        else:
+            context["handler"] = get_handler_name(data)
+
+        token = log_context.set(context)
+        try:
+            return await handler(event, data)
+        finally:
+            log_context.reset(token)
@@ -0,0 +1,35 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.metrics import HANDLER_LATENCY, HANDLER_UPDATES
+
+
+def get_handler_name(data: Dict[str, Any]) -> str:
+    handler = data.get("handler")
+    return handler.callback.__name__ if handler else "unknown"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Считает вызовы и время работы каждого обработчика (регистрируется как inner middleware)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_name = get_handler_name(data)
+        event_type = type(event).__name__
+        started = time.perf_counter()
+        result = "error"
+
+        try:
+            response = await handler(event, data)
+            result = "ok"
+            return response
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler_name)
+            HANDLER_UPDATES.inc(handler_name, event_type, result)
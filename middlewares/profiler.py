@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from config import PROFILER_SAMPLE_RATE, PROFILER_SLOW_THRESHOLD
+from middlewares.metrics import get_handler_name
+from services.metrics import update_stats
+from services.profiler import StackSampler, build_report, write_report
+
+
+class ProfilerMiddleware(BaseMiddleware):
+    """
+    Профилирует долю обновлений и все медленные обновления
+
+    Стеки снимает StackSampler, пока обработчик работает; решение, сохранять ли
+    отчёт, принимается после завершения: всегда для обновлений дольше
+    slow_threshold и с вероятностью sample_rate для остальных.
+    """
+
+    def __init__(self, sampler: StackSampler, sample_rate: float = PROFILER_SAMPLE_RATE,
+                 slow_threshold: float = PROFILER_SLOW_THRESHOLD):
+        self.sampler = sampler
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self._pending_saves = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        if handler_object is None:
+            return await handler(event, data)
+
+        stats: Dict[str, float] = {}
+        token = update_stats.set(stats)
+        self.sampler.begin()
+        started = time.perf_counter()
+
+        try:
+            return await handler(event, data)
+        finally:
+            finished = time.perf_counter()
+            self.sampler.end()
+            update_stats.reset(token)
+
+            duration = finished - started
+            if duration >= self.slow_threshold:
+                reason = "slow"
+            elif random.random() < self.sample_rate:
+                reason = "sampled"
+            else:
+                reason = None
+
+            if reason:
+                update = data.get("event_update")
+                stacks, window = self.sampler.collect(started, finished, handler_object.callback.__code__)
+                report = build_report(
+                    handler=get_handler_name(data),
+                    update_type=type(event).__name__,
+                    update_id=update.update_id if update else None,
+                    reason=reason,
+                    duration=duration,
+                    stacks=stacks,
+                    window=window,
+                    breakdown=stats
+                )
+                # Запись на диск — в отдельном потоке, чтобы не тормозить event loop
+                task = asyncio.create_task(self._save(report))
+                self._pending_saves.add(task)
+                task.add_done_callback(self._pending_saves.discard)
+
+    @staticmethod
+    async def _save(report: Dict[str, Any]):
+        try:
+            await asyncio.to_thread(write_report, report)
+        except Exception as e:
+            logging.warning(f"Не удалось сохранить отчёт профилировщика: {e}")
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject, Update
+
+from config import SCHEDULER_CONCURRENCY, SCHEDULER_USER_QUEUE, SCHEDULER_MAX_PENDING
+from services.metrics import (
+    SCHEDULER_IN_FLIGHT, SCHEDULER_QUEUED, SCHEDULER_MAX_USER_QUEUE, SCHEDULER_WAIT, SCHEDULER_SHED
+)
+
+
+class SchedulerMiddleware(BaseMiddleware):
+    """
+    Обрабатывает обновления каждого пользователя по очереди и ограничивает общее число обработчиков
+
+    Регистрируется как outer middleware на update. Обновления одного
+    пользователя выстраиваются в цепочку: следующее начинается, когда
+    закончилось предыдущее, поэтому двойное нажатие кнопки не запускает два
+    обработчика над одними данными FSM. Одновременно работают не больше
+    max_concurrency обработчиков, остальные ждут. Если очередь пользователя
+    длиннее max_user_queue или всего ожидающих больше max_pending, новое
+    обновление отбрасывается.
+
+    Долгие обработчики (флаг long_running) освобождают очередь пользователя
+    и общий слот сразу после выбора через DetachMiddleware — иначе, например,
+    отмена проверки файла ждала бы конца самой проверки.
+    """
+
+    def __init__(self, max_concurrency: int = SCHEDULER_CONCURRENCY, max_user_queue: int = SCHEDULER_USER_QUEUE,
+                 max_pending: int = SCHEDULER_MAX_PENDING):
+        self.max_user_queue = max_user_queue
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Последнее обновление в цепочке пользователя: future завершается, когда оно освобождает очередь
+        self._tails: Dict[int, asyncio.Future] = {}
+        self._depth: Dict[int, int] = {}
+        self._queued = 0
+        self._in_flight = 0
+
+        SCHEDULER_QUEUED.set_function(lambda: self._queued)
+        SCHEDULER_IN_FLIGHT.set_function(lambda: self._in_flight)
+        SCHEDULER_MAX_USER_QUEUE.set_function(lambda: max(self._depth.values(), default=0))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        key = user.id if user else chat.id if chat else None
+
+        if self._queued >= self.max_pending:
+            return await self._shed(event, "overload")
+        if key is not None and self._depth.get(key, 0) >= self.max_user_queue:
+            return await self._shed(event, "user_queue")
+
+        previous = self._tails.get(key) if key is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._tails[key] = done
+            self._depth[key] = self._depth.get(key, 0) + 1
+
+        acquired = False
+
+        def detach():
+            nonlocal acquired
+            if not done.done():
+                done.set_result(None)
+            if acquired:
+                acquired = False
+                self._in_flight -= 1
+                self._semaphore.release()
+
+        started = time.perf_counter()
+        self._queued += 1
+        try:
+            if previous is not None:
+                # shield: отмена ожидающего не должна завершать future предыдущего обновления
+                await asyncio.shield(previous)
+            await self._semaphore.acquire()
+            acquired = True
+            self._in_flight += 1
+        finally:
+            self._queued -= 1
+            SCHEDULER_WAIT.observe(time.perf_counter() - started)
+            if not acquired:
+                self._release(key, done)
+
+        try:
+            data["scheduler_detach"] = detach
+            return await handler(event, data)
+        finally:
+            detach()
+            self._release(key, done)
+
+    def _release(self, key: Optional[int], done: asyncio.Future):
+        if not done.done():
+            done.set_result(None)
+        if key is None:
+            return
+        self._depth[key] -= 1
+        if self._depth[key] <= 0:
+            del self._depth[key]
+        if self._tails.get(key) is done:
+            del self._tails[key]
+
+    @staticmethod
+    async def _shed(event: TelegramObject, reason: str) -> None:
+        SCHEDULER_SHED.inc(reason)
+        logging.warning(f"Обновление отброшено планировщиком: {reason}")
+
+        # Кнопка иначе будет крутиться до таймаута Telegram
+        if isinstance(event, Update) and event.callback_query:
+            try:
+                await event.callback_query.answer("Подождите, предыдущие действия ещё выполняются")
+            except Exception:
+                pass
+        return None
+
+
+class DetachMiddleware(BaseMiddleware):
+    """Освобождает очередь планировщика для обработчиков с флагом long_running (inner middleware)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if get_flag(data, "long_running"):
+            detach = data.get("scheduler_detach")
+            if detach:
+                detach()
+        return await handler(event, data)
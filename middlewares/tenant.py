@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database import use_tenant
+
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Выбирает базу организации по боту, получившему обновление (outer middleware на update)
+
+    Все боты обслуживаются одним Dispatcher; обработчики и сервисы берут
+    сессию через async_session(), который смотрит на current_tenant, поэтому
+    данные организаций не смешиваются.
+    """
+
+    def __init__(self, bot_tenants: Dict[int, Optional[str]]):
+        self.bot_tenants = bot_tenants
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        tenant = self.bot_tenants.get(data["bot"].id)
+        data["tenant"] = tenant
+        with use_tenant(tenant):
+            return await handler(event, data)
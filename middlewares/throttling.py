@@ -0,0 +1,78 @@
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject, Message, CallbackQuery, InlineQuery, InlineQueryResultsButton
+
+from config import THROTTLE_RATE, THROTTLE_BURST, THROTTLE_ALLOWLIST, ADMIN_IDS
+from middlewares.metrics import get_handler_name
+from services.metrics import THROTTLED_UPDATES, THROTTLE_TRACKED_USERS
+
+# Как часто удалять пользователей с полным запасом, секунд
+EVICT_INTERVAL = 60.0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает частоту дорогих команд для каждого пользователя (inner middleware)
+
+    Стоимость обработчика задаётся флагом cost: обработчики без флага не
+    ограничиваются. У каждого пользователя есть запас на burst единиц, который
+    пополняется со скоростью rate единиц в минуту. Запас хранится одним числом
+    (алгоритм GCRA): моментом, когда он снова станет полным. Пользователи с
+    полным запасом периодически удаляются, поэтому память занимают только
+    недавно активные.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST,
+                 allowlist: Optional[Set[int]] = None):
+        self.interval = 60.0 / rate
+        self.burst = burst
+        self.allowlist = (THROTTLE_ALLOWLIST | ADMIN_IDS) if allowlist is None else allowlist
+        self._full_at: Dict[int, float] = {}
+        self._next_eviction = time.monotonic() + EVICT_INTERVAL
+        THROTTLE_TRACKED_USERS.set_function(lambda: len(self._full_at))
+
+    def retry_after(self, user_id: int, cost: float) -> float:
+        """Списывает cost из запаса пользователя; возвращает 0 или сколько секунд подождать"""
+        now = time.monotonic()
+        if now >= self._next_eviction:
+            self._full_at = {user: full_at for user, full_at in self._full_at.items() if full_at > now}
+            self._next_eviction = now + EVICT_INTERVAL
+
+        full_at = max(self._full_at.get(user_id, now), now) + min(cost, self.burst) * self.interval
+        allowed_at = full_at - self.burst * self.interval
+        if allowed_at > now:
+            return allowed_at - now
+        self._full_at[user_id] = full_at
+        return 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        cost = get_flag(data, "cost")
+        user = data.get("event_from_user")
+        if not cost or user is None or user.id in self.allowlist:
+            return await handler(event, data)
+
+        wait = self.retry_after(user.id, cost)
+        if not wait:
+            return await handler(event, data)
+
+        THROTTLED_UPDATES.inc(get_handler_name(data))
+        text = f"Слишком много запросов. Попробуйте снова через {math.ceil(wait)} с."
+        if isinstance(event, CallbackQuery):
+            await event.answer(text)
+        elif isinstance(event, Message):
+            await event.answer(f"<b>Подождите немного</b>\n\n{text}")
+        elif isinstance(event, InlineQuery):
+            await event.answer(
+                [], cache_time=0, is_personal=True,
+                button=InlineQueryResultsButton(text=text, start_parameter="throttled")
+            )
+        return None
@@ -1 +1 @@
-from .models import User, Session, TestResult, PhishingLog 
\ No newline at end of file
+from .models import User, Session, TestResult, PhishingLog, PhishingCampaign 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Text, Boolean, Date, DateTime, ForeignKey, Float, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.sql import func
 
 from database import Base
@@ -39,4 +39,90 @@ class PhishingLog(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     clicked = Column(Boolean, default=False)
-    date = Column(DateTime, default=func.now()) 
\ No newline at end of file
+    scenario_id = Column(String, nullable=True)
+    campaign_id = Column(Integer, ForeignKey("phishing_campaigns.id"), nullable=True, index=True)
+    # pending / sent / failed — письмо кампании ещё без ответа, clicked / reported — ответ пользователя
+    status = Column(String, nullable=True)
+    date = Column(DateTime, default=func.now())
+
+
+class PhishingCampaign(Base):
+    __tablename__ = "phishing_campaigns"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scenario_id = Column(String)
+    cohort = Column(String, default="all")
+    status = Column(String, default="scheduled")
+    created_by = Column(Integer, nullable=True)
+    scheduled_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Курсор рассылки: все пользователи с id <= last_user_id уже обработаны
+    last_user_id = Column(Integer, default=0)
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    active_seconds = Column(Float, default=0)
+
+
+class ScanReport(Base):
+    __tablename__ = "scan_reports"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    file_name = Column(String)
+    sha256 = Column(String)
+    threat_level = Column(String)
+    detection_ratio = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    # Полный отчёт: JSON, сжатый zlib
+    report = Column(LargeBinary)
+    
+    # id растёт вместе со временем, поэтому история листается по (user_id, id)
+    __table_args__ = (Index("ix_scan_reports_user_id_id", "user_id", "id"),)
+
+
+class PhishingDailyStat(Base):
+    """Свёртка старых записей phishing_logs: одна строка на день, пользователя и сценарий"""
+    __tablename__ = "phishing_daily_stats"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    scenario_id = Column(String, default="")
+    # Ответы пользователя (clicked / reported), из них переходы, и письма без ответа
+    answered = Column(Integer, default=0)
+    clicked = Column(Integer, default=0)
+    unanswered = Column(Integer, default=0)
+    
+    __table_args__ = (UniqueConstraint("day", "user_id", "scenario_id"),)
+
+
+class TestDailyStat(Base):
+    """Свёртка старых записей test_results: одна строка на день, пользователя и тему"""
+    __tablename__ = "test_daily_stats"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    theme = Column(String)
+    attempts = Column(Integer, default=0)
+    score_sum = Column(Float, default=0)
+    best_score = Column(Float, default=0)
+    
+    __table_args__ = (UniqueConstraint("day", "user_id", "theme"),)
+
+
+class QuantileSketch(Base):
+    """Скетч распределения (KLL), который накопил один процесс бота"""
+    __tablename__ = "quantile_sketches"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String)
+    worker_id = Column(String)
+    count = Column(Integer, default=0)
+    # Уровни компакторов в JSON
+    data = Column(Text)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (UniqueConstraint("name", "worker_id"),)
@@ -1 +1 @@
-from . import test_engine, virus_total, phishing_scenarios, pwned_passwords 
\ No newline at end of file
+from . import test_engine, virus_total, phishing_scenarios, phishing_variants, pwned_passwords, export, campaigns, tracking, metrics, fsm_storage, profiler, cache, resilience, analysis_poller, prescan, archive, password_strength, scan_history, structured_logging, retention, percentiles, url_check, loop_watchdog
@@ -0,0 +1,234 @@
+import asyncio
+import contextvars
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from config import (
+    VIRUSTOTAL_API_KEY, VIRUSTOTAL_API_URL, VIRUSTOTAL_TIMEOUT,
+    ANALYSIS_POLL_MIN_INTERVAL, ANALYSIS_POLL_MAX_INTERVAL, ANALYSIS_POLL_CONCURRENCY, ANALYSIS_MAX_WAIT
+)
+from services.metrics import PENDING_ANALYSES, ANALYSIS_POLLS
+from services.resilience import fetch, remaining, ServiceUnavailable
+
+# Вызывается после каждого опроса: статус анализа и номер опроса
+ProgressCallback = Callable[[str, int], Awaitable[None]]
+
+
+class AnalysisError(Exception):
+    """Анализ завершился ошибкой или не уложился в срок"""
+
+
+class PendingAnalysis:
+    def __init__(self, analysis_id: str, file_size: int, expires_at: float, now: float):
+        self.analysis_id = analysis_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Колбэк и контекст его ожидающего: организация, контекст журнала, срок
+        self.callbacks: List[Tuple[ProgressCallback, contextvars.Context]] = []
+        self.waiters = 0
+        self.polls = 0
+        self.expires_at = expires_at
+        self.interval = initial_interval(file_size)
+        self.next_poll = now + self.interval
+
+
+def initial_interval(file_size: int) -> float:
+    # Большие файлы VirusTotal анализирует дольше — первый опрос откладываем
+    size_mb = file_size / (1024 * 1024)
+    return min(ANALYSIS_POLL_MAX_INTERVAL, ANALYSIS_POLL_MIN_INTERVAL + 2 * size_mb)
+
+
+def next_interval(interval: float, status: str) -> float:
+    if status == "in-progress":
+        # Анализ уже идёт — результат близко
+        return max(ANALYSIS_POLL_MIN_INTERVAL, interval / 2)
+    return min(ANALYSIS_POLL_MAX_INTERVAL, interval * 1.5)
+
+
+class AnalysisPoller:
+    """
+    Общий опрос результатов анализа VirusTotal
+
+    Все ожидающие анализы хранятся в одной таблице, а одна фоновая задача за
+    проход опрашивает те, чей срок подошёл, через общую HTTP-сессию и не больше
+    ANALYSIS_POLL_CONCURRENCY запросов одновременно. Интервал опроса зависит от
+    размера файла и меняется по статусу: queued — реже, in-progress — чаще.
+    Ожидающие получают результат через future; колбэки получают промежуточные статусы.
+    """
+
+    def __init__(self, concurrency: int = ANALYSIS_POLL_CONCURRENCY):
+        self.concurrency = concurrency
+        self._pending: Dict[str, PendingAnalysis] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._callback_tasks: Set[asyncio.Task] = set()
+        PENDING_ANALYSES.set_function(lambda: len(self._pending))
+
+    async def wait(self, analysis_id: str, file_size: int, on_update: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Ждёт завершения анализа
+
+        Срок ожидания — ANALYSIS_MAX_WAIT или срок из deadline(), если он раньше.
+
+        Returns:
+            Ответ /analyses с завершённым анализом
+
+        Raises:
+            AnalysisError: анализ не завершился в срок или VirusTotal вернул ошибку
+            ServiceUnavailable: VirusTotal недоступен
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        budget = remaining()
+        expires_at = now + (ANALYSIS_MAX_WAIT if budget is None else min(ANALYSIS_MAX_WAIT, budget))
+
+        pending = self._pending.get(analysis_id)
+        if pending is None:
+            pending = self._pending[analysis_id] = PendingAnalysis(analysis_id, file_size, expires_at, now)
+        else:
+            pending.expires_at = max(pending.expires_at, expires_at)
+
+        pending.waiters += 1
+        callback = (on_update, contextvars.copy_context()) if on_update else None
+        if callback:
+            pending.callbacks.append(callback)
+
+        if self._task is None:
+            # Пустой контекст: задача общая и не должна унаследовать срок, организацию
+            # и контекст журнала первого ожидающего. Срок каждого — только expires_at
+            self._task = contextvars.Context().run(asyncio.create_task, self._run())
+        self._wakeup.set()
+
+        try:
+            # shield: отмена одного ожидающего не должна отменять общий future
+            return await asyncio.shield(pending.future)
+        except asyncio.CancelledError:
+            pending.waiters -= 1
+            if callback in pending.callbacks:
+                pending.callbacks.remove(callback)
+            if pending.waiters <= 0 and self._pending.get(analysis_id) is pending:
+                del self._pending[analysis_id]
+                pending.future.cancel()
+            raise
+
+    def _resolve(self, pending: PendingAnalysis, result: Any = None, error: Optional[Exception] = None):
+        if self._pending.get(pending.analysis_id) is pending:
+            del self._pending[pending.analysis_id]
+        if pending.future.done():
+            return
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(result)
+
+    def _notify(self, pending: PendingAnalysis, status: str):
+        for callback, context in list(pending.callbacks):
+            # Задача копирует контекст, в котором создана: контекст своего ожидающего
+            task = context.run(asyncio.create_task, callback(status, pending.polls))
+            self._callback_tasks.add(task)
+            task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task):
+        self._callback_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Ошибка в колбэке прогресса анализа: {task.exception()}")
+
+    async def _poll(self, pending: PendingAnalysis, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            if pending.future.done():
+                return
+
+            try:
+                status, body = await fetch(
+                    self._session, "GET", f"{VIRUSTOTAL_API_URL}/analyses/{pending.analysis_id}",
+                    service="virustotal", endpoint="analyses", timeout=VIRUSTOTAL_TIMEOUT,
+                    headers={"x-apikey": VIRUSTOTAL_API_KEY, "accept": "application/json"}
+                )
+            except ServiceUnavailable as e:
+                ANALYSIS_POLLS.inc("unavailable")
+                self._resolve(pending, error=e)
+                return
+            except Exception as e:
+                ANALYSIS_POLLS.inc("error")
+                logging.exception(f"Исключение при получении результатов анализа: {str(e)}")
+                self._resolve(pending, error=AnalysisError(f"Произошла ошибка при получении результатов анализа: {str(e)}"))
+                return
+
+        pending.polls += 1
+
+        if status != 200:
+            ANALYSIS_POLLS.inc(str(status))
+            logging.error(f"Ошибка при получении результатов анализа: {status}", extra={"response": body[:200]})
+            self._resolve(pending, error=AnalysisError(f"Ошибка при получении результатов анализа: {status}"))
+            return
+
+        try:
+            result = json.loads(body)
+        except ValueError:
+            ANALYSIS_POLLS.inc("invalid")
+            self._resolve(pending, error=AnalysisError("VirusTotal вернул некорректный ответ"))
+            return
+
+        analysis_status = result.get("data", {}).get("attributes", {}).get("status")
+        ANALYSIS_POLLS.inc(str(analysis_status))
+
+        if analysis_status == "completed":
+            logging.info(f"Анализ {pending.analysis_id} завершен за {pending.polls} опросов")
+            self._resolve(pending, result)
+        elif analysis_status in ("queued", "in-progress"):
+            pending.interval = next_interval(pending.interval, analysis_status)
+            pending.next_poll = asyncio.get_running_loop().time() + pending.interval
+            self._notify(pending, analysis_status)
+        else:
+            logging.error(f"Неизвестный статус анализа: {analysis_status}")
+            self._resolve(pending, error=AnalysisError(f"Неизвестный статус анализа: {analysis_status}"))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession()
+
+        while True:
+            now = loop.time()
+
+            for pending in list(self._pending.values()):
+                if pending.expires_at <= now:
+                    logging.warning(f"Не дождались результата анализа {pending.analysis_id} за {pending.polls} опросов")
+                    self._resolve(pending, error=AnalysisError(
+                        "Истекло время ожидания результатов анализа. Файл слишком большой или сервис перегружен."
+                    ))
+
+            due = [pending for pending in self._pending.values() if pending.next_poll <= now]
+
+            if due:
+                await asyncio.gather(*(self._poll(pending, semaphore) for pending in due))
+                continue
+
+            # Спим до ближайшего опроса или срока либо до появления нового анализа
+            self._wakeup.clear()
+            wake_at = min(
+                (min(pending.next_poll, pending.expires_at) for pending in self._pending.values()),
+                default=None
+            )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=None if wake_at is None else wake_at - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+
+POLLER = AnalysisPoller()
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import io
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import aiohttp
+
+from config import (
+    ARCHIVE_WORKERS, ARCHIVE_MAX_MEMBERS, ARCHIVE_MAX_RATIO, ARCHIVE_MAX_TOTAL_SIZE,
+    ARCHIVE_MAX_DEPTH, ARCHIVE_MAX_LOOKUPS, ARCHIVE_LOOKUP_CONCURRENCY
+)
+from services.prescan import detect_type
+from services.virus_total import lookup_hash
+
+READ_CHUNK_SIZE = 1024 * 1024
+HEAD_SIZE = 64 * 1024
+# Вложенные архивы читаются в память, поэтому их размер ограничен отдельно
+MAX_NESTED_ARCHIVE_SIZE = 50 * 1024 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class ArchiveBomb(Exception):
+    """Архив превышает лимиты распаковки"""
+
+
+def is_archive(data: bytes) -> bool:
+    return data[:4] in (b"PK\x03\x04", b"PK\x05\x06")
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS, thread_name_prefix="archive")
+    return _executor
+
+
+def _hash_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, keep: bool) -> Tuple[str, bytes, Optional[bytes]]:
+    """
+    Читает файл из архива потоком и считает SHA-256
+
+    zlib и hashlib отпускают GIL на больших блоках, поэтому файлы архива
+    хешируются в потоках параллельно. ZipFile можно читать из нескольких
+    потоков: каждое open() получает свою позицию в общем файле.
+
+    Returns:
+        Хеш, первые байты файла и содержимое целиком, если keep (для вложенных архивов)
+    """
+    digest = hashlib.sha256()
+    head = b""
+    chunks = [] if keep else None
+    read = 0
+
+    with archive.open(info) as member:
+        while True:
+            chunk = member.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            read += len(chunk)
+            # Заголовку верить нельзя: считаем реально распакованные байты
+            if read > info.file_size:
+                raise ArchiveBomb(f"{info.filename}: распаковано больше заявленного размера")
+            digest.update(chunk)
+            if len(head) < HEAD_SIZE:
+                head += chunk[:HEAD_SIZE - len(head)]
+            if chunks is not None:
+                chunks.append(chunk)
+
+    return digest.hexdigest(), head, b"".join(chunks) if chunks is not None else None
+
+
+def _check_limits(infos: List[zipfile.ZipInfo], budget: Dict[str, int]):
+    if len(infos) > ARCHIVE_MAX_MEMBERS:
+        raise ArchiveBomb(f"Слишком много файлов в архиве: {len(infos)}")
+
+    for info in infos:
+        if info.file_size > max(info.compress_size, 1) * ARCHIVE_MAX_RATIO:
+            raise ArchiveBomb(
+                f"{info.filename}: степень сжатия {info.file_size // max(info.compress_size, 1)}:1"
+            )
+
+    budget["members"] += len(infos)
+    budget["size"] += sum(info.file_size for info in infos)
+
+    if budget["members"] > ARCHIVE_MAX_MEMBERS:
+        raise ArchiveBomb(f"Слишком много файлов во вложенных архивах: {budget['members']}")
+    if budget["size"] > ARCHIVE_MAX_TOTAL_SIZE:
+        raise ArchiveBomb(f"Распакованный размер превышает {ARCHIVE_MAX_TOTAL_SIZE // (1024 * 1024)} МБ")
+
+
+def _walk(data: bytes, prefix: str, depth: int, budget: Dict[str, int], members: List[Dict[str, Any]]):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        _check_limits(infos, budget)
+
+        readable = []
+        for info in infos:
+            entry = {
+                "name": prefix + info.filename,
+                "size": info.file_size,
+                "compressed_size": info.compress_size,
+                "depth": depth,
+            }
+            members.append(entry)
+            if info.flag_bits & 0x1:
+                entry["error"] = "Файл зашифрован"
+            else:
+                readable.append((info, entry))
+
+        # Вложенный архив угадываем по расширению: содержимое ещё не прочитано
+        def keep(info: zipfile.ZipInfo) -> bool:
+            return info.filename.lower().endswith((".zip", ".jar", ".apk", ".docx", ".xlsx")) \
+                and info.file_size <= MAX_NESTED_ARCHIVE_SIZE
+
+        futures = [
+            (info, entry, _get_executor().submit(_hash_member, archive, info, keep(info)))
+            for info, entry in readable
+        ]
+
+        nested = []
+        for info, entry, future in futures:
+            try:
+                sha256, head, content = future.result()
+            except ArchiveBomb:
+                raise
+            except Exception as e:
+                entry["error"] = f"Не удалось прочитать: {e}"
+                continue
+
+            entry["sha256"] = sha256
+            entry["file_type"], entry["category"] = detect_type(head)
+            if content is not None and is_archive(content):
+                nested.append((entry, content))
+
+    # Вложенные архивы обходим после того, как освободили потоки пула
+    for entry, content in nested:
+        if depth + 1 > ARCHIVE_MAX_DEPTH:
+            raise ArchiveBomb(f"Слишком глубокая вложенность архивов: {entry['name']}")
+        _walk(content, entry["name"] + "/", depth + 1, budget, members)
+
+
+def inspect_zip(data: bytes) -> Dict[str, Any]:
+    """
+    Обходит ZIP-архив в памяти, не распаковывая его на диск
+
+    Returns:
+        Dict со списком файлов (имя, размеры, SHA-256, тип) и причиной
+        остановки (bomb), если архив превысил лимиты распаковки
+    """
+    members: List[Dict[str, Any]] = []
+    budget = {"members": 0, "size": 0}
+    bomb = None
+
+    try:
+        _walk(data, "", 0, budget, members)
+    except ArchiveBomb as e:
+        bomb = str(e)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError) as e:
+        return {"error": f"Не удалось открыть архив: {e}", "members": members, "bomb": None}
+
+    return {"error": None, "members": members, "bomb": bomb, "total_size": budget["size"]}
+
+
+async def inspect_archive(data: bytes) -> Dict[str, Any]:
+    """
+    Проверяет архив: хеширует файлы и ищет вердикты по хешам
+
+    Одинаковые файлы проверяются один раз. Хеши сначала ищутся в кэше
+    вердиктов, потом в VirusTotal — не больше ARCHIVE_MAX_LOOKUPS уникальных
+    файлов и не больше ARCHIVE_LOOKUP_CONCURRENCY запросов одновременно.
+    """
+    report = await asyncio.to_thread(inspect_zip, data)
+    if report["error"] or report["bomb"]:
+        return report
+
+    hashes = list(dict.fromkeys(member["sha256"] for member in report["members"] if "sha256" in member))
+    semaphore = asyncio.Semaphore(ARCHIVE_LOOKUP_CONCURRENCY)
+    verdicts: Dict[str, Dict[str, Any]] = {}
+
+    async def lookup(sha256: str, session: aiohttp.ClientSession):
+        async with semaphore:
+            verdicts[sha256] = await lookup_hash(sha256, session)
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(lookup(sha256, session) for sha256 in hashes[:ARCHIVE_MAX_LOOKUPS]))
+
+    for member in report["members"]:
+        verdict = verdicts.get(member.get("sha256"))
+        if verdict is None:
+            continue
+        if verdict["error"]:
+            member["error"] = verdict["message"]
+        elif verdict["data"] is not None:
+            member["verdict"] = verdict["data"]
+
+    report["unique"] = len(hashes)
+    report["checked"] = len(verdicts)
+    logging.info(
+        f"Архив: {len(report['members'])} файлов, уникальных {len(hashes)}, проверено по хешу {len(verdicts)}"
+    )
+    return report
+
+
+def shutdown_archive():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,45 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    LRU-кэш с временем жизни записей
+
+    Просроченные записи не удаляются сразу: get() их не отдаёт, но get_stale()
+    вернёт последнее известное значение — это запасной ответ, когда внешний
+    сервис недоступен. Из памяти записи вытесняются только по LRU.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._lookup(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def get_stale(self, key: Hashable) -> Any:
+        entry = self._lookup(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
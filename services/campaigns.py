@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import LinkPreviewOptions
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import select, update, insert, func, exists, and_, or_, true
+
+from config import CAMPAIGN_RATE_LIMIT, CAMPAIGN_CONCURRENCY, CAMPAIGN_BATCH_SIZE
+from database import async_session, current_tenant
+from models.models import User, PhishingLog, PhishingCampaign, PhishingDailyStat
+from services.phishing_scenarios import get_scenario
+from services.phishing_variants import get_templates, pick_variant_id
+from services.percentiles import record_phishing_answers
+from utils.helpers import generate_phishing_link
+
+COHORTS = ("all", "untrained")
+
+# Статусы записей PhishingLog, которые ещё не являются ответом пользователя:
+# pending — запись создана до отправки, письмо могло уже дойти
+PENDING_STATUSES = ("pending", "sent", "failed")
+
+MAX_SEND_ATTEMPTS = 3
+
+RANDOM_SPEC = "random"
+
+# Превью ссылки выдало бы учебный адрес и засчитало бы переход от робота Telegram
+NO_PREVIEW = LinkPreviewOptions(is_disabled=True)
+
+# Ключ — (организация, id кампании): у каждой организации своя нумерация
+_tasks: Dict[Tuple[Optional[str], int], asyncio.Task] = {}
+_limiters: Dict[int, "RateLimiter"] = {}
+
+
+class RateLimiter:
+    """Равномерно распределяет отправки во времени: не чаще rate сообщений в секунду"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _get_limiter(bot: Bot) -> RateLimiter:
+    # Лимит Telegram общий для бота, поэтому параллельные кампании делят один лимитер
+    if bot.id not in _limiters:
+        _limiters[bot.id] = RateLimiter(CAMPAIGN_RATE_LIMIT)
+    return _limiters[bot.id]
+
+
+def answered_filter():
+    """Условие для записей PhishingLog, которые являются ответом пользователя"""
+    return or_(PhishingLog.status.is_(None), PhishingLog.status.notin_(PENDING_STATUSES))
+
+
+def _cohort_filter(cohort: str):
+    if cohort == "untrained":
+        return and_(
+            ~exists().where(and_(PhishingLog.user_id == User.id, answered_filter())),
+            ~exists().where(and_(PhishingDailyStat.user_id == User.id, PhishingDailyStat.answered > 0))
+        )
+    return true()
+
+
+def is_valid_scenario(scenario_spec: str) -> bool:
+    """Сценарий кампании — id сценария или random[:шаблон] для своего варианта каждому получателю"""
+    if scenario_spec.startswith(RANDOM_SPEC):
+        template_id = scenario_spec[len(RANDOM_SPEC) + 1:]
+        return not template_id or template_id in {t["id"] for t in get_templates()}
+    return bool(get_scenario(scenario_spec))
+
+
+def _recipient_scenario_id(scenario_spec: str, campaign_id: int, user_id: int) -> str:
+    if scenario_spec.startswith(RANDOM_SPEC):
+        template_id = scenario_spec[len(RANDOM_SPEC) + 1:] or None
+        return pick_variant_id(template_id, f"{campaign_id}:{user_id}")
+    return scenario_spec
+
+
+async def create_campaign(scenario_id: str, cohort: str = "all", delay_minutes: int = 0,
+                          created_by: int = None) -> PhishingCampaign:
+    async with async_session() as session:
+        campaign = PhishingCampaign(
+            scenario_id=scenario_id,
+            cohort=cohort,
+            status="scheduled",
+            created_by=created_by,
+            scheduled_at=_utcnow() + timedelta(minutes=delay_minutes)
+        )
+        session.add(campaign)
+        await session.commit()
+        return campaign
+
+
+def _build_message(scenario: Dict[str, Any], campaign_id: int, user_id: int):
+    text = scenario["message"].format(
+        phishing_link=generate_phishing_link(user_id, scenario["id"], campaign_id)
+    )
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Перейти по ссылке", callback_data=f"campaign_click:{campaign_id}")
+    builder.button(text="Это фишинг?", callback_data=f"campaign_report:{campaign_id}")
+
+    return text, builder.as_markup()
+
+
+async def _deliver(bot: Bot, user_id: int, scenario: Dict[str, Any], campaign_id: int,
+                   limiter: RateLimiter, semaphore: asyncio.Semaphore) -> bool:
+    text, markup = _build_message(scenario, campaign_id, user_id)
+
+    async with semaphore:
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            await limiter.wait()
+            try:
+                await bot.send_message(user_id, text, reply_markup=markup, link_preview_options=NO_PREVIEW)
+                return True
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать — притормаживаем всю рассылку, а не только этот запрос
+                logging.warning(f"Кампания {campaign_id}: flood control, пауза {e.retry_after} с")
+                limiter.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                # Пользователь заблокировал бота или чат недоступен — повторять бессмысленно
+                return False
+            except Exception as e:
+                logging.warning(f"Кампания {campaign_id}: ошибка отправки пользователю {user_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    return False
+
+
+async def _mark_delivered(campaign_id: int, user_id: int):
+    # Отдельная короткая транзакция сразу после отправки: после перезапуска письмо не уйдёт повторно
+    try:
+        async with async_session() as session:
+            await session.execute(
+                update(PhishingLog)
+                .where(
+                    PhishingLog.campaign_id == campaign_id,
+                    PhishingLog.user_id == user_id,
+                    PhishingLog.status == "pending"
+                )
+                .values(status="sent")
+            )
+            await session.commit()
+    except Exception as e:
+        # Статус всё равно обновится в конце пачки
+        logging.warning(f"Кампания {campaign_id}: не удалось отметить доставку пользователю {user_id}: {e}")
+
+
+async def run_campaign(bot: Bot, campaign_id: int) -> Dict[str, Any]:
+    """
+    Рассылает сценарий кампании всем пользователям когорты
+
+    Пользователи обходятся по возрастанию id пачками. Перед отправкой пачки её
+    получатели записываются в PhishingLog со статусом pending, поэтому ответ на уже
+    доставленное письмо засчитывается, даже если пачка ещё не закончена или прервана.
+    Каждая доставка сразу отмечается как sent, а после пачки остальные записи
+    получают статус failed и сохраняется курсор last_user_id. Прерванная кампания
+    продолжается с места остановки: отмеченным письмам повторно не отправляется,
+    повторно может уйти только письмо, отправка которого шла в момент остановки.
+    """
+    async with async_session() as session:
+        campaign = await session.get(PhishingCampaign, campaign_id)
+
+        if not is_valid_scenario(campaign.scenario_id):
+            campaign.status = "failed"
+            await session.commit()
+            raise ValueError(f"Сценарий {campaign.scenario_id} не найден")
+
+        cohort_filter = _cohort_filter(campaign.cohort)
+
+        if campaign.started_at is None:
+            campaign.started_at = _utcnow()
+            campaign.total = await session.scalar(
+                select(func.count()).select_from(User).where(cohort_filter)
+            )
+        campaign.status = "running"
+        await session.commit()
+
+        limiter = _get_limiter(bot)
+        semaphore = asyncio.Semaphore(CAMPAIGN_CONCURRENCY)
+        logging.info(f"Кампания {campaign_id} запущена: {campaign.total} получателей, курсор {campaign.last_user_id}")
+
+        while True:
+            batch_started = time.monotonic()
+            user_ids: List[int] = list(await session.scalars(
+                select(User.id)
+                .where(User.id > campaign.last_user_id, cohort_filter)
+                .order_by(User.id)
+                .limit(CAMPAIGN_BATCH_SIZE)
+            ))
+            # Закрываем читающую транзакцию, чтобы не держать блокировку SQLite во время рассылки
+            await session.commit()
+
+            if not user_ids:
+                break
+
+            # Пачка уже начиналась до перерыва: доставленные письма отмечены сразу после
+            # отправки и повторно не уходят, а pending отправляется снова
+            logged = dict((await session.execute(
+                select(PhishingLog.user_id, PhishingLog.status)
+                .where(PhishingLog.campaign_id == campaign_id, PhishingLog.user_id.in_(user_ids))
+            )).all())
+            already_sent = sum(1 for status in logged.values() if status != "pending")
+            recipients = [user_id for user_id in user_ids if logged.get(user_id, "pending") == "pending"]
+
+            # Вариант выбирается детерминированно, поэтому после перезапуска получатель увидит тот же
+            scenario_ids = [_recipient_scenario_id(campaign.scenario_id, campaign_id, user_id) for user_id in recipients]
+            new_rows = [
+                {
+                    "user_id": user_id,
+                    "clicked": False,
+                    "scenario_id": scenario_id,
+                    "campaign_id": campaign_id,
+                    "status": "pending"
+                }
+                for user_id, scenario_id in zip(recipients, scenario_ids) if user_id not in logged
+            ]
+            if new_rows:
+                await session.execute(insert(PhishingLog), new_rows)
+            await session.commit()
+
+            async def deliver(user_id: int, scenario_id: str) -> bool:
+                delivered = await _deliver(bot, user_id, get_scenario(scenario_id), campaign_id, limiter, semaphore)
+                if delivered:
+                    # shield: остановка кампании не должна потерять отметку о доставленном письме
+                    await asyncio.shield(_mark_delivered(campaign_id, user_id))
+                return delivered
+
+            outcomes = await asyncio.gather(*(
+                deliver(user_id, scenario_id) for user_id, scenario_id in zip(recipients, scenario_ids)
+            ))
+
+            # Ответ мог прийти раньше конца пачки — его статус не трогаем
+            for status, delivered in (("sent", True), ("failed", False)):
+                user_group = [user_id for user_id, ok in zip(recipients, outcomes) if ok is delivered]
+                if user_group:
+                    await session.execute(
+                        update(PhishingLog)
+                        .where(
+                            PhishingLog.campaign_id == campaign_id,
+                            PhishingLog.user_id.in_(user_group),
+                            PhishingLog.status == "pending"
+                        )
+                        .values(status=status)
+                    )
+
+            delivered_count = sum(outcomes)
+            campaign.last_user_id = user_ids[-1]
+            campaign.sent += delivered_count + already_sent
+            campaign.failed += len(outcomes) - delivered_count
+            campaign.active_seconds += time.monotonic() - batch_started
+            await session.commit()
+
+        campaign.status = "completed"
+        campaign.finished_at = _utcnow()
+        await session.commit()
+
+        report = get_report(campaign)
+        logging.info(f"Кампания {campaign_id} завершена: {report}")
+        return report
+
+
+def get_report(campaign: PhishingCampaign) -> Dict[str, Any]:
+    processed = (campaign.sent or 0) + (campaign.failed or 0)
+    active_seconds = campaign.active_seconds or 0
+
+    return {
+        "id": campaign.id,
+        "scenario_id": campaign.scenario_id,
+        "status": campaign.status,
+        "total": campaign.total or 0,
+        "processed": processed,
+        "sent": campaign.sent or 0,
+        "failed": campaign.failed or 0,
+        "seconds": active_seconds,
+        "rate": processed / active_seconds if active_seconds > 0 else 0.0
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    return (
+        f"<b>Кампания #{report['id']}</b> ({report['scenario_id']}) — {report['status']}\n"
+        f"Обработано: {report['processed']} из {report['total']}\n"
+        f"Доставлено: {report['sent']}, ошибок: {report['failed']}\n"
+        f"Скорость: {report['rate']:.1f} сообщ./с, время рассылки: {report['seconds']:.0f} с"
+    )
+
+
+async def _run_scheduled(bot: Bot, campaign_id: int, delay: float, notify_id: Optional[int]):
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    try:
+        report = await run_campaign(bot, campaign_id)
+        text = format_report(report)
+    except Exception as e:
+        logging.exception(f"Ошибка кампании {campaign_id}: {str(e)}")
+        text = f"<b>Кампания #{campaign_id} прервана</b>\n\n{str(e)}"
+
+    if notify_id:
+        try:
+            await bot.send_message(notify_id, text)
+        except Exception as e:
+            logging.warning(f"Не удалось отправить отчёт по кампании {campaign_id}: {e}")
+
+
+def schedule_campaign(bot: Bot, campaign: PhishingCampaign):
+    delay = (campaign.scheduled_at - _utcnow()).total_seconds()
+    key = (current_tenant.get(), campaign.id)
+    # Задача наследует контекст, а с ним и базу организации
+    task = asyncio.create_task(_run_scheduled(bot, campaign.id, delay, campaign.created_by))
+    _tasks[key] = task
+    task.add_done_callback(lambda _: _tasks.pop(key, None))
+
+
+async def resume_campaigns(bot: Bot):
+    """Возобновляет запланированные и прерванные кампании после перезапуска бота"""
+    async with async_session() as session:
+        campaigns = (await session.scalars(
+            select(PhishingCampaign).where(PhishingCampaign.status.in_(("scheduled", "running")))
+        )).all()
+
+    for campaign in campaigns:
+        logging.info(f"Возобновляем кампанию {campaign.id} (статус {campaign.status})")
+        schedule_campaign(bot, campaign)
+
+
+async def stop_campaign(campaign_id: int) -> bool:
+    task = _tasks.pop((current_tenant.get(), campaign_id), None)
+    if task:
+        task.cancel()
+
+    async with async_session() as session:
+        result = await session.execute(
+            update(PhishingCampaign)
+            .where(PhishingCampaign.id == campaign_id, PhishingCampaign.status.in_(("scheduled", "running")))
+            .values(status="stopped")
+        )
+        await session.commit()
+
+    return result.rowcount > 0
+
+
+async def list_campaigns(limit: int = 10) -> List[PhishingCampaign]:
+    async with async_session() as session:
+        return (await session.scalars(
+            select(PhishingCampaign).order_by(PhishingCampaign.id.desc()).limit(limit)
+        )).all()
+
+
+async def record_answer(session, campaign_id: int, user_id: int, clicked: bool) -> Optional[str]:
+    """
+    Записывает ответ получателя на письмо кампании
+
+    Returns:
+        ID сценария, который получил пользователь, или None, если ответ уже был записан
+    """
+    conditions = (
+        PhishingLog.campaign_id == campaign_id,
+        PhishingLog.user_id == user_id,
+        # pending: письмо доставлено, но пачка рассылки ещё не закончена или прервана
+        PhishingLog.status.in_(("pending", "sent"))
+    )
+    scenario_id = await session.scalar(select(PhishingLog.scenario_id).where(*conditions))
+
+    result = await session.execute(
+        update(PhishingLog)
+        .where(*conditions)
+        .values(clicked=clicked, status="clicked" if clicked else "reported", date=func.now())
+    )
+    await session.commit()
+
+    if result.rowcount == 0:
+        return None
+
+    await record_phishing_answers(session, [user_id])
+    return scenario_id
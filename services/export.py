@@ -0,0 +1,126 @@
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, AsyncIterator, List, Sequence
+
+from sqlalchemy import select
+
+from config import EXPORT_DIR, EXPORT_CHUNK_SIZE
+from database import current_engine, current_tenant
+from models.models import TestResult, PhishingLog, TestDailyStat, PhishingDailyStat
+
+EXPORT_TABLES = {
+    "test_results": TestResult.__table__,
+    "phishing_logs": PhishingLog.__table__,
+    "test_daily_stats": TestDailyStat.__table__,
+    "phishing_daily_stats": PhishingDailyStat.__table__,
+}
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+async def iter_chunks(table_name: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Sequence[Any]]]:
+    """
+    Постранично читает таблицу с keyset-пагинацией по первичному ключу
+
+    Каждая пачка читается в отдельной короткой транзакции, поэтому выгрузка
+    не держит блокировку SQLite и расходует память только на одну пачку.
+    """
+    table = EXPORT_TABLES[table_name]
+    last_id = 0
+
+    while True:
+        query = select(table).where(table.c.id > last_id).order_by(table.c.id).limit(chunk_size)
+
+        async with current_engine().connect() as conn:
+            result = await conn.execute(query)
+            rows = result.all()
+
+        if not rows:
+            return
+
+        yield rows
+        last_id = rows[-1].id
+
+
+def _serialize(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _write_chunk(fh, fmt: str, columns: List[str], rows: List[Sequence[Any]]) -> None:
+    if fmt == "csv":
+        writer = csv.writer(fh)
+        writer.writerows([[_serialize(value) for value in row] for row in rows])
+    else:
+        fh.write("".join(
+            json.dumps(dict(zip(columns, map(_serialize, row))), ensure_ascii=False) + "\n"
+            for row in rows
+        ))
+
+
+async def export_table(
+    table_name: str,
+    fmt: str = "csv",
+    compress: bool = False,
+    output_path: str = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Выгружает таблицу в CSV или JSON Lines (опционально gzip)
+
+    Args:
+        table_name: Имя таблицы из EXPORT_TABLES
+        fmt: Формат файла — "csv" или "jsonl"
+        compress: Сжимать ли файл gzip
+        output_path: Путь к файлу; по умолчанию файл создаётся в EXPORT_DIR
+        chunk_size: Количество строк в одной пачке
+
+    Returns:
+        Dict с путём к файлу, числом строк и временем выгрузки
+    """
+    if table_name not in EXPORT_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table_name}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+    if output_path is None:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        tenant = current_tenant.get()
+        prefix = f"{tenant}_{table_name}" if tenant else table_name
+        output_path = os.path.join(EXPORT_DIR, f"{prefix}_{timestamp}.{fmt}" + (".gz" if compress else ""))
+
+    columns = [column.name for column in EXPORT_TABLES[table_name].columns]
+    started = time.monotonic()
+    total_rows = 0
+
+    opener = gzip.open if compress else open
+    fh = await asyncio.to_thread(opener, output_path, "wt", encoding="utf-8", newline="")
+
+    try:
+        if fmt == "csv":
+            await asyncio.to_thread(_write_chunk, fh, fmt, columns, [columns])
+
+        # Форматирование и запись идут в потоке, чтобы не блокировать event loop
+        async for rows in iter_chunks(table_name, chunk_size):
+            await asyncio.to_thread(_write_chunk, fh, fmt, columns, rows)
+            total_rows += len(rows)
+    finally:
+        await asyncio.to_thread(fh.close)
+
+    elapsed = time.monotonic() - started
+    logging.info(f"Выгрузка {table_name} завершена: {total_rows} строк за {elapsed:.1f} с -> {output_path}")
+
+    return {
+        "path": output_path,
+        "rows": total_rows,
+        "seconds": elapsed,
+        "size": os.path.getsize(output_path)
+    }
@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STATE_TTLS, FSM_DEFAULT_TTL, FSM_MAX_ENTRIES
+from services.metrics import FSM_OPERATIONS, FSM_ENTRIES, FSM_EVICTIONS, add_update_stat
+from services.structured_logging import parse_rules
+
+
+class InstrumentedStorage(BaseStorage):
+    """Обёртка над хранилищем FSM, которая замеряет каждую операцию"""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    @staticmethod
+    def _observe(operation: str, elapsed: float):
+        FSM_OPERATIONS.observe(elapsed, operation)
+        add_update_stat("fsm", elapsed)
+
+    async def set_state(self, key: StorageKey, state: Optional[str | State] = None) -> None:
+        started = time.perf_counter()
+        try:
+            await self.storage.set_state(key, state)
+        finally:
+            self._observe("set_state", time.perf_counter() - started)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_state(key)
+        finally:
+            self._observe("get_state", time.perf_counter() - started)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await self.storage.set_data(key, data)
+        finally:
+            self._observe("set_data", time.perf_counter() - started)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_data(key)
+        finally:
+            self._observe("get_data", time.perf_counter() - started)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+class ExpiringStorage(BaseStorage):
+    """
+    Обёртка над хранилищем FSM, которая удаляет брошенные состояния
+
+    Пользователь, начавший /test или /upload и ушедший, иначе держит своё
+    состояние и данные в памяти навсегда. Срок записи зависит от состояния
+    (state_ttls: «Группа:состояние» или «Группа» -> секунды, иначе default_ttl)
+    и отсчитывается от последнего изменения. Сроки лежат в куче, поэтому
+    каждая операция снимает только уже истёкшие записи, без обхода всех.
+    Сверх max_entries записей вытесняется та, к которой дольше всего не
+    обращались. Удаления считаются в bot_fsm_evictions_total по причине
+    (ttl или lru) и состоянию.
+    """
+
+    def __init__(self, storage: BaseStorage, state_ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = FSM_DEFAULT_TTL, max_entries: int = FSM_MAX_ENTRIES):
+        self.storage = storage
+        self.state_ttls = parse_rules(FSM_STATE_TTLS) if state_ttls is None else state_ttls
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        # Ключ -> [срок, состояние, есть ли данные], от давно не использованных к недавним
+        self._entries: "OrderedDict[StorageKey, List[Any]]" = OrderedDict()
+        # Сроки с ленивым удалением: запись из кучи действительна, только если совпадает срок
+        self._heap: List[Tuple[float, int, StorageKey]] = []
+        self._sequence = itertools.count()
+        # MemoryStorage создаёт запись при любом чтении, поэтому чтение чужих ключей до неё не доходит
+        self._memory = isinstance(storage, MemoryStorage)
+
+        FSM_ENTRIES.set_function(lambda: len(self._entries))
+
+    def ttl(self, state: Optional[str]) -> float:
+        if state is None:
+            return self.default_ttl
+        if state in self.state_ttls:
+            return self.state_ttls[state]
+        return self.state_ttls.get(state.split(":", 1)[0], self.default_ttl)
+
+    async def _drop(self, key: StorageKey):
+        if self._memory:
+            self.storage.storage.pop(key, None)
+        else:
+            await self.storage.set_state(key, None)
+            await self.storage.set_data(key, {})
+
+    async def _evict(self, key: StorageKey, policy: str):
+        _, state, _ = self._entries.pop(key)
+        await self._drop(key)
+        FSM_EVICTIONS.inc(policy, state or "none")
+
+    async def _expire(self):
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expires_at:
+                await self._evict(key, "ttl")
+
+    async def _touch(self, key: StorageKey, state: Optional[str], has_data: bool):
+        if state is None and not has_data:
+            # Состояние сброшено — запись больше не нужна
+            if self._entries.pop(key, None) is not None and self._memory:
+                self.storage.storage.pop(key, None)
+            return
+
+        expires_at = time.monotonic() + self.ttl(state)
+        self._entries[key] = [expires_at, state, has_data]
+        self._entries.move_to_end(key)
+        heapq.heappush(self._heap, (expires_at, next(self._sequence), key))
+
+        # Устаревшие сроки копятся в куче при каждом изменении — иногда пересобираем её
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = [
+                (entry[0], next(self._sequence), entry_key) for entry_key, entry in self._entries.items()
+            ]
+            heapq.heapify(self._heap)
+
+        while len(self._entries) > self.max_entries:
+            await self._evict(next(iter(self._entries)), "lru")
+
+    def _tracked(self, key: StorageKey) -> bool:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return True
+        return not self._memory
+
+    async def set_state(self, key: StorageKey, state: Optional[str | State] = None) -> None:
+        await self._expire()
+        await self.storage.set_state(key, state)
+        entry = self._entries.get(key)
+        await self._touch(key, state.state if isinstance(state, State) else state, bool(entry and entry[2]))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        await self._expire()
+        if not self._tracked(key):
+            return None
+        return await self.storage.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._expire()
+        await self.storage.set_data(key, data)
+        entry = self._entries.get(key)
+        if entry is None and not data:
+            if self._memory:
+                self.storage.storage.pop(key, None)
+            return
+        await self._touch(key, entry[1] if entry else await self.storage.get_state(key), bool(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        await self._expire()
+        if not self._tracked(key):
+            return {}
+        return await self.storage.get_data(key)
+
+    async def close(self) -> None:
+        await self.storage.close()
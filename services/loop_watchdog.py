@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import List, Optional, Tuple
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from services.metrics import LOOP_LAG, LOOP_STALLS, LOOP_STALL_DURATION
+from services.profiler import PROJECT_ROOT, describe_code
+
+# Сколько кадров стека писать в журнал о блокировке
+STACK_DEPTH = 12
+
+_watchdog: Optional["LoopWatchdog"] = None
+
+
+def code_source(code: CodeType) -> Optional[str]:
+    """Модуль и функция бота (services.virus_total.lookup_hash) или None для чужого кода"""
+    path = code.co_filename
+    if not path.startswith(PROJECT_ROOT) or "site-packages" in path:
+        return None
+    module = os.path.splitext(os.path.relpath(path, PROJECT_ROOT))[0].replace(os.sep, ".")
+    return f"{module}.{code.co_name}"
+
+
+def attribute(stack: List[CodeType]) -> Tuple[str, Optional[str]]:
+    """
+    Кому приписать блокировку: ближайшая к вершине стека функция бота и обработчик
+
+    stack идёт от выполняемого кадра к внешним. Если кода бота в стеке нет
+    (например, блокирует сам aiogram), источник — выполняемая функция.
+    """
+    source = None
+    handler = None
+    for code in stack:
+        name = code_source(code)
+        if name is None:
+            continue
+        if source is None:
+            source = name
+        if name.startswith("handlers."):
+            handler = name
+            break
+    return source or describe_code(stack[0]), handler
+
+
+class LoopWatchdog:
+    """
+    Следит за задержкой event loop и находит код, который его блокирует
+
+    Задача в event loop просыпается раз в interval секунд: насколько позже
+    срока она проснулась — это задержка loop, она пишется в гистограмму
+    bot_event_loop_lag_seconds. Отдельный поток смотрит, когда задача
+    просыпалась последний раз; если дольше threshold, loop занят синхронным
+    кодом, и поток снимает стек потока loop — в нём и есть виноватая функция.
+    Когда loop освобождается, блокировка приписывается функции бота,
+    чаще всего встречавшейся в снятых стеках, и попадает в метрики и журнал.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._samples: List[List[CodeType]] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+
+            lag = max(0.0, now - expected)
+            LOOP_LAG.observe(lag)
+
+            with self._lock:
+                samples, self._samples = self._samples, []
+            if lag >= self.threshold and samples:
+                self._report(lag, samples)
+
+    def _watch(self):
+        # Проверяем чаще порога, чтобы застать даже короткую блокировку
+        period = max(self.threshold / 2, 0.005)
+        while not self._stopped.wait(period):
+            if time.monotonic() - self._heartbeat < self.interval + self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                with self._lock:
+                    self._samples.append(stack)
+
+    def _report(self, lag: float, samples: List[List[CodeType]]):
+        attributed = Counter(attribute(stack) for stack in samples)
+        (source, handler), hits = attributed.most_common(1)[0]
+        example = next(stack for stack in samples if attribute(stack) == (source, handler))
+
+        LOOP_STALLS.inc(source)
+        LOOP_STALL_DURATION.observe(lag, source)
+        logging.warning(
+            f"Event loop заблокирован на {lag * 1000:.0f} мс: {source}",
+            extra={
+                "stall_source": source,
+                "stall_handler": handler,
+                "stall_samples": f"{hits}/{len(samples)}",
+                "stall_stack": [describe_code(code) for code in example[:STACK_DEPTH]],
+            }
+        )
+
+
+def start_watchdog():
+    """Запускает наблюдение за event loop (LOOP_LAG_THRESHOLD=0 — не запускать)"""
+    global _watchdog
+    if _watchdog is None and LOOP_LAG_THRESHOLD > 0:
+        _watchdog = LoopWatchdog()
+        _watchdog.start()
+
+
+async def stop_watchdog():
+    global _watchdog
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog = None
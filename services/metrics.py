@@ -0,0 +1,288 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple, Callable, Iterator, Any, Optional
+
+from aiohttp import web
+from sqlalchemy import event
+
+# Границы корзин гистограмм задержки, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["Metric"] = []
+
+# Разбивка времени текущего обновления по БД, внешним API и FSM.
+# Заполняется, только если middleware положил сюда словарь (профилировщик, бенчмарки).
+update_stats: ContextVar[Optional[Dict[str, float]]] = ContextVar("update_stats", default=None)
+
+
+def add_update_stat(kind: str, seconds: float):
+    stats = update_stats.get()
+    if stats is not None:
+        stats[f"{kind}_count"] = stats.get(f"{kind}_count", 0) + 1
+        stats[f"{kind}_seconds"] = stats.get(f"{kind}_seconds", 0.0) + seconds
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """
+    Базовый класс метрики
+
+    Значения пишутся в шард текущего потока без блокировок: каждый поток
+    изменяет только свой словарь, а суммирование шардов происходит только
+    при чтении метрик. Блокировка берётся один раз — при создании шарда потока.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+        self._shards_lock = threading.Lock()
+        _registry.append(self)
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _format_labels(self, labels: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def collect(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.collect())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, *labels: str, value: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def _values(self) -> Dict[Tuple[str, ...], float]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for shard in list(self._shards):
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def collect(self) -> Iterator[str]:
+        for labels, value in sorted(self._values().items()):
+            yield f"{self.name}{self._format_labels(labels)} {value}"
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и убывать, либо вычисляться при чтении"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def dec(self, *labels: str, value: float = 1):
+        self.inc(*labels, value=-value)
+
+    def set_function(self, function: Callable[[], float], *labels: str):
+        self._functions[labels] = function
+
+    def _values(self) -> Dict[Tuple[str, ...], float]:
+        totals = super()._values()
+        for labels, function in list(self._functions.items()):
+            try:
+                totals[labels] = function()
+            except Exception as e:
+                logging.warning(f"Не удалось вычислить метрику {self.name}: {e}")
+        return totals
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # Счётчики корзин (последняя — +Inf) и сумма наблюдений
+            series = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _values(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        totals: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        for shard in list(self._shards):
+            for labels, (counts, total) in list(shard.items()):
+                merged_counts, merged_total = totals.get(labels, ([0] * len(counts), 0.0))
+                totals[labels] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+        return totals
+
+    def collect(self) -> Iterator[str]:
+        for labels, (counts, total) in sorted(self._values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{self._format_labels(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(labels)} {total}"
+            yield f"{self.name}_count{self._format_labels(labels)} {cumulative}"
+
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_latency_seconds", "Время работы обработчика", ("handler",)
+)
+HANDLER_UPDATES = Counter(
+    "bot_handler_updates_total", "Обработанные события по обработчикам", ("handler", "event", "result")
+)
+EXTERNAL_REQUEST_LATENCY = Histogram(
+    "bot_external_request_seconds", "Запросы к внешним API", ("service", "endpoint", "status")
+)
+DB_QUERY_LATENCY = Histogram(
+    "bot_db_query_seconds", "Запросы к базе данных", ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+DB_ERRORS = Counter("bot_db_errors_total", "Ошибки запросов к базе данных", ("operation",))
+FSM_OPERATIONS = Histogram(
+    "bot_fsm_operation_seconds", "Операции хранилища FSM", ("operation",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+FSM_ENTRIES = Gauge("bot_fsm_entries", "Пользователи с состоянием или данными FSM в памяти")
+FSM_EVICTIONS = Counter("bot_fsm_evictions_total", "Записи FSM, удалённые по сроку или лимиту", ("policy", "state"))
+ACTIVE_SCANS = Gauge("bot_active_scans", "Файлы, которые сейчас проверяются")
+PENDING_ANALYSES = Gauge("bot_pending_analyses", "Анализы VirusTotal, ожидающие результата")
+ANALYSIS_POLLS = Counter("bot_analysis_polls_total", "Опросы результатов анализа VirusTotal", ("status",))
+CIRCUIT_BREAKER_STATE = Gauge(
+    "bot_circuit_breaker_state", "Состояние размыкателя цепи: 0 — замкнута, 1 — пробный запрос, 2 — разомкнута",
+    ("service", "endpoint")
+)
+EXTERNAL_RETRIES_TOTAL = Counter(
+    "bot_external_retries_total", "Повторные запросы к внешним API", ("service", "endpoint", "reason")
+)
+HEDGED_REQUESTS = Counter(
+    "bot_hedged_requests_total", "Продублированные медленные запросы к внешним API", ("service", "endpoint")
+)
+SCHEDULER_QUEUED = Gauge("bot_scheduler_queued_updates", "Обновления, ожидающие своей очереди")
+SCHEDULER_IN_FLIGHT = Gauge("bot_scheduler_in_flight", "Обработчики, которые сейчас выполняются")
+SCHEDULER_MAX_USER_QUEUE = Gauge("bot_scheduler_max_user_queue", "Самая длинная очередь одного пользователя")
+SCHEDULER_WAIT = Histogram("bot_scheduler_wait_seconds", "Ожидание обновления в очереди планировщика")
+SCHEDULER_SHED = Counter("bot_scheduler_shed_total", "Обновления, отброшенные планировщиком", ("reason",))
+THROTTLED_UPDATES = Counter("bot_throttled_updates_total", "Команды, отклонённые ограничением частоты", ("handler",))
+THROTTLE_TRACKED_USERS = Gauge("bot_throttle_tracked_users", "Пользователи с неполным запасом запросов")
+LOG_DROPPED = Counter("bot_log_dropped_total", "Записи журнала, отброшенные лимитами", ("source", "reason"))
+RETENTION_ROWS = Counter("bot_retention_rows_total", "Записи, свёрнутые в дневные итоги", ("table",))
+RETENTION_RECLAIMED = Counter("bot_retention_reclaimed_bytes_total", "Место, возвращённое файловой системе")
+LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds", "Насколько позже срока просыпается event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = Counter("bot_event_loop_stalls_total", "Блокировки event loop синхронным кодом", ("source",))
+LOOP_STALL_DURATION = Histogram(
+    "bot_event_loop_stall_seconds", "Длительность блокировок event loop", ("source",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+RETENTION_DURATION = Histogram(
+    "bot_retention_run_seconds", "Длительность обслуживания базы", buckets=(1, 5, 15, 60, 300, 900, 3600)
+)
+
+
+@asynccontextmanager
+async def track_request(service: str, endpoint: str):
+    """
+    Замеряет запрос к внешнему API
+
+    Код статуса записывается в переданный словарь: request["status"] = response.status.
+    Если запрос завершился исключением, статусом становится имя исключения.
+    """
+    request = {"status": "unknown"}
+    started = time.perf_counter()
+    try:
+        yield request
+    except BaseException as e:
+        request["status"] = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        EXTERNAL_REQUEST_LATENCY.observe(elapsed, service, endpoint, str(request["status"]))
+        add_update_stat("external", elapsed)
+
+
+def _statement_operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+
+
+def instrument_engine(engine):
+    """Подписывается на события SQLAlchemy, чтобы считать запросы и их время"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_LATENCY.observe(elapsed, _statement_operation(statement))
+        add_update_stat("db", elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.inc(_statement_operation(context.statement or ""))
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in list(_registry)) + "\n"
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
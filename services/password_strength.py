@@ -0,0 +1,745 @@
+import glob
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import zlib
+from datetime import date
+from itertools import islice, product
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import PASSWORD_DICTIONARY_DIR
+
+# Длинные пароли обрезаем: оценка растёт квадратично от длины
+MAX_PASSWORD_LENGTH = 64
+MIN_WORD_LENGTH = 3
+
+MAGIC = b"PWD2"
+# magic, число слотов, число записей, длина самого длинного слова в символах, размер списка словарей
+HEADER = struct.Struct("<4sIIII")
+SLOT = struct.Struct("<I")
+# ранг (0 — только префикс слова), номер словаря и длина в байтах, за ними слово в UTF-8
+ENTRY = struct.Struct("<IBB")
+COMPILED_NAME = "dictionaries.bin"
+
+BRUTEFORCE_CARDINALITY = 10
+MIN_GUESSES_BEFORE_GROWING_SEQUENCE = 10000
+MIN_SUBMATCH_GUESSES_SINGLE_CHAR = 10
+MIN_SUBMATCH_GUESSES_MULTI_CHAR = 50
+MIN_YEAR_SPACE = 20
+REFERENCE_YEAR = date.today().year
+DATE_MIN_YEAR = 1000
+DATE_MAX_YEAR = 2050
+MAX_SEQUENCE_DELTA = 5
+MAX_L33T_VARIANTS = 16
+
+L33T_TABLE = {
+    "a": "4@", "b": "8", "c": "({[<", "e": "3", "g": "69", "i": "1!|",
+    "l": "1|7", "o": "0", "s": "$5", "t": "+7", "x": "%", "z": "2",
+}
+L33T_CHARS: Dict[str, List[str]] = {}
+for _letter, _subs in L33T_TABLE.items():
+    for _sub in _subs:
+        L33T_CHARS.setdefault(_sub, []).append(_letter)
+
+# Русское слово, набранное в английской раскладке, и наоборот: gfhjkm — «пароль»
+_EN_LAYOUT = "qwertyuiop[]asdfghjkl;'zxcvbnm,.`"
+_RU_LAYOUT = "йцукенгшщзхъфывапролджэячсмитьбюё"
+LAYOUT_SWAPS = (str.maketrans(_EN_LAYOUT, _RU_LAYOUT), str.maketrans(_RU_LAYOUT, _EN_LAYOUT))
+
+# Последовательность «число-месяц-год» без разделителей: где разрезать строку цифр
+DATE_SPLITS = {
+    4: ((1, 2), (2, 3)),
+    5: ((1, 3), (2, 3)),
+    6: ((1, 2), (2, 4), (4, 5)),
+    7: ((1, 3), (2, 3), (4, 5), (4, 6)),
+    8: ((2, 4), (4, 6)),
+}
+DATE_WITH_SEPARATOR = re.compile(r"(\d{1,4})([\s/\\_.-])(\d{1,2})\2(\d{1,4})")
+YEAR = re.compile(r"19\d\d|20\d\d")
+REPEAT_GREEDY = re.compile(r"(.+)\1+", re.S)
+REPEAT_LAZY = re.compile(r"(.+?)\1+", re.S)
+REPEAT_LAZY_ANCHORED = re.compile(r"^(.+?)\1+$", re.S)
+
+SCORE_THRESHOLDS = (1e3, 1e6, 1e8, 1e10)
+SCORE_LABELS = ("очень слабый", "слабый", "средний", "хороший", "надёжный")
+
+# Скорость перебора: попыток в секунду
+ATTACK_SCENARIOS = (
+    ("online_throttled", "Онлайн-подбор с ограничением попыток", 100 / 3600),
+    ("online", "Онлайн-подбор без ограничений", 10),
+    ("offline_slow", "Офлайн, медленный хеш (bcrypt)", 1e4),
+    ("offline_fast", "Офлайн, быстрый хеш (MD5, SHA-1)", 1e10),
+)
+
+
+def _slanted_graph(rows: List[str], shifted_rows: List[str]) -> Dict[str, List[Optional[str]]]:
+    # Каждый ряд клавиатуры сдвинут на полклавиши: у клавиши шесть соседей
+    positions = {}
+    for y, (row, shifted) in enumerate(zip(rows, shifted_rows)):
+        offset = 0 if y == 0 else 1
+        for x, (key, shifted_key) in enumerate(zip(row, shifted)):
+            positions[(offset + x, y)] = key + shifted_key
+
+    return {
+        key: [positions.get((x + dx, y + dy)) for dx, dy in ((-1, 0), (0, -1), (1, -1), (1, 0), (0, 1), (-1, 1))]
+        for (x, y), key in positions.items()
+    }
+
+
+def _aligned_graph(rows: List[str]) -> Dict[str, List[Optional[str]]]:
+    positions = {
+        (x, y): key for y, row in enumerate(rows) for x, key in enumerate(row) if key != " "
+    }
+    directions = ((-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1))
+    return {
+        key: [positions.get((x + dx, y + dy)) for dx, dy in directions]
+        for (x, y), key in positions.items()
+    }
+
+
+GRAPHS = {
+    "qwerty": _slanted_graph(
+        ["`1234567890-=", "qwertyuiop[]\\", "asdfghjkl;'", "zxcvbnm,./"],
+        ["~!@#$%^&*()_+", "QWERTYUIOP{}|", 'ASDFGHJKL:"', "ZXCVBNM<>?"]
+    ),
+    "jcuken": _slanted_graph(
+        ["ё1234567890-=", "йцукенгшщзхъ\\", "фывапролджэ", "ячсмитьбю."],
+        ['Ё!"№;%:?*()_+', "ЙЦУКЕНГШЩЗХЪ/", "ФЫВАПРОЛДЖЭ", "ЯЧСМИТЬБЮ,"]
+    ),
+    "keypad": _aligned_graph([" /*-", "789+", "456 ", "123 ", " 0. "]),
+}
+# Клавиша графа по символу: у клавиш основной клавиатуры два символа, второй — с Shift
+GRAPH_KEYS = {name: {char: key for key in graph for char in key} for name, graph in GRAPHS.items()}
+GRAPH_STATS = {
+    name: (len(graph), sum(sum(1 for n in neighbors if n) for neighbors in graph.values()) / len(graph))
+    for name, graph in GRAPHS.items()
+}
+
+
+class CompiledDictionaries:
+    """
+    Словари паролей, открытые через mmap
+
+    Все словари собраны в одну хеш-таблицу с открытой адресацией: слот по
+    crc32 слова хранит смещение записи (ранг, номер словаря, слово в UTF-8).
+    Для слова, которое есть в нескольких словарях, хранится лучший ранг.
+    В таблицу также записаны префиксы слов, поэтому перебор подстрок пароля
+    обрывается, как только префикс не найден, — как при обходе префиксного дерева.
+    Поиск читает несколько байт из отображённой памяти, так что словари любого
+    размера открываются мгновенно и не копируются в память процесса.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, slots, self.count, self.max_length, names_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: неизвестный формат словаря")
+        self.names = self._mm[HEADER.size:HEADER.size + names_size].decode("utf-8").split("\n")
+        self._table = HEADER.size + names_size
+        self._mask = slots - 1
+
+    def lookup(self, word: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns:
+            Ранг и номер словаря (ранг 0 — слова нет, но оно продолжается) или None
+        """
+        data = word.encode("utf-8")
+        mm = self._mm
+        index = zlib.crc32(data) & self._mask
+        while True:
+            offset = SLOT.unpack_from(mm, self._table + SLOT.size * index)[0]
+            if not offset:
+                return None
+            rank, dictionary, length = ENTRY.unpack_from(mm, offset)
+            if length == len(data) and mm[offset + ENTRY.size:offset + ENTRY.size + length] == data:
+                return rank, dictionary
+            index = (index + 1) & self._mask
+
+
+def compile_dictionaries(sources: List[str], target: str) -> int:
+    """
+    Собирает словари из текстовых файлов: одно слово в строке, частые — выше
+
+    Returns:
+        Количество слов
+    """
+    names = [os.path.splitext(os.path.basename(source))[0] for source in sources]
+    # слово -> (ранг, номер словаря); ранг 0 — префикс
+    entries: Dict[str, Tuple[int, int]] = {}
+
+    for number, source in enumerate(sources):
+        rank = 0
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                word = line.strip().lower()
+                if not word or word.startswith("#") or len(word.encode("utf-8")) > 255:
+                    continue
+                rank += 1
+                current = entries.get(word)
+                if current is None or current[0] == 0 or rank < current[0]:
+                    entries[word] = (rank, number)
+                for end in range(MIN_WORD_LENGTH, len(word)):
+                    entries.setdefault(word[:end], (0, number))
+
+    # Таблица заполнена не больше чем наполовину — цепочки проб короткие
+    slots = 1 << max(4, (2 * len(entries)).bit_length())
+    mask = slots - 1
+    table = [0] * slots
+    names_blob = "\n".join(names).encode("utf-8")
+    records = bytearray()
+    base = HEADER.size + len(names_blob) + SLOT.size * slots
+
+    for word, (rank, number) in entries.items():
+        data = word.encode("utf-8")
+        index = zlib.crc32(data) & mask
+        while table[index]:
+            index = (index + 1) & mask
+        table[index] = base + len(records)
+        records += ENTRY.pack(rank, number, len(data)) + data
+
+    words = sum(1 for rank, _ in entries.values() if rank)
+    max_length = max((len(word) for word in entries), default=0)
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, slots, len(entries), max_length, len(names_blob)))
+        f.write(names_blob)
+        f.write(struct.pack(f"<{slots}I", *table))
+        f.write(records)
+    os.replace(tmp_path, target)
+    return words
+
+
+_dictionaries: Optional[CompiledDictionaries] = None
+
+
+def load_dictionaries(directory: str = PASSWORD_DICTIONARY_DIR) -> Optional[CompiledDictionaries]:
+    """
+    Открывает словари из каталога, пересобирая их при изменении
+
+    Все <имя>.txt компилируются в один dictionaries.bin, если его нет или он
+    старше какого-либо исходника. Имя файла становится именем словаря.
+    """
+    global _dictionaries
+    if _dictionaries is not None:
+        return _dictionaries
+
+    sources = sorted(glob.glob(os.path.join(directory, "*.txt")))
+    target = os.path.join(directory, COMPILED_NAME)
+    try:
+        if sources and (
+            not os.path.exists(target)
+            or os.path.getmtime(target) < max(os.path.getmtime(source) for source in sources)
+        ):
+            words = compile_dictionaries(sources, target)
+            logging.info(f"Словари паролей собраны: {words} слов")
+        _dictionaries = CompiledDictionaries(target)
+        if _dictionaries.names != [os.path.splitext(os.path.basename(source))[0] for source in sources]:
+            # Словарь удалили или переименовали — mtime этого не покажет
+            compile_dictionaries(sources, target)
+            _dictionaries = CompiledDictionaries(target)
+    except (OSError, ValueError) as e:
+        logging.error(f"Не удалось загрузить словари паролей: {e}")
+    return _dictionaries
+
+
+def _dictionary_matches(password: str, dictionaries: CompiledDictionaries) -> List[Dict[str, Any]]:
+    matches = []
+    n = len(password)
+    lower = password.lower()
+    lookup = dictionaries.lookup
+    names = dictionaries.names
+
+    for i in range(n - MIN_WORD_LENGTH + 1):
+        for j in range(i + MIN_WORD_LENGTH - 1, min(n, i + dictionaries.max_length)):
+            word = lower[i:j + 1]
+            found = lookup(word)
+            if found is None:
+                break
+            rank, number = found
+            if rank:
+                matches.append({
+                    "pattern": "dictionary", "i": i, "j": j, "token": password[i:j + 1],
+                    "matched_word": word, "rank": rank, "dictionary": names[number],
+                    "reversed": False, "l33t": False, "layout": False,
+                })
+    return matches
+
+
+def _reversed_matches(password: str, dictionaries: CompiledDictionaries) -> List[Dict[str, Any]]:
+    n = len(password)
+    matches = []
+    for match in _dictionary_matches(password[::-1], dictionaries):
+        if match["matched_word"] == match["matched_word"][::-1]:
+            # Палиндромы уже найдены прямым поиском
+            continue
+        match.update(
+            token=match["token"][::-1], reversed=True,
+            i=n - 1 - match["j"], j=n - 1 - match["i"]
+        )
+        matches.append(match)
+    return matches
+
+
+def _l33t_matches(password: str, dictionaries: CompiledDictionaries) -> List[Dict[str, Any]]:
+    present = [char for char in dict.fromkeys(password) if char in L33T_CHARS]
+    if not present:
+        return []
+
+    matches = []
+    seen = set()
+    # У символа может быть несколько значений (1 — i или l): перебираем сочетания
+    for letters in islice(product(*(L33T_CHARS[char] for char in present)), MAX_L33T_VARIANTS):
+        sub = dict(zip(present, letters))
+        translated = password.translate(str.maketrans(sub))
+        for match in _dictionary_matches(translated, dictionaries):
+            token = password[match["i"]:match["j"] + 1]
+            used = {char: letter for char, letter in sub.items() if char in token}
+            key = (match["i"], match["j"], match["dictionary"], match["matched_word"])
+            # Одиночный символ — не замена, а случайное совпадение
+            if not used or len(token) == 1 or key in seen:
+                continue
+            seen.add(key)
+            match.update(token=token, l33t=True, sub=used)
+            matches.append(match)
+    return matches
+
+
+def _layout_matches(password: str, dictionaries: CompiledDictionaries) -> List[Dict[str, Any]]:
+    lower = password.lower()
+    matches = []
+    for table in LAYOUT_SWAPS:
+        swapped = lower.translate(table)
+        if swapped == lower:
+            continue
+        for match in _dictionary_matches(swapped, dictionaries):
+            token = password[match["i"]:match["j"] + 1]
+            if token.lower() == match["matched_word"]:
+                continue
+            match.update(token=token, layout=True)
+            matches.append(match)
+    return matches
+
+
+def _spatial_matches(password: str) -> List[Dict[str, Any]]:
+    matches = []
+    n = len(password)
+
+    for name, graph in GRAPHS.items():
+        keys = GRAPH_KEYS[name]
+        i = 0
+        while i < n - 1:
+            j = i + 1
+            last_direction = None
+            turns = 0
+            key = keys.get(password[i])
+            shifted_count = 1 if name != "keypad" and key and len(key) > 1 and password[i] == key[1] else 0
+
+            while True:
+                found = False
+                if j < n and key is not None:
+                    char = password[j]
+                    for direction, neighbor in enumerate(graph[key]):
+                        if neighbor and char in neighbor:
+                            found = True
+                            if name != "keypad" and neighbor.index(char) == 1:
+                                shifted_count += 1
+                            if last_direction != direction:
+                                turns += 1
+                                last_direction = direction
+                            key = neighbor
+                            break
+
+                if found:
+                    j += 1
+                    continue
+
+                if j - i > 2:
+                    matches.append({
+                        "pattern": "spatial", "i": i, "j": j - 1, "token": password[i:j],
+                        "graph": name, "turns": turns, "shifted_count": shifted_count,
+                    })
+                i = j
+                break
+
+    return matches
+
+
+def _repeat_matches(password: str) -> List[Dict[str, Any]]:
+    matches = []
+    last = 0
+    while last < len(password):
+        greedy = REPEAT_GREEDY.search(password, last)
+        if not greedy:
+            break
+        lazy = REPEAT_LAZY.search(password, last)
+
+        if len(greedy.group(0)) > len(lazy.group(0)):
+            # aabaab: жадный поиск находит aab повторённое дважды
+            match = greedy
+            base = REPEAT_LAZY_ANCHORED.match(greedy.group(0)).group(1)
+        else:
+            match = lazy
+            base = lazy.group(1)
+
+        matches.append({
+            "pattern": "repeat", "i": match.start(), "j": match.end() - 1, "token": match.group(0),
+            "base_token": base, "base_guesses": _most_guessable(base)["guesses"],
+            "repeat_count": len(match.group(0)) // len(base),
+        })
+        last = match.end()
+    return matches
+
+
+def _sequence_matches(password: str) -> List[Dict[str, Any]]:
+    matches = []
+    n = len(password)
+    if n == 1:
+        return matches
+
+    def update(i: int, j: int, delta: int):
+        if (j - i > 1 or abs(delta) == 1) and 0 < abs(delta) <= MAX_SEQUENCE_DELTA:
+            matches.append({
+                "pattern": "sequence", "i": i, "j": j, "token": password[i:j + 1], "ascending": delta > 0,
+            })
+
+    i = 0
+    last_delta = None
+    for k in range(1, n):
+        delta = ord(password[k]) - ord(password[k - 1])
+        if last_delta is None:
+            last_delta = delta
+        if delta == last_delta:
+            continue
+        update(i, k - 1, last_delta)
+        i = k - 1
+        last_delta = delta
+    update(i, n - 1, last_delta)
+    return matches
+
+
+def _two_to_four(year: int) -> int:
+    if year > 99:
+        return year
+    return year + 1900 if year > 50 else year + 2000
+
+
+def _map_ints_to_dmy(ints: List[int]) -> Optional[Dict[str, int]]:
+    if ints[1] > 31 or ints[1] <= 0:
+        return None
+
+    over_12 = over_31 = under_1 = 0
+    for value in ints:
+        if 99 < value < DATE_MIN_YEAR or value > DATE_MAX_YEAR:
+            return None
+        over_31 += value > 31
+        over_12 += value > 12
+        under_1 += value <= 0
+    if over_31 >= 2 or over_12 == 3 or under_1 >= 2:
+        return None
+
+    def day_month(pair: List[int]) -> Optional[Dict[str, int]]:
+        for day, month in (pair, pair[::-1]):
+            if 1 <= day <= 31 and 1 <= month <= 12:
+                return {"day": day, "month": month}
+        return None
+
+    splits = ((ints[2], ints[:2]), (ints[0], ints[1:]))
+    for year, rest in splits:
+        if DATE_MIN_YEAR <= year <= DATE_MAX_YEAR:
+            dm = day_month(rest)
+            return {"year": year, **dm} if dm else None
+    for year, rest in splits:
+        dm = day_month(rest)
+        if dm:
+            return {"year": _two_to_four(year), **dm}
+    return None
+
+
+def _date_matches(password: str) -> List[Dict[str, Any]]:
+    matches = []
+    n = len(password)
+
+    for i in range(n - 3):
+        for j in range(i + 3, min(n, i + 8)):
+            token = password[i:j + 1]
+            if not token.isdigit() or not token.isascii():
+                continue
+            candidates = [
+                dmy for k, l in DATE_SPLITS[len(token)]
+                if (dmy := _map_ints_to_dmy([int(token[:k]), int(token[k:l]), int(token[l:])]))
+            ]
+            if candidates:
+                best = min(candidates, key=lambda dmy: abs(dmy["year"] - REFERENCE_YEAR))
+                matches.append({"pattern": "date", "i": i, "j": j, "token": token, "separator": "", **best})
+
+    for found in DATE_WITH_SEPARATOR.finditer(password):
+        dmy = _map_ints_to_dmy([int(found.group(1)), int(found.group(3)), int(found.group(4))])
+        if dmy:
+            matches.append({
+                "pattern": "date", "i": found.start(), "j": found.end() - 1, "token": found.group(0),
+                "separator": found.group(2), **dmy,
+            })
+
+    for found in YEAR.finditer(password):
+        matches.append({
+            "pattern": "year", "i": found.start(), "j": found.end() - 1, "token": found.group(0),
+            "year": int(found.group(0)),
+        })
+    return matches
+
+
+def _omnimatch(password: str) -> List[Dict[str, Any]]:
+    matches = _spatial_matches(password) + _repeat_matches(password) + _sequence_matches(password) \
+        + _date_matches(password)
+    dictionaries = load_dictionaries()
+    if dictionaries is not None:
+        matches += _dictionary_matches(password, dictionaries) + _reversed_matches(password, dictionaries) \
+            + _l33t_matches(password, dictionaries) + _layout_matches(password, dictionaries)
+    return matches
+
+
+def _variations(count_a: int, count_b: int) -> int:
+    if count_a == 0 or count_b == 0:
+        return 2
+    return sum(math.comb(count_a + count_b, k) for k in range(1, min(count_a, count_b) + 1))
+
+
+def _uppercase_variations(token: str) -> int:
+    if token.islower() or not any(char.isalpha() for char in token):
+        return 1
+    # Заглавная первая или последняя буква и всё заглавными — самые частые варианты
+    if token[0].isupper() and token[1:].islower() or token[-1].isupper() and token[:-1].islower() or token.isupper():
+        return 2
+    upper = sum(1 for char in token if char.isupper())
+    lower = sum(1 for char in token if char.islower())
+    return _variations(upper, lower)
+
+
+def _l33t_variations(match: Dict[str, Any]) -> int:
+    if not match["l33t"]:
+        return 1
+    variations = 1
+    token = match["token"].lower()
+    for subbed, letter in match["sub"].items():
+        count_subbed = token.count(subbed)
+        count_letter = token.count(letter)
+        if count_letter == 0:
+            # Заменены все вхождения буквы — атакующему достаточно двух вариантов
+            variations *= 2
+        else:
+            variations *= _variations(count_subbed, count_letter)
+    return variations
+
+
+def _spatial_guesses(match: Dict[str, Any]) -> float:
+    starts, degree = GRAPH_STATS[match["graph"]]
+    length = len(match["token"])
+    turns = match["turns"]
+    guesses = 0
+    for i in range(2, length + 1):
+        for j in range(1, min(turns, i - 1) + 1):
+            guesses += math.comb(i - 1, j - 1) * starts * degree ** j
+
+    shifted = match["shifted_count"]
+    if shifted:
+        unshifted = length - shifted
+        guesses *= 2 if unshifted == 0 else _variations(shifted, unshifted)
+    return guesses
+
+
+def _estimate_guesses(match: Dict[str, Any], password_length: int) -> float:
+    if "guesses" in match:
+        return match["guesses"]
+
+    length = len(match["token"])
+    min_guesses = 1
+    if length < password_length:
+        min_guesses = MIN_SUBMATCH_GUESSES_SINGLE_CHAR if length == 1 else MIN_SUBMATCH_GUESSES_MULTI_CHAR
+
+    pattern = match["pattern"]
+    if pattern == "bruteforce":
+        guesses = max(BRUTEFORCE_CARDINALITY ** length, min_guesses + 1)
+    elif pattern == "dictionary":
+        guesses = match["rank"] * _uppercase_variations(match["token"]) * _l33t_variations(match)
+        if match["reversed"] or match["layout"]:
+            guesses *= 2
+    elif pattern == "spatial":
+        guesses = _spatial_guesses(match)
+    elif pattern == "repeat":
+        guesses = match["base_guesses"] * match["repeat_count"]
+    elif pattern == "sequence":
+        first = match["token"][0]
+        base = 4 if first in "aAzZ019" else 10 if first.isdigit() else 26
+        guesses = base * (1 if match["ascending"] else 2) * length
+    elif pattern == "year":
+        guesses = max(abs(match["year"] - REFERENCE_YEAR), MIN_YEAR_SPACE)
+    else:
+        guesses = max(abs(match["year"] - REFERENCE_YEAR), MIN_YEAR_SPACE) * 365
+        if match["separator"]:
+            guesses *= 4
+
+    match["guesses"] = max(guesses, min_guesses)
+    return match["guesses"]
+
+
+def _most_guessable(password: str, matches: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Ищет разбиение пароля на шаблоны с наименьшим числом попыток
+
+    Динамика по позициям: для каждой длины последовательности хранится лучший
+    вариант. Число попыток последовательности из l шаблонов —
+    l! * произведение попыток шаблонов + 10000^(l-1), как в zxcvbn.
+    """
+    n = len(password)
+    if n == 0:
+        return {"guesses": 1, "sequence": []}
+    if matches is None:
+        matches = _omnimatch(password)
+
+    by_end: List[List[Dict[str, Any]]] = [[] for _ in range(n)]
+    for match in matches:
+        by_end[match["j"]].append(match)
+
+    best_match: List[Dict[int, Dict[str, Any]]] = [{} for _ in range(n)]
+    best_pi: List[Dict[int, float]] = [{} for _ in range(n)]
+    best_g: List[Dict[int, float]] = [{} for _ in range(n)]
+
+    def update(match: Dict[str, Any], length: int):
+        k = match["j"]
+        pi = _estimate_guesses(match, n)
+        if length > 1:
+            pi *= best_pi[match["i"] - 1][length - 1]
+        g = math.factorial(length) * pi + MIN_GUESSES_BEFORE_GROWING_SEQUENCE ** (length - 1)
+        for other_length, other_g in best_g[k].items():
+            if other_length <= length and other_g <= g:
+                return
+        best_g[k][length] = g
+        best_match[k][length] = match
+        best_pi[k][length] = pi
+
+    def bruteforce(i: int, j: int) -> Dict[str, Any]:
+        return {"pattern": "bruteforce", "i": i, "j": j, "token": password[i:j + 1]}
+
+    for k in range(n):
+        for match in by_end[k]:
+            if match["i"] > 0:
+                for length in list(best_match[match["i"] - 1]):
+                    update(match, length + 1)
+            else:
+                update(match, 1)
+
+        update(bruteforce(0, k), 1)
+        for i in range(1, k + 1):
+            # Два перебора подряд выгоднее объединить в один
+            lengths = [length for length, last in best_match[i - 1].items() if last["pattern"] != "bruteforce"]
+            if lengths:
+                match = bruteforce(i, k)
+                for length in lengths:
+                    update(match, length + 1)
+
+    length = min(best_g[n - 1], key=best_g[n - 1].get)
+    guesses = best_g[n - 1][length]
+    sequence = []
+    k = n - 1
+    while k >= 0:
+        match = best_match[k][length]
+        sequence.append(match)
+        k = match["i"] - 1
+        length -= 1
+    sequence.reverse()
+    return {"guesses": guesses, "sequence": sequence}
+
+
+def _warnings(sequence: List[Dict[str, Any]], score: int) -> List[str]:
+    warnings = []
+    for match in sequence:
+        pattern = match["pattern"]
+        if pattern == "dictionary":
+            if match["dictionary"] == "passwords" and match["rank"] <= 100:
+                warnings.append("Это один из самых популярных паролей")
+            elif match["dictionary"] == "passwords":
+                warnings.append("Пароль похож на часто используемые")
+            elif match["dictionary"] == "names":
+                warnings.append("Имена и фамилии легко угадать")
+            else:
+                warnings.append("Словарные слова подбираются за секунды")
+            if match["l33t"]:
+                warnings.append("Замены вроде @ вместо a атакующим хорошо известны")
+            if match["reversed"]:
+                warnings.append("Слова задом наперёд угадываются почти так же легко")
+            if match["layout"]:
+                warnings.append("Слово в другой раскладке — известный приём")
+        elif pattern == "spatial":
+            warnings.append("Ряды соседних клавиш вроде qwerty легко угадать")
+        elif pattern == "repeat":
+            warnings.append("Повторы вроде aaa или abcabc почти не усложняют пароль")
+        elif pattern == "sequence":
+            warnings.append("Последовательности вроде abc или 6543 легко угадать")
+        elif pattern in ("date", "year"):
+            warnings.append("Даты и годы, особенно связанные с вами, легко угадать")
+
+    if score < 3:
+        warnings.append("Добавьте ещё несколько слов: длинная фраза надёжнее сложных замен")
+    return list(dict.fromkeys(warnings))
+
+
+def estimate_strength(password: str) -> Dict[str, Any]:
+    """
+    Оценивает стойкость пароля к подбору без обращения к сети
+
+    Пароль разбирается на шаблоны (словарные слова, в том числе с заменами
+    символов, задом наперёд и в другой раскладке, ряды клавиш, повторы,
+    последовательности, даты) и ищется разбиение, которое атакующий угадает
+    быстрее всего.
+
+    Returns:
+        Dict с числом попыток, оценкой 0–4, временем подбора по сценариям атаки и советами
+    """
+    password = password[:MAX_PASSWORD_LENGTH]
+    result = _most_guessable(password)
+    guesses = result["guesses"]
+    score = sum(1 for threshold in SCORE_THRESHOLDS if guesses >= threshold + 5)
+
+    return {
+        "guesses": guesses,
+        "guesses_log10": math.log10(guesses),
+        "score": score,
+        "label": SCORE_LABELS[score],
+        "crack_times": {key: guesses / speed for key, _, speed in ATTACK_SCENARIOS},
+        "sequence": [
+            {key: match[key] for key in ("pattern", "token", "dictionary") if key in match}
+            for match in result["sequence"]
+        ],
+        "warnings": _warnings(result["sequence"], score),
+    }
+
+
+def _plural(value: int, one: str, few: str, many: str) -> str:
+    if value % 10 == 1 and value % 100 != 11:
+        return one
+    if 2 <= value % 10 <= 4 and not 12 <= value % 100 <= 14:
+        return few
+    return many
+
+
+def format_crack_time(seconds: float) -> str:
+    units = (
+        (60 * 60 * 24 * 365, ("год", "года", "лет")),
+        (60 * 60 * 24 * 30, ("месяц", "месяца", "месяцев")),
+        (60 * 60 * 24, ("день", "дня", "дней")),
+        (60 * 60, ("час", "часа", "часов")),
+        (60, ("минута", "минуты", "минут")),
+        (1, ("секунда", "секунды", "секунд")),
+    )
+    if seconds < 1:
+        return "мгновенно"
+    if seconds >= 100 * units[0][0]:
+        return "столетия"
+    for size, forms in units:
+        if seconds >= size:
+            value = round(seconds / size)
+            return f"{value} {_plural(value, *forms)}"
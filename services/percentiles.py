@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import math
+import random
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, update, delete, func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import SKETCH_K, SKETCH_PERSIST_INTERVAL, SKETCH_MIN_COUNT, SKETCH_ARCHIVE_AFTER, WORKER_ID
+from database import async_session, current_tenant, use_tenant, tenants
+from models.models import QuantileSketch, TestResult, PhishingLog, PhishingDailyStat
+
+# Скетч доли распознанных фишинговых писем; результаты тестов — test:<тема>
+PHISHING_SKETCH = "phishing"
+SEED_BATCH_SIZE = 500
+# Строка, в которую сливаются скетчи давно не обновлявшихся процессов
+ARCHIVE_WORKER_ID = "archive"
+
+_task: Optional[asyncio.Task] = None
+
+
+class KLLSketch:
+    """
+    Скетч квантилей KLL (Karnin, Lang, Liberty, 2016)
+
+    Хранит O(k) значений независимо от их общего числа. Уровень h — компактор
+    с весом 2^h: переполненный уровень сортируется, и в следующий уровень
+    уходит каждое второе значение со случайным сдвигом. Ошибка ранга при
+    k=200 — не больше 1,7% от числа значений с вероятностью 99%
+    (как у KLL в Apache DataSketches); при вдвое большем k она примерно
+    вдвое меньше. Скетчи с одинаковым k сливаются без потери этой оценки,
+    поэтому процессы считают свои скетчи отдельно, а при чтении они
+    объединяются.
+    """
+
+    C = 2 / 3
+
+    def __init__(self, k: int = SKETCH_K):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self._size = 0
+        self._max_size = self._capacity(0)
+        # Отсортированные значения и накопленные веса для rank(); сбрасываются при изменении
+        self._values: Optional[List[float]] = None
+        self._cumulative: List[int] = []
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self.levels) - height - 1
+        return int(math.ceil(self.C ** depth * self.k)) + 1
+
+    def _grow(self):
+        self.levels.append([])
+        self._max_size = sum(self._capacity(height) for height in range(len(self.levels)))
+
+    def _compress(self):
+        for height in range(len(self.levels)):
+            level = self.levels[height]
+            if len(level) < self._capacity(height):
+                continue
+            if height + 1 >= len(self.levels):
+                self._grow()
+
+            level.sort()
+            # Непарное значение остаётся на уровне
+            keep = [level.pop()] if len(level) % 2 else []
+            self.levels[height + 1].extend(level[random.randint(0, 1)::2])
+            self.levels[height] = keep
+
+            self._size = sum(len(items) for items in self.levels)
+            if self._size < self._max_size:
+                break
+
+    def update(self, value: float):
+        self.levels[0].append(value)
+        self.count += 1
+        self._size += 1
+        self._values = None
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for height, items in enumerate(other.levels):
+            self.levels[height].extend(items)
+        self.count += other.count
+        self._size = sum(len(items) for items in self.levels)
+        self._values = None
+        while self._size >= self._max_size:
+            self._compress()
+
+    def rank(self, value: float) -> float:
+        """Доля значений строго меньше value"""
+        if self._values is None:
+            weighted = sorted((item, 1 << height) for height, items in enumerate(self.levels) for item in items)
+            self._values = [item for item, _ in weighted]
+            self._cumulative = [0]
+            for _, weight in weighted:
+                self._cumulative.append(self._cumulative[-1] + weight)
+
+        total = self._cumulative[-1]
+        if not total:
+            return 0.0
+        return self._cumulative[bisect_left(self._values, value)] / total
+
+    def to_json(self) -> str:
+        return json.dumps({"k": self.k, "count": self.count, "levels": self.levels}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: str) -> "KLLSketch":
+        raw = json.loads(data)
+        sketch = cls(raw["k"])
+        for _ in range(len(raw["levels"]) - 1):
+            sketch._grow()
+        sketch.levels = raw["levels"]
+        sketch.count = raw["count"]
+        sketch._size = sum(len(items) for items in sketch.levels)
+        return sketch
+
+
+class SketchState:
+    """Скетч этого процесса, слитые скетчи остальных и их объединение для чтения"""
+
+    def __init__(self):
+        self.local = KLLSketch()
+        self.others = KLLSketch()
+        self.dirty = False
+        self._view: Optional[KLLSketch] = None
+
+    def update(self, value: float):
+        self.local.update(value)
+        self.dirty = True
+        self._view = None
+
+    def set_others(self, others: KLLSketch):
+        self.others = others
+        self._view = None
+
+    def view(self) -> KLLSketch:
+        if self._view is None:
+            view = KLLSketch()
+            view.merge(self.local)
+            view.merge(self.others)
+            self._view = view
+        return self._view
+
+
+# Организация -> имя скетча -> состояние
+_states: Dict[Optional[str], Dict[str, SketchState]] = {}
+
+
+def _state(name: str) -> SketchState:
+    states = _states.setdefault(current_tenant.get(), {})
+    if name not in states:
+        states[name] = SketchState()
+    return states[name]
+
+
+def test_sketch_name(theme: str) -> str:
+    return f"test:{theme}"
+
+
+def record_value(name: str, value: float):
+    _state(name).update(value)
+
+
+def percentile_rank(name: str, value: float) -> Optional[int]:
+    """
+    Процент значений скетча, которые меньше value
+
+    Возвращает None, пока значений меньше SKETCH_MIN_COUNT: на малой выборке
+    сравнение ничего не говорит. Память и время не зависят от числа значений.
+    """
+    states = _states.get(current_tenant.get(), {})
+    state = states.get(name)
+    if state is None:
+        return None
+    view = state.view()
+    if view.count < SKETCH_MIN_COUNT:
+        return None
+    return round(view.rank(value) * 100)
+
+
+async def recognition_rates(session: AsyncSession, user_ids: Iterable[int]) -> Dict[int, float]:
+    """Доля распознанных фишинговых писем по пользователям, с учётом дневных итогов"""
+    # campaigns сам импортирует этот модуль, поэтому импорт здесь
+    from services.campaigns import answered_filter
+
+    user_ids = list(set(user_ids))
+    totals: Dict[int, List[int]] = {}
+
+    raw = await session.execute(
+        select(PhishingLog.user_id, func.count(), func.sum(case((PhishingLog.clicked.is_(True), 1), else_=0)))
+        .where(PhishingLog.user_id.in_(user_ids), answered_filter())
+        .group_by(PhishingLog.user_id)
+    )
+    rolled_up = await session.execute(
+        select(PhishingDailyStat.user_id, func.sum(PhishingDailyStat.answered), func.sum(PhishingDailyStat.clicked))
+        .where(PhishingDailyStat.user_id.in_(user_ids))
+        .group_by(PhishingDailyStat.user_id)
+    )
+    for user_id, answered, clicked in [*raw, *rolled_up]:
+        counts = totals.setdefault(user_id, [0, 0])
+        counts[0] += answered or 0
+        counts[1] += clicked or 0
+
+    return {
+        user_id: (answered - clicked) / answered * 100
+        for user_id, (answered, clicked) in totals.items() if answered
+    }
+
+
+async def record_phishing_answers(session: AsyncSession, user_ids: Iterable[int]):
+    """
+    Добавляет в скетч новую долю распознанных писем пользователей после их ответа
+
+    Скетч не умеет заменять значения, поэтому активные пользователи
+    представлены в нём чаще; для оценки «лучше, чем у N%» этого достаточно.
+    """
+    try:
+        for rate in (await recognition_rates(session, user_ids)).values():
+            record_value(PHISHING_SKETCH, rate)
+    except Exception as e:
+        logging.exception(f"Не удалось обновить скетч распознавания фишинга: {str(e)}")
+
+
+async def _seed(session: AsyncSession):
+    # Первый запуск: строим скетчи по уже накопленным данным один раз
+    scores = await session.execute(select(TestResult.theme, TestResult.score))
+    for theme, score in scores:
+        if score is not None:
+            record_value(test_sketch_name(theme), score)
+
+    user_ids = list({
+        *(await session.scalars(select(PhishingLog.user_id).distinct())).all(),
+        *(await session.scalars(select(PhishingDailyStat.user_id).distinct())).all(),
+    })
+    # Пачками, чтобы не упереться в лимит параметров SQLite
+    for start in range(0, len(user_ids), SEED_BATCH_SIZE):
+        for rate in (await recognition_rates(session, user_ids[start:start + SEED_BATCH_SIZE])).values():
+            record_value(PHISHING_SKETCH, rate)
+
+
+async def sync_sketches():
+    """
+    Сохраняет скетчи этого процесса и подгружает скетчи остальных (для текущей организации)
+
+    У каждого процесса своя строка на скетч (по WORKER_ID), поэтому записи
+    не конфликтуют. С постоянным WORKER_ID перезапущенный процесс продолжает
+    свой скетч; с WORKER_ID по умолчанию (хост и PID) он начинает новую строку,
+    а строка прежнего запуска сливается вместе со скетчами остальных процессов.
+
+    Строки, которые не обновлялись SKETCH_ARCHIVE_AFTER секунд (процесс
+    остановлен или перезапущен с новым PID), сливаются в архивную строку
+    скетча и удаляются, поэтому строк не больше, чем живых процессов, плюс
+    одна. Живой процесс обновляет updated_at своих строк, даже если новых
+    значений не было, чтобы его скетч не попал в архив.
+    """
+    states = _states.setdefault(current_tenant.get(), {})
+
+    async with async_session() as session:
+        rows = (await session.scalars(select(QuantileSketch))).all()
+
+        if not rows and not states:
+            await _seed(session)
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        stale_before = now - timedelta(seconds=SKETCH_ARCHIVE_AFTER)
+        # Свои строки обновляем заранее, с запасом в половину срока
+        touch_before = now - timedelta(seconds=SKETCH_ARCHIVE_AFTER / 2)
+        others: Dict[str, KLLSketch] = {}
+        archives: Dict[str, KLLSketch] = {}
+        stale: List[QuantileSketch] = []
+        touch = False
+        for row in rows:
+            sketch = KLLSketch.from_json(row.data)
+            if row.worker_id == WORKER_ID:
+                # После перезапуска продолжаем собственный скетч
+                state = _state(row.name)
+                if not state.dirty and state.local.count == 0:
+                    state.local = sketch
+                touch = touch or (row.updated_at is not None and row.updated_at < touch_before)
+                continue
+            others.setdefault(row.name, KLLSketch()).merge(sketch)
+            if row.worker_id == ARCHIVE_WORKER_ID:
+                archives.setdefault(row.name, KLLSketch()).merge(sketch)
+            elif row.updated_at is not None and row.updated_at < stale_before:
+                archives.setdefault(row.name, KLLSketch()).merge(sketch)
+                stale.append(row)
+
+        for name in set(others) | set(states):
+            _state(name).set_others(others.get(name, KLLSketch()))
+
+        if stale:
+            stmt = sqlite_insert(QuantileSketch)
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["name", "worker_id"],
+                    set_={"data": stmt.excluded.data, "count": stmt.excluded.count, "updated_at": func.now()}
+                ),
+                [
+                    {"name": name, "worker_id": ARCHIVE_WORKER_ID, "data": archives[name].to_json(), "count": archives[name].count}
+                    for name in {row.name for row in stale}
+                ]
+            )
+            await session.execute(delete(QuantileSketch).where(QuantileSketch.id.in_([row.id for row in stale])))
+            await session.commit()
+            logging.info(f"Скетчи {len(stale)} неактивных процессов перенесены в архив")
+
+        if touch:
+            await session.execute(
+                update(QuantileSketch).where(QuantileSketch.worker_id == WORKER_ID).values(updated_at=func.now())
+            )
+            await session.commit()
+
+        dirty = [(name, state) for name, state in states.items() if state.dirty]
+        if dirty:
+            stmt = sqlite_insert(QuantileSketch)
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["name", "worker_id"],
+                    set_={"data": stmt.excluded.data, "count": stmt.excluded.count, "updated_at": func.now()}
+                ),
+                [
+                    {"name": name, "worker_id": WORKER_ID, "data": state.local.to_json(), "count": state.local.count}
+                    for name, state in dirty
+                ]
+            )
+            await session.commit()
+            for _, state in dirty:
+                state.dirty = False
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(SKETCH_PERSIST_INTERVAL)
+        for tenant in (None, *tenants()):
+            with use_tenant(tenant):
+                try:
+                    await sync_sketches()
+                except Exception as e:
+                    logging.exception(f"Не удалось сохранить скетчи распределений: {str(e)}")
+
+
+async def start_sketches():
+    """Загружает скетчи всех организаций и запускает их периодическое сохранение"""
+    global _task
+    for tenant in (None, *tenants()):
+        with use_tenant(tenant):
+            await sync_sketches()
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop_sketches():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    # Дописываем накопленное с последнего сохранения
+    for tenant in (None, *tenants()):
+        with use_tenant(tenant):
+            try:
+                await sync_sketches()
+            except Exception as e:
+                logging.exception(f"Не удалось сохранить скетчи распределений: {str(e)}")
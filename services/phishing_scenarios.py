@@ -1,5 +1,7 @@
 from typing import Dict, List, Any
 
+from services.phishing_variants import is_variant_id, render_variant
+
 PHISHING_SCENARIOS = [
     {
         "id": "email_login",
@@ -76,8 +78,14 @@ def get_scenarios() -> List[Dict[str, Any]]:
     ]
 
 
+_SCENARIO_INDEX = {scenario["id"]: scenario for scenario in PHISHING_SCENARIOS}
+
+
 def get_scenario(scenario_id: str) -> Dict[str, Any]:
-    for scenario in PHISHING_SCENARIOS:
-        if scenario["id"] == scenario_id:
-            return scenario
-    return {} 
\ No newline at end of file
+    scenario = _SCENARIO_INDEX.get(scenario_id)
+    if scenario:
+        return scenario
+    if is_variant_id(scenario_id):
+        return render_variant(scenario_id)
+    return {}
+ 
\ No newline at end of file
@@ -0,0 +1,323 @@
+import random
+import zlib
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, List, Any, Optional, Tuple
+
+# Латинские буквы и их визуальные двойники
+CYRILLIC_HOMOGLYPHS = {"a": "а", "c": "с", "e": "е", "o": "о", "p": "р", "x": "х", "y": "у"}
+DIGIT_LOOKALIKES = {"o": "0", "l": "1", "i": "1", "s": "5"}
+
+VARIANT_SEPARATOR = "~"
+VARIANT_CACHE_SIZE = 4096
+
+
+class CompiledTemplate:
+    """Шаблон, заранее разобранный на литералы и имена полей"""
+
+    __slots__ = ("segments", "fields")
+
+    def __init__(self, template: str):
+        self.segments: Tuple[Tuple[str, Optional[str]], ...] = tuple(
+            (literal, field) for literal, field, _, _ in Formatter().parse(template)
+        )
+        self.fields = {field for _, field in self.segments if field}
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join(
+            literal + values[field] if field else literal
+            for literal, field in self.segments
+        )
+
+
+def _option(sign: str = None, **values: str) -> Dict[str, Any]:
+    return {"values": values, "sign": CompiledTemplate(sign) if sign else None}
+
+
+def _sender_options(brands: List[Tuple[str, str]], mailbox: str, word: str) -> List[Dict[str, Any]]:
+    """
+    Собирает поддельные адреса отправителя для каждого бренда
+
+    Каждый вариант использует одну уловку — кириллическую букву, цифру вместо
+    буквы, лишнее слово или чужую доменную зону — и несёт описание именно её.
+    """
+    options = []
+
+    for brand, stem in brands:
+        def sender(domain: str, sign: str) -> Dict[str, Any]:
+            return _option(sign, brand=brand, sender=f"{mailbox}@{domain}")
+
+        for index, char in enumerate(word):
+            if char in CYRILLIC_HOMOGLYPHS:
+                fake = word[:index] + CYRILLIC_HOMOGLYPHS[char] + word[index + 1:]
+                options.append(sender(
+                    f"{stem}-{fake}.com",
+                    f"Кириллическая «{CYRILLIC_HOMOGLYPHS[char]}» вместо латинской «{char}» в домене ({fake} вместо {word})"
+                ))
+            if char in DIGIT_LOOKALIKES:
+                fake = word[:index] + DIGIT_LOOKALIKES[char] + word[index + 1:]
+                options.append(sender(
+                    f"{stem}-{fake}.com",
+                    f"Цифра «{DIGIT_LOOKALIKES[char]}» вместо буквы «{char}» в домене ({fake} вместо {word})"
+                ))
+
+        options.append(sender(
+            f"{stem}-{word}-secure.com",
+            f"Лишние слова в домене отправителя ({stem}-{word}-secure.com)"
+        ))
+        options.append(sender(
+            f"{stem}.{word}-center.info",
+            f"Название {brand} стоит в поддомене чужого сайта ({stem}.{word}-center.info)"
+        ))
+
+    return options
+
+
+VARIANT_TEMPLATES = [
+    {
+        "id": "email_login",
+        "name": "Почтовый фишинг",
+        "description": "Письмо о подозрительном входе с требованием подтвердить данные",
+        "message": (
+            "От: {sender}\n"
+            "Тема: {subject}\n\n"
+            "{greeting},\n\n"
+            "Мы заметили попытку входа в ваш аккаунт {brand} из {country}.\n"
+            "Если это не вы, ваш аккаунт могли взломать.\n\n"
+            "Подтвердите свою личность здесь:\n"
+            "{phishing_link}\n\n"
+            "{urgency}\n\n"
+            "С уважением,\n"
+            "Команда безопасности {brand}"
+        ),
+        "signs": [
+            "Подозрительная ссылка не на официальном домене",
+            "Неожиданное уведомление о входе из другой страны",
+        ],
+        "fields": {
+            "sender": _sender_options(
+                [("Mail", "mail"), ("Яндекс", "yandex"), ("Госуслуги", "gosuslugi"), ("VK", "vk")],
+                "security", "support"
+            ),
+            "country": [_option(country=c) for c in ("Вьетнама", "Нигерии", "Бразилии", "Индонезии")],
+            "subject": [
+                _option("Паническая тема письма со словом «Срочно»", subject="Срочно: подтвердите вход"),
+                _option(None, subject="Подозрительная активность в аккаунте"),
+                _option("Тема письма заглавными буквами", subject="ВАШ АККАУНТ ПОД УГРОЗОЙ"),
+            ],
+            "greeting": [
+                _option("Безличное обращение «Уважаемый Пользователь» вместо имени", greeting="Уважаемый Пользователь"),
+                _option("Безличное обращение «Здравствуйте, клиент» вместо имени", greeting="Здравствуйте, клиент"),
+                _option("Безличное обращение «Дорогой абонент» вместо имени", greeting="Дорогой абонент"),
+            ],
+            "urgency": [
+                _option("Ложная срочность: 24 часа до блокировки аккаунта",
+                        urgency="На ответ у вас 24 часа, потом аккаунт будет заблокирован."),
+                _option("Ложная срочность: 2 часа до закрытия доступа",
+                        urgency="Если не подтвердите вход в течение 2 часов, доступ будет закрыт навсегда."),
+                _option("Угроза удалить аккаунт уже сегодня",
+                        urgency="Аккаунт будет удалён сегодня в 23:59."),
+            ],
+        },
+    },
+    {
+        "id": "bank_alert",
+        "name": "Банковское уведомление",
+        "description": "Срочное уведомление банка о подозрительной операции",
+        "message": (
+            "{headline}\n\n"
+            "{greeting},\n\n"
+            "Мы обнаружили списание {amount}₽ с вашей карты **** {card}.\n"
+            "Операция временно приостановлена.\n\n"
+            "Для подтверждения или отмены операции:\n"
+            "{phishing_link}\n\n"
+            "{urgency}\n\n"
+            "Служба безопасности {bank}"
+        ),
+        "signs": [
+            "Подозрительная ссылка не на домене банка",
+            "Банки никогда не запрашивают данные карты по ссылкам",
+        ],
+        "fields": {
+            "bank": [_option(bank=b) for b in ("СберБанка", "Т-Банка", "ВТБ", "Альфа-Банка")],
+            "amount": [
+                _option("Крупная сумма ({amount}₽) под угрозой — попытка вызвать панику", amount=a)
+                for a in ("54,990", "12,500", "87,300", "149,999", "23,450")
+            ],
+            "card": [_option(card=c) for c in ("4582", "1093", "7731", "2268")],
+            "headline": [
+                _option("Тревожный заголовок заглавными буквами", headline="ВНИМАНИЕ: подозрительная транзакция"),
+                _option(None, headline="Уведомление о подозрительной операции"),
+            ],
+            "greeting": [
+                _option("Отсутствие персонализации (нет обращения по имени)", greeting="Уважаемый клиент"),
+                _option("Отсутствие персонализации (нет обращения по имени)", greeting="Уважаемый держатель карты"),
+            ],
+            "urgency": [
+                _option("Давление срочностью: 1 час до блокировки карты",
+                        urgency="Если вы не ответите в течение 1 часа, карта будет заблокирована."),
+                _option("Угроза, что деньги спишутся окончательно",
+                        urgency="Без подтверждения через 30 минут средства будут списаны без возможности возврата."),
+            ],
+        },
+    },
+    {
+        "id": "prize_win",
+        "name": "Выигрыш приза",
+        "description": "Мошенническое уведомление о выигрыше",
+        "message": (
+            "{headline}\n\n"
+            "Ваш номер был случайно выбран среди {pool} номеров!\n"
+            "Для получения подарка укажите данные по ссылке:\n\n"
+            "{phishing_link}\n\n"
+            "{urgency}"
+        ),
+        "signs": [
+            "Крайне маловероятный сценарий (случайный выбор номера)",
+            "Нет данных о компании-организаторе",
+        ],
+        "fields": {
+            "prize": [
+                _option(f"Слишком хорошее предложение ({prize} бесплатно)", prize=prize, prize_caps=prize.upper())
+                for prize in ("айфон 15 Про", "MacBook Air", "100 000 ₽", "путёвку на двоих в Дубай")
+            ],
+            "headline": [
+                _option("Заглавные буквы и восклицательные знаки", headline="ПОЗДРАВЛЯЕМ! ВЫ ВЫИГРАЛИ {prize_caps}!"),
+                _option(None, headline="Поздравляем, вы выиграли {prize}."),
+            ],
+            "pool": [_option(pool=p) for p in ("1,000", "10,000", "500")],
+            "urgency": [
+                _option("Искусственное ограничение времени (30 минут)",
+                        urgency="Заполните форму за 30 минут, иначе приз перейдет к другому!"),
+                _option("Требование оплатить «доставку» приза",
+                        urgency="Оплатите только доставку — 299 ₽, и приз ваш!"),
+            ],
+        },
+    },
+    {
+        "id": "delivery",
+        "name": "Доставка посылки",
+        "description": "Сообщение о проблеме с доставкой и доплате",
+        "message": (
+            "{courier}: посылка {tracking} не может быть доставлена.\n\n"
+            "{reason}\n"
+            "Оплатите {fee} ₽ и выберите новую дату доставки:\n"
+            "{phishing_link}\n\n"
+            "{urgency}"
+        ),
+        "signs": [
+            "Ссылка не на официальном сайте службы доставки",
+            "Вы не ждали посылку или не давали этот номер",
+        ],
+        "fields": {
+            "courier": [_option(courier=c) for c in ("СДЭК", "Почта России", "Ozon", "Wildberries")],
+            "tracking": [_option(tracking=t) for t in ("RU84920317", "CD1029384756", "OZ-55120943")],
+            "reason": [
+                _option("Выдуманная причина: неполный адрес", reason="Адрес указан не полностью."),
+                _option("Выдуманная причина: таможенный сбор", reason="Требуется уплата таможенного сбора."),
+            ],
+            "fee": [
+                _option("Просьба оплатить небольшую сумму ({fee} ₽) — приманка для ввода данных карты", fee=f)
+                for f in ("49", "149", "350")
+            ],
+            "urgency": [
+                _option("Угроза вернуть посылку отправителю через 24 часа",
+                        urgency="Через 24 часа посылка будет возвращена отправителю."),
+                _option(None, urgency="Спасибо, что выбираете нас."),
+            ],
+        },
+    },
+]
+
+
+def _compile(template: Dict[str, Any]) -> Dict[str, Any]:
+    fields = list(template["fields"].items())
+    return {
+        "id": template["id"],
+        "name": template["name"],
+        "description": template["description"],
+        "message": CompiledTemplate(template["message"]),
+        "signs": template["signs"],
+        "fields": fields,
+        "size": _product(len(options) for _, options in fields),
+    }
+
+
+def _product(values) -> int:
+    result = 1
+    for value in values:
+        result *= value
+    return result
+
+
+_TEMPLATE_INDEX: Dict[str, Dict[str, Any]] = {t["id"]: _compile(t) for t in VARIANT_TEMPLATES}
+
+
+def get_templates() -> List[Dict[str, Any]]:
+    return [
+        {"id": template["id"], "name": template["name"], "variants": template["size"]}
+        for template in _TEMPLATE_INDEX.values()
+    ]
+
+
+def is_variant_id(scenario_id: str) -> bool:
+    return VARIANT_SEPARATOR in scenario_id
+
+
+def variant_id(template_id: str, index: int) -> str:
+    return f"{template_id}{VARIANT_SEPARATOR}{index}"
+
+
+def random_variant_id(template_id: str = None, rng: random.Random = random) -> str:
+    template = _TEMPLATE_INDEX[template_id] if template_id else rng.choice(list(_TEMPLATE_INDEX.values()))
+    return variant_id(template["id"], rng.randrange(template["size"]))
+
+
+def pick_variant_id(template_id: Optional[str], seed: str) -> str:
+    """Детерминированно выбирает вариант по seed (например, кампания + пользователь)"""
+    checksum = zlib.crc32(seed.encode())
+    templates = list(_TEMPLATE_INDEX.values())
+    template = _TEMPLATE_INDEX[template_id] if template_id else templates[checksum % len(templates)]
+    return variant_id(template["id"], (checksum * 2654435761) % template["size"])
+
+
+@lru_cache(maxsize=VARIANT_CACHE_SIZE)
+def render_variant(scenario_id: str) -> Dict[str, Any]:
+    """
+    Собирает сценарий по id вида "<шаблон>~<номер>"
+
+    Номер варианта раскладывается в смешанной системе счисления по числу
+    вариантов каждого поля, поэтому id однозначно задаёт набор уловок,
+    а список признаков составляется только из использованных.
+    """
+    template_id, _, raw_index = scenario_id.partition(VARIANT_SEPARATOR)
+    template = _TEMPLATE_INDEX.get(template_id)
+
+    if not template or not raw_index.isdigit() or int(raw_index) >= template["size"]:
+        return {}
+
+    index = int(raw_index)
+    chosen = []
+    for _, options in reversed(template["fields"]):
+        index, option_index = divmod(index, len(options))
+        chosen.append(options[option_index])
+
+    values = {"phishing_link": "{phishing_link}"}
+    for option in chosen:
+        values.update(option["values"])
+
+    # Значения полей могут ссылаться на другие поля (например, заголовок на приз)
+    for key, value in values.items():
+        if "{" in value and key != "phishing_link":
+            values[key] = value.format_map(values)
+
+    signs = [option["sign"].render(values) for option in reversed(chosen) if option["sign"]]
+
+    return {
+        "id": scenario_id,
+        "template_id": template_id,
+        "name": template["name"],
+        "description": template["description"],
+        "message": template["message"].render(values),
+        "signs": list(dict.fromkeys(signs + template["signs"]))
+    }
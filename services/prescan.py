@@ -0,0 +1,421 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import struct
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import PRESCAN_SIGNATURES_FILE, PRESCAN_WORKERS
+
+# Сигнатуры типов: смещение, байты, тип файла, категория
+MAGIC_NUMBERS: List[Tuple[int, bytes, str, str]] = [
+    (0, b"MZ", "Исполняемый файл Windows", "executable"),
+    (0, b"\x7fELF", "Исполняемый файл Linux (ELF)", "executable"),
+    (0, b"\xcf\xfa\xed\xfe", "Исполняемый файл macOS (Mach-O)", "executable"),
+    (0, b"\xce\xfa\xed\xfe", "Исполняемый файл macOS (Mach-O)", "executable"),
+    (0, b"\xca\xfe\xba\xbe", "Исполняемый файл macOS (Mach-O) или класс Java", "executable"),
+    (0, b"dex\n", "Исполняемый файл Android (DEX)", "executable"),
+    (0, b"%PDF-", "Документ PDF", "document"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "Документ Microsoft Office (OLE)", "document"),
+    (0, b"{\\rtf", "Документ RTF", "document"),
+    (0, b"PK\x03\x04", "Архив ZIP (или документ Office, APK, JAR)", "archive"),
+    (0, b"PK\x05\x06", "Пустой архив ZIP", "archive"),
+    (0, b"Rar!\x1a\x07", "Архив RAR", "archive"),
+    (0, b"7z\xbc\xaf\x27\x1c", "Архив 7-Zip", "archive"),
+    (0, b"\x1f\x8b", "Архив gzip", "archive"),
+    (0, b"BZh", "Архив bzip2", "archive"),
+    (0, b"\xfd7zXZ\x00", "Архив xz", "archive"),
+    (257, b"ustar", "Архив tar", "archive"),
+    (0, b"\x89PNG\r\n\x1a\n", "Изображение PNG", "image"),
+    (0, b"\xff\xd8\xff", "Изображение JPEG", "image"),
+    (0, b"GIF87a", "Изображение GIF", "image"),
+    (0, b"GIF89a", "Изображение GIF", "image"),
+    (0, b"BM", "Изображение BMP", "image"),
+    (8, b"WEBP", "Изображение WebP", "image"),
+    (0, b"ID3", "Аудио MP3", "media"),
+    (4, b"ftyp", "Видео MP4/MOV", "media"),
+    (0, b"OggS", "Аудио/видео Ogg", "media"),
+]
+
+SCRIPT_EXTENSIONS = {
+    ".js", ".jse", ".vbs", ".vbe", ".ps1", ".psm1", ".bat", ".cmd", ".sh", ".py",
+    ".hta", ".wsf", ".wsh", ".lnk", ".scr", ".pif", ".reg", ".svg", ".html", ".htm",
+}
+EXECUTABLE_EXTENSIONS = {".exe", ".dll", ".sys", ".scr", ".com", ".cpl", ".msi", ".elf", ".so", ".dylib", ".apk"}
+# Расширения, которые ожидаются у файлов каждой категории
+CATEGORY_EXTENSIONS = {
+    "image": {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp"},
+    "text": {".txt", ".log", ".csv", ".md", ".json", ".xml", ".ini", ".cfg", ".conf", ".yml", ".yaml"},
+}
+
+# Имена секций известных упаковщиков
+PACKER_SECTIONS = {
+    b"UPX0", b"UPX1", b"UPX2", b".aspack", b".adata", b".petite", b"MPRESS1", b"MPRESS2",
+    b".nsp0", b".nsp1", b".themida", b".vmp0", b".vmp1", b"PEC2", b"FSG!",
+}
+EMBEDDED_PE_MARKER = b"This program cannot be run in DOS mode"
+# Исполняемые файлы и архивы, которые прячут внутри картинок и текста
+EMBEDDED_MARKERS = (EMBEDDED_PE_MARKER, b"\x7fELF", b"PK\x03\x04")
+# Энтропия обычного текста — 4–5 бит/байт; у base64 и шифрованных данных — около 6 и выше
+TEXT_MAX_ENTROPY = 5.5
+BMP_HEADER_SIZES = {12, 40, 52, 56, 64, 108, 124}
+PACKED_ENTROPY = 7.2
+HIGH_ENTROPY = 7.5
+TEXT_SAMPLE_SIZE = 64 * 1024
+
+# Для больших файлов энтропия оценивается по равномерной выборке такого размера
+ENTROPY_SAMPLE_SIZE = 4 * 1024 * 1024
+
+# Шаблон сигнатуры: номер правила и номер шаблона в нём
+PatternRef = Tuple[int, int]
+SignatureMatcher = Tuple[
+    Optional["re.Pattern"], Dict[bytes, List[PatternRef]],
+    Optional["re.Pattern"], Dict[bytes, List[PatternRef]],
+    List[Tuple["re.Pattern", PatternRef]], List[Dict[str, Any]]
+]
+
+# Матчер сигнатур собирается один раз в каждом процессе пула
+_matcher: Optional[SignatureMatcher] = None
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def shannon_entropy(data: bytes) -> float:
+    if not data:
+        return 0.0
+    if len(data) > ENTROPY_SAMPLE_SIZE:
+        data = data[::len(data) // ENTROPY_SAMPLE_SIZE + 1]
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def detect_type(data: bytes) -> Tuple[str, str]:
+    for offset, magic, description, category in MAGIC_NUMBERS:
+        if data[offset:offset + len(magic)] == magic:
+            return description, category
+
+    if data.startswith(b"#!"):
+        return "Скрипт с интерпретатором", "script"
+
+    sample = data[:TEXT_SAMPLE_SIZE]
+    try:
+        text = sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Образец мог оборваться посреди многобайтного символа
+        if e.start < len(sample) - 4:
+            return "Неизвестный двоичный формат", "unknown"
+        text = sample[:e.start].decode("utf-8")
+
+    printable = sum(char.isprintable() or char in "\r\n\t" for char in text)
+    if text and printable / len(text) > 0.95:
+        return "Текст", "text"
+    return "Неизвестный двоичный формат", "unknown"
+
+
+def _jpeg_problem(data: bytes) -> Optional[str]:
+    # Цепочка сегментов от SOI до EOI; после SOS идут сжатые данные до следующего маркера
+    pos = 2
+    while True:
+        if data[pos:pos + 1] != b"\xff":
+            return "цепочка сегментов JPEG нарушена"
+        while data[pos:pos + 1] == b"\xff":
+            pos += 1
+        if pos >= len(data):
+            return "JPEG обрывается без маркера конца"
+        marker = data[pos]
+        pos += 1
+        if marker == 0xD9:
+            break
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue
+        if pos + 2 > len(data):
+            return "JPEG обрывается посреди сегмента"
+        pos += struct.unpack_from(">H", data, pos)[0]
+        if pos > len(data):
+            return "длина сегмента JPEG выходит за конец файла"
+        if marker == 0xDA:
+            while True:
+                pos = data.find(b"\xff", pos)
+                if pos < 0 or pos + 1 >= len(data):
+                    return "JPEG обрывается без маркера конца"
+                following = data[pos + 1]
+                if following == 0x00 or 0xD0 <= following <= 0xD7:
+                    pos += 2
+                    continue
+                break
+    if data[pos:].strip(b"\x00"):
+        return "после конца изображения JPEG есть данные"
+    return None
+
+
+def _png_problem(data: bytes) -> Optional[str]:
+    pos = 8
+    first = True
+    while True:
+        if pos + 8 > len(data):
+            return "PNG обрывается без блока IEND"
+        length, chunk_type = struct.unpack_from(">I4s", data, pos)
+        if first and chunk_type != b"IHDR":
+            return "PNG не начинается с блока IHDR"
+        first = False
+        pos += 12 + length
+        if pos > len(data):
+            return "длина блока PNG выходит за конец файла"
+        if chunk_type == b"IEND":
+            break
+    if data[pos:]:
+        return "после конца изображения PNG есть данные"
+    return None
+
+
+def image_problem(data: bytes) -> Optional[str]:
+    """Почему структура изображения не сходится с форматом; None — структура цела"""
+    try:
+        if data.startswith(b"\xff\xd8\xff"):
+            return _jpeg_problem(data)
+        if data.startswith(b"\x89PNG\r\n\x1a\n"):
+            return _png_problem(data)
+        if data.startswith(b"BM"):
+            file_size, pixel_offset, header_size = struct.unpack_from("<I4xII", data, 2)
+            if file_size != len(data) or header_size not in BMP_HEADER_SIZES or not 14 + header_size <= pixel_offset <= len(data):
+                return "заголовок BMP не соответствует файлу"
+            return None
+        if data.startswith((b"GIF87a", b"GIF89a")):
+            if len(data) < 14 or not data.rstrip(b"\x00").endswith(b";"):
+                return "GIF не заканчивается маркером конца"
+            return None
+        if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+            if struct.unpack_from("<I", data, 4)[0] + 8 not in (len(data), len(data) - 1):
+                return "размер RIFF не соответствует файлу"
+            return None
+    except struct.error:
+        return "заголовок изображения обрывается"
+    return "формат изображения не проверяется"
+
+
+def parse_pe_sections(data: bytes) -> Optional[List[Dict[str, Any]]]:
+    """Секции PE-файла с энтропией; None, если это не PE"""
+    try:
+        pe_offset = struct.unpack_from("<I", data, 0x3C)[0]
+        if data[pe_offset:pe_offset + 4] != b"PE\x00\x00":
+            return None
+        _, section_count, _, _, _, optional_header_size, _ = struct.unpack_from("<HHIIIHH", data, pe_offset + 4)
+    except struct.error:
+        return None
+
+    sections = []
+    table_offset = pe_offset + 24 + optional_header_size
+
+    for index in range(min(section_count, 96)):
+        try:
+            name, virtual_size, _, raw_size, raw_offset, _, _, _, _, characteristics = struct.unpack_from(
+                "<8sIIIIIIHHI", data, table_offset + index * 40
+            )
+        except struct.error:
+            break
+
+        name = name.rstrip(b"\x00")
+        raw = data[raw_offset:raw_offset + raw_size]
+        entropy = shannon_entropy(raw)
+        executable = bool(characteristics & 0x20000000)
+
+        sections.append({
+            "name": name.decode("latin-1"),
+            "entropy": round(entropy, 2),
+            "raw_size": raw_size,
+            "virtual_size": virtual_size,
+            # Упакованный код: сжатые данные, секция упаковщика или пустая на диске исполняемая секция
+            "packed": name in PACKER_SECTIONS or entropy >= PACKED_ENTROPY
+                      or (executable and raw_size == 0 and virtual_size > 0),
+        })
+
+    return sections
+
+
+def load_signatures(path: str = PRESCAN_SIGNATURES_FILE) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        logging.warning(f"Файл сигнатур {path} не найден, локальная проверка без сигнатур")
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _literal_regex(literals: Dict[bytes, List[PatternRef]]) -> Optional["re.Pattern"]:
+    if not literals:
+        return None
+    # Длинные строки первыми, чтобы строка-префикс не перекрыла более длинную.
+    # Группы не используются: без них re пропускает позиции по первому байту.
+    return re.compile(b"|".join(re.escape(literal) for literal in sorted(literals, key=len, reverse=True)))
+
+
+def compile_signatures(rules: List[Dict[str, Any]]) -> SignatureMatcher:
+    """
+    Собирает сигнатуры в многошаблонный матчер
+
+    Все строковые шаблоны (text, hex, any) объединяются в одно выражение без
+    групп: за один проход по файлу находятся все вхождения, а какой шаблон
+    совпал, определяется по найденным байтам. Шаблоны без учёта регистра ищутся
+    так же, но в копии файла в нижнем регистре (только ASCII). Шаблоны regex
+    проверяются по отдельности.
+    """
+    exact: Dict[bytes, List[PatternRef]] = {}
+    folded: Dict[bytes, List[PatternRef]] = {}
+    regexes: List[Tuple["re.Pattern", PatternRef]] = []
+
+    for rule_index, rule in enumerate(rules):
+        for pattern_index, pattern in enumerate(rule["patterns"]):
+            ref = (rule_index, pattern_index)
+            nocase = pattern.get("nocase", False)
+
+            if "regex" in pattern:
+                regexes.append((re.compile(pattern["regex"].encode("utf-8"), re.DOTALL | (re.IGNORECASE if nocase else 0)), ref))
+                continue
+
+            if "hex" in pattern:
+                literals = [bytes.fromhex(pattern["hex"])]
+            elif "text" in pattern:
+                literals = [pattern["text"].encode("utf-8")]
+            else:
+                literals = [text.encode("utf-8") for text in pattern["any"]]
+
+            for literal in literals:
+                target = folded if nocase else exact
+                target.setdefault(literal.lower() if nocase else literal, []).append(ref)
+
+    return _literal_regex(exact), exact, _literal_regex(folded), folded, regexes, rules
+
+
+def match_signatures(data: bytes) -> List[Dict[str, str]]:
+    global _matcher
+    if _matcher is None:
+        _matcher = compile_signatures(load_signatures())
+    exact_regex, exact, folded_regex, folded, regexes, rules = _matcher
+
+    found: Dict[int, set] = {}
+
+    for regex, literals, buffer in (
+        (exact_regex, exact, data),
+        (folded_regex, folded, data.lower() if folded_regex else b""),
+    ):
+        if regex is None:
+            continue
+        for literal in set(regex.findall(buffer)):
+            for rule_index, pattern_index in literals[literal]:
+                found.setdefault(rule_index, set()).add(pattern_index)
+
+    for regex, (rule_index, pattern_index) in regexes:
+        if regex.search(data):
+            found.setdefault(rule_index, set()).add(pattern_index)
+
+    matches = []
+    for rule_index, patterns in found.items():
+        rule = rules[rule_index]
+        condition = rule.get("condition", "any")
+        required = len(rule["patterns"]) if condition == "all" else 1 if condition == "any" else int(condition)
+        if len(patterns) >= required:
+            matches.append({
+                "rule": rule["name"],
+                "severity": rule.get("severity", "suspicious"),
+                "description": rule.get("description", ""),
+            })
+    return matches
+
+
+def analyze(data: bytes, filename: str) -> Dict[str, Any]:
+    """
+    Локальная статическая проверка файла (выполняется в процессе пула)
+
+    Returns:
+        Dict с типом файла, энтропией, упакованными секциями, совпавшими
+        сигнатурами и вердиктом: malicious, suspicious, clean или unknown.
+        conclusive=True означает, что отправлять файл в VirusTotal не нужно.
+    """
+    file_type, category = detect_type(data)
+    extension = os.path.splitext(filename.lower())[1]
+    entropy = shannon_entropy(data)
+    matches = match_signatures(data)
+    reasons = []
+
+    if category == "text" and extension in SCRIPT_EXTENSIONS:
+        category = "script"
+
+    sections = parse_pe_sections(data) if data.startswith(b"MZ") else None
+    packed_sections = [section["name"] for section in sections or [] if section["packed"]]
+
+    if packed_sections:
+        reasons.append(f"Упакованные секции: {', '.join(packed_sections)}")
+    elif category == "executable" and entropy >= HIGH_ENTROPY:
+        reasons.append(f"Высокая энтропия исполняемого файла: {entropy:.2f}")
+
+    # Исполняемый файл или архив, приклеенный к картинке или тексту
+    if category in CATEGORY_EXTENSIONS and any(marker in data[1:] for marker in EMBEDDED_MARKERS):
+        reasons.append("Внутри файла спрятан исполняемый файл или архив")
+
+    if category == "executable" and extension and extension not in EXECUTABLE_EXTENSIONS:
+        reasons.append(f"Исполняемый файл с расширением {extension}")
+    elif category in CATEGORY_EXTENSIONS and extension in EXECUTABLE_EXTENSIONS | SCRIPT_EXTENSIONS:
+        reasons.append(f"Расширение {extension} не соответствует содержимому")
+
+    for match in matches:
+        reasons.append(f"Сигнатура {match['rule']}: {match['description']}")
+
+    # Пара байтов сигнатуры в начале ничего не доказывает: чистым считаем только
+    # изображение с целой структурой и текст целиком, с энтропией обычного текста
+    structure_intact = False
+    if category == "image":
+        problem = image_problem(data)
+        if problem and problem != "формат изображения не проверяется":
+            reasons.append(f"Структура изображения нарушена: {problem}")
+        structure_intact = problem is None
+    elif category == "text":
+        try:
+            data.decode("utf-8")
+            structure_intact = entropy <= TEXT_MAX_ENTROPY
+        except UnicodeDecodeError:
+            reasons.append("Текст содержит двоичные данные")
+
+    if any(match["severity"] == "malicious" for match in matches):
+        verdict, conclusive = "malicious", True
+    elif reasons:
+        verdict, conclusive = "suspicious", False
+    elif structure_intact:
+        # Целые изображения и обычный текст без сигнатур нет смысла отправлять в VirusTotal
+        verdict, conclusive = "clean", True
+    else:
+        verdict, conclusive = "unknown", False
+
+    return {
+        "file_type": file_type,
+        "category": category,
+        "size": len(data),
+        "entropy": round(entropy, 2),
+        "sections": sections,
+        "packed_sections": packed_sections,
+        "matches": matches,
+        "reasons": reasons,
+        "verdict": verdict,
+        "conclusive": conclusive,
+    }
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PRESCAN_WORKERS)
+    return _executor
+
+
+async def prescan(data: bytes, filename: str) -> Dict[str, Any]:
+    """Запускает analyze() в пуле процессов, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), analyze, data, filename)
+
+
+def shutdown_prescan():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
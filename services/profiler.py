@@ -0,0 +1,196 @@
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from types import CodeType
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import PROFILER_INTERVAL, PROFILER_DIR, PROFILER_MAX_REPORTS
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Сколько секунд истории стеков держать в памяти
+HISTORY_SECONDS = 120
+TOP_FUNCTIONS = 30
+TOP_STACKS = 15
+
+Frame = Tuple[CodeType, int]
+
+
+def describe_code(code: CodeType) -> str:
+    path = code.co_filename
+    if "site-packages" + os.sep in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    elif path.startswith(PROJECT_ROOT):
+        path = os.path.relpath(path, PROJECT_ROOT)
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{code.co_firstlineno}({code.co_name})"
+
+
+class StackSampler:
+    """
+    Семплирующий профилировщик потока с event loop
+
+    Фоновый поток раз в interval секунд снимает стек потока event loop и
+    складывает его в кольцевой буфер, но только пока есть хотя бы одно
+    отслеживаемое обновление. Стеки потом можно отнести к конкретному
+    обработчику: если его корутина сейчас выполнялась, её кадр есть в стеке.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL):
+        self.interval = interval
+        self.samples: "deque[Tuple[float, Tuple[Frame, ...]]]" = deque(maxlen=int(HISTORY_SECONDS / interval))
+        self._active = 0
+        self._wakeup = threading.Event()
+        self._target_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._target_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def begin(self):
+        self._active += 1
+        self._wakeup.set()
+
+    def end(self):
+        self._active -= 1
+        if self._active <= 0:
+            self._active = 0
+            self._wakeup.clear()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+
+            frame = sys._current_frames().get(self._target_thread)
+            stack = []
+            while frame is not None:
+                stack.append((frame.f_code, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.samples.append((time.perf_counter(), tuple(stack)))
+
+            time.sleep(self.interval)
+
+    def collect(self, started: float, finished: float, code: CodeType) -> Tuple[List[Tuple[Frame, ...]], int]:
+        """
+        Стеки за интервал, в которых выполнялся код обработчика, обрезанные по его кадру
+
+        Returns:
+            Стеки обработчика и общее число семплов за интервал
+        """
+        result = []
+        window = 0
+
+        for timestamp, stack in reversed(list(self.samples)):
+            if timestamp < started:
+                break
+            if timestamp > finished:
+                continue
+            window += 1
+            for depth, (frame_code, _) in enumerate(stack):
+                if frame_code is code:
+                    result.append(stack[:depth + 1])
+                    break
+
+        return result, window
+
+
+def build_report(handler: str, update_type: str, update_id: Optional[int], reason: str,
+                 duration: float, stacks: List[Tuple[Frame, ...]], window: int,
+                 breakdown: Dict[str, float]) -> Dict[str, Any]:
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    collapsed: Counter = Counter()
+
+    for stack in stacks:
+        names = [describe_code(code) for code, _ in stack]
+        _, leaf_line = stack[0]
+        self_counts[f"{names[0]}@{leaf_line}"] += 1
+        for name in set(names):
+            total_counts[name] += 1
+        collapsed[";".join(reversed(names))] += 1
+
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "handler": handler,
+        "update_type": update_type,
+        "update_id": update_id,
+        "reason": reason,
+        "duration_ms": round(duration * 1000, 1),
+        # Семплы идут неравномерно (поток ждёт GIL), поэтому время оценивается долей семплов
+        "on_loop_ms": round(duration * 1000 * len(stacks) / window, 1) if window else 0.0,
+        "samples": len(stacks),
+        "breakdown": {
+            key.replace("_seconds", "_ms"): round(value * 1000, 1) if key.endswith("_seconds") else value
+            for key, value in breakdown.items()
+        },
+        "self": self_counts.most_common(TOP_FUNCTIONS),
+        "total": total_counts.most_common(TOP_FUNCTIONS),
+        "stacks": collapsed.most_common(TOP_STACKS),
+    }
+
+
+def write_report(report: Dict[str, Any], directory: str = PROFILER_DIR, max_reports: int = PROFILER_MAX_REPORTS) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.time_ns()}_{report['handler']}.json")
+
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, separators=(",", ":"))
+
+    # Ротация: оставляем только последние max_reports отчётов
+    reports = sorted(glob.glob(os.path.join(directory, "*.json")))
+    for old_path in reports[:-max_reports]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    return path
+
+
+def load_reports(limit: int, directory: str = PROFILER_DIR) -> List[Dict[str, Any]]:
+    reports = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json")))[-limit:]:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                reports.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return reports
+
+
+def summarize_reports(reports: List[Dict[str, Any]], top: int = 10) -> Dict[str, Any]:
+    """Сводка по нескольким отчётам: самые горячие функции и самые медленные обработчики"""
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    handlers: Dict[str, List[float]] = {}
+    breakdown: Counter = Counter()
+
+    for report in reports:
+        self_counts.update(dict(report["self"]))
+        total_counts.update(dict(report["total"]))
+        handlers.setdefault(report["handler"], []).append(report["duration_ms"])
+        breakdown["on_loop_ms"] += report["on_loop_ms"]
+        for key in ("db_ms", "external_ms", "fsm_ms"):
+            breakdown[key] += report["breakdown"].get(key, 0)
+        breakdown["duration_ms"] += report["duration_ms"]
+
+    return {
+        "reports": len(reports),
+        "self": self_counts.most_common(top),
+        "total": total_counts.most_common(top),
+        "handlers": sorted(
+            ((name, len(durations), sum(durations) / len(durations)) for name, durations in handlers.items()),
+            key=lambda item: item[1] * item[2],
+            reverse=True
+        )[:top],
+        "breakdown": dict(breakdown),
+    }
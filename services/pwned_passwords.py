@@ -1,6 +1,72 @@
+import asyncio
 import hashlib
+import re
+import time
 import aiohttp
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, List, Optional, Callable, Awaitable
+
+from config import (
+    PWNED_PASSWORDS_API_URL, HIBP_TIMEOUT, HIBP_HEDGE_DELAY, HIBP_CACHE_SIZE, HIBP_CACHE_TTL, AUDIT_CONCURRENCY
+)
+from services.cache import TTLCache
+from services.resilience import fetch, ServiceUnavailable
+
+# Ответы /range по префиксу хеша: одинаковы для всех паролей с этим префиксом
+RANGE_CACHE = TTLCache(HIBP_CACHE_SIZE, HIBP_CACHE_TTL)
+
+SHA1_HEX = re.compile(r"[0-9a-fA-F]{40}")
+
+# Вызывается по мере проверки префиксов: сколько проверено и сколько всего
+AuditProgress = Callable[[int, int], Awaitable[None]]
+
+
+async def fetch_range(session: aiohttp.ClientSession, prefix: str, hedge_delay: float = HIBP_HEDGE_DELAY,
+                      store: bool = True) -> Optional[str]:
+    """
+    Получает список суффиксов хешей для префикса из кэша или API
+
+    Returns:
+        Ответ /range или None, если API ответил ошибкой
+
+    Raises:
+        ServiceUnavailable: API недоступен, а в кэше ничего нет
+    """
+    hashes_data = RANGE_CACHE.get(prefix)
+    if hashes_data is not None:
+        return hashes_data
+
+    try:
+        status, hashes_data = await fetch(
+            session, "GET", f'{PWNED_PASSWORDS_API_URL}/range/{prefix}',
+            service="hibp", endpoint="range",
+            timeout=HIBP_TIMEOUT, hedge_delay=hedge_delay,
+            headers={'User-Agent': 'CyberSecurityBot'}
+        )
+    except ServiceUnavailable:
+        # Сервис недоступен: отвечаем по устаревшему кэшу, если он есть
+        hashes_data = RANGE_CACHE.get_stale(prefix)
+        if hashes_data is None:
+            raise
+        return hashes_data
+
+    if status != 200:
+        return None
+
+    if store:
+        RANGE_CACHE.set(prefix, hashes_data)
+    return hashes_data
+
+
+def find_suffix(hashes_data: str, suffix: str) -> int:
+    """Сколько раз суффикс встречался в утечках; ищем подстроку, не разбирая весь ответ"""
+    # Строки имеют формат SUFFIX:COUNT
+    start = hashes_data.find(f"{suffix}:")
+    while start > 0 and hashes_data[start - 1] != "\n":
+        start = hashes_data.find(f"{suffix}:", start + 1)
+    if start < 0:
+        return 0
+    end = hashes_data.find("\n", start)
+    return int(hashes_data[start + len(suffix) + 1:end if end >= 0 else None].strip() or 0)
 
 
 async def check_password(password: str) -> Dict[str, Any]:
@@ -21,47 +87,51 @@ async def check_password(password: str) -> Dict[str, Any]:
         prefix = sha1_hash[:5]
         suffix = sha1_hash[5:]
         
-        # Запрашиваем данные с API
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'https://api.pwnedpasswords.com/range/{prefix}', 
-                                  headers={'User-Agent': 'CyberSecurityBot'}) as response:
-                
-                if response.status != 200:
-                    return {
-                        "success": False,
-                        "message": "Не удалось подключиться к API. Попробуйте позже.",
-                        "found": False,
-                        "count": 0
-                    }
-                
-                # Получаем текстовый ответ
-                hashes_data = await response.text()
-                
-                # Ищем соответствие в возвращенных хешах
-                for line in hashes_data.splitlines():
-                    # Строки имеют формат SUFFIX:COUNT
-                    parts = line.split(':')
-                    
-                    if len(parts) != 2:
-                        continue
-                        
-                    hash_suffix, count = parts[0], int(parts[1])
-                    
-                    if hash_suffix == suffix:
-                        return {
-                            "success": True,
-                            "message": f"Пароль найден в {count:,} утечках!",
-                            "found": True,
-                            "count": count
-                        }
+        try:
+            async with aiohttp.ClientSession() as session:
+                hashes_data = await fetch_range(session, prefix)
+        except ServiceUnavailable as e:
+            return {
+                "success": False,
+                "message": "Сервис проверки утечек временно недоступен. Попробуйте позже.",
+                "found": False,
+                "count": 0,
+                "error": str(e)
+            }
+        
+        if hashes_data is None:
+            return {
+                "success": False,
+                "message": "Не удалось подключиться к API. Попробуйте позже.",
+                "found": False,
+                "count": 0
+            }
+        
+        # Ищем соответствие в возвращенных хешах
+        for line in hashes_data.splitlines():
+            # Строки имеют формат SUFFIX:COUNT
+            parts = line.split(':')
+            
+            if len(parts) != 2:
+                continue
                 
-                # Если соответствие не найдено
+            hash_suffix, count = parts[0], int(parts[1])
+            
+            if hash_suffix == suffix:
                 return {
                     "success": True,
-                    "message": "Пароль не найден в известных утечках данных.",
-                    "found": False,
-                    "count": 0
+                    "message": f"Пароль найден в {count:,} утечках!",
+                    "found": True,
+                    "count": count
                 }
+        
+        # Если соответствие не найдено
+        return {
+            "success": True,
+            "message": "Пароль не найден в известных утечках данных.",
+            "found": False,
+            "count": 0
+        }
                 
     except Exception as e:
         return {
@@ -70,4 +140,91 @@ async def check_password(password: str) -> Dict[str, Any]:
             "found": False,
             "count": 0,
             "error": str(e)
-        } 
\ No newline at end of file
+        }
+
+
+def hash_audit_lines(content: bytes) -> Tuple[List[str], List[int], Dict[str, int]]:
+    """
+    Превращает файл с паролями или SHA-1 хешами в список хешей
+
+    Строка из 40 шестнадцатеричных символов считается хешем, остальные —
+    паролями и хешируются. Сами пароли дальше не используются.
+
+    Returns:
+        SHA-1 хеши, номера их строк в файле (пустые строки пропускаются) и счётчики строк
+    """
+    hashes = []
+    line_numbers = []
+    stats = {"lines": 0, "passwords": 0, "hashes": 0}
+
+    for number, line in enumerate(content.decode("utf-8-sig", errors="replace").splitlines(), 1):
+        if not line:
+            continue
+        stats["lines"] += 1
+        line_numbers.append(number)
+        if SHA1_HEX.fullmatch(line.strip()):
+            stats["hashes"] += 1
+            hashes.append(line.strip().upper())
+        else:
+            stats["passwords"] += 1
+            hashes.append(hashlib.sha1(line.encode("utf-8")).hexdigest().upper())
+
+    return hashes, line_numbers, stats
+
+
+async def audit_hashes(hashes: List[str], on_progress: Optional[AuditProgress] = None) -> Dict[str, Any]:
+    """
+    Проверяет много SHA-1 хешей, запрашивая каждый префикс один раз
+
+    Хеши группируются по первым пяти символам, и префиксы проверяются не больше
+    чем AUDIT_CONCURRENCY запросами одновременно. Ответы не дублируются
+    (hedging выключен) и не вытесняют из кэша ответы для /check_password.
+
+    Returns:
+        Dict с числом утечек для каждого хеша (-1 — проверить не удалось) и статистикой
+    """
+    started = time.perf_counter()
+    by_prefix: Dict[str, List[int]] = {}
+    for index, sha1_hash in enumerate(hashes):
+        by_prefix.setdefault(sha1_hash[:5], []).append(index)
+
+    counts = [0] * len(hashes)
+    prefixes = iter(by_prefix.items())
+    progress = {"done": 0, "failed": 0}
+
+    async def worker(session: aiohttp.ClientSession):
+        for prefix, indexes in prefixes:
+            try:
+                hashes_data = await fetch_range(session, prefix, hedge_delay=0.0, store=False)
+            except ServiceUnavailable:
+                hashes_data = None
+
+            if hashes_data is None:
+                progress["failed"] += 1
+                for index in indexes:
+                    counts[index] = -1
+            else:
+                for index in indexes:
+                    counts[index] = find_suffix(hashes_data, hashes[index][5:])
+
+            progress["done"] += 1
+            if on_progress:
+                await on_progress(progress["done"], len(by_prefix))
+
+    async with aiohttp.ClientSession() as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(min(AUDIT_CONCURRENCY, len(by_prefix)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # При ошибке одного обработчика остальные не должны работать с закрытой сессией
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    return {
+        "counts": counts,
+        "unique": len(set(hashes)),
+        "prefixes": len(by_prefix),
+        "failed_prefixes": progress["failed"],
+        "seconds": time.perf_counter() - started,
+    }
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from config import EXTERNAL_RETRIES, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+from services.metrics import track_request, CIRCUIT_BREAKER_STATE, EXTERNAL_RETRIES_TOTAL, HEDGED_REQUESTS
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Ошибки сервера, которые считаются отказом зависимости (429 — нет, сервис жив)
+FAILURE_STATUSES = {500, 502, 503, 504}
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+# Если сервис просит подождать дольше, отвечаем пользователю сразу
+MAX_RETRY_AFTER = 30.0
+
+# Момент (time.monotonic), к которому обработчик должен получить ответ
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class ServiceUnavailable(Exception):
+    """Внешний сервис недоступен: цепь разомкнута, повторы исчерпаны или истёк срок"""
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Ограничивает время ожидания внешних сервисов внутри блока
+
+    Вложенный срок не может быть позже внешнего. Задачи, созданные внутри блока,
+    наследуют срок вместе с контекстом.
+    """
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до срока или None, если срок не задан"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для одного эндпоинта
+
+    После failure_threshold отказов подряд цепь размыкается, и запросы сразу
+    получают ServiceUnavailable. Через reset_timeout секунд пропускается один
+    пробный запрос: успех замыкает цепь, отказ снова размыкает её.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> int:
+        if self.failures < self.failure_threshold:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.HALF_OPEN:
+            now = time.monotonic()
+            # Пробный запрос мог быть отменён, не сообщив результат, — тогда разрешаем следующий
+            if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+                self._probe_started = now
+                return True
+        return state == self.CLOSED
+
+    def record_success(self):
+        if self.failures >= self.failure_threshold:
+            logging.info(f"Цепь {self.name} снова замкнута")
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self._probe_started is not None or self.failures == self.failure_threshold:
+                logging.warning(f"Цепь {self.name} разомкнута на {self.reset_timeout:.0f} с")
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(service: str, endpoint: str) -> CircuitBreaker:
+    name = f"{service}:{endpoint}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+        CIRCUIT_BREAKER_STATE.set_function(lambda: breaker.state, service, endpoint)
+    return breaker
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After бывает числом секунд или HTTP-датой"""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    # Полный джиттер: клиенты не повторяют запросы синхронно
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def _attempt(session: aiohttp.ClientSession, method: str, url: str, service: str, endpoint: str,
+                   timeout: float, kwargs: Dict[str, Any]) -> Tuple[int, str, Optional[str]]:
+    if callable(kwargs.get("data")):
+        # FormData нельзя отправить повторно, поэтому тело собирается на каждую попытку
+        kwargs = {**kwargs, "data": kwargs["data"]()}
+
+    async with track_request(service, endpoint) as request, \
+            session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs) as response:
+        request["status"] = response.status
+        return response.status, await response.text(), response.headers.get("Retry-After")
+
+
+async def _hedged(session: aiohttp.ClientSession, method: str, url: str, service: str, endpoint: str,
+                  timeout: float, hedge_delay: float, kwargs: Dict[str, Any]) -> Tuple[int, str, Optional[str]]:
+    """Если ответ не пришёл за hedge_delay, отправляет второй такой же запрос и берёт первый удачный"""
+    tasks = {asyncio.create_task(_attempt(session, method, url, service, endpoint, timeout, kwargs))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done:
+            HEDGED_REQUESTS.inc(service, endpoint)
+            tasks.add(asyncio.create_task(
+                _attempt(session, method, url, service, endpoint, max(timeout - hedge_delay, 0.01), kwargs)
+            ))
+
+        result, error = None, None
+        pending = tasks
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif task.result()[0] not in RETRY_STATUSES:
+                    return task.result()
+                else:
+                    result = task.result()
+
+        if result is not None:
+            return result
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def fetch(session: aiohttp.ClientSession, method: str, url: str, *, service: str, endpoint: str,
+                timeout: float, retries: int = EXTERNAL_RETRIES, hedge_delay: float = 0.0,
+                **kwargs: Any) -> Tuple[int, str]:
+    """
+    Запрос к внешнему API с размыкателем цепи, повторами и сроком
+
+    Повторяет запрос при сетевых ошибках, таймаутах, 429 и 5xx с экспоненциальной
+    задержкой и джиттером, соблюдая Retry-After. Время каждой попытки ограничено
+    timeout и сроком из deadline(). Если data — функция, тело запроса собирается
+    заново на каждую попытку.
+
+    Returns:
+        Код ответа и тело ответа
+
+    Raises:
+        ServiceUnavailable: цепь разомкнута, повторы исчерпаны или срок истёк
+    """
+    breaker = get_breaker(service, endpoint)
+    attempt = 0
+
+    while True:
+        if not breaker.allow():
+            raise ServiceUnavailable(f"{service} временно недоступен")
+
+        budget = remaining()
+        if budget is not None and budget <= 0:
+            raise ServiceUnavailable(f"Истёк срок ожидания {service}")
+        attempt_timeout = timeout if budget is None else min(timeout, budget)
+
+        retry_after = None
+        try:
+            if hedge_delay and hedge_delay < attempt_timeout:
+                status, body, retry_after_header = await _hedged(
+                    session, method, url, service, endpoint, attempt_timeout, hedge_delay, kwargs
+                )
+            else:
+                status, body, retry_after_header = await _attempt(
+                    session, method, url, service, endpoint, attempt_timeout, kwargs
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record_failure()
+            reason = type(e).__name__
+            logging.warning(f"Ошибка запроса к {service}/{endpoint} (попытка {attempt + 1}): {reason}")
+        else:
+            if status not in RETRY_STATUSES:
+                breaker.record_success()
+                return status, body
+            if status in FAILURE_STATUSES:
+                breaker.record_failure()
+            reason = str(status)
+            retry_after = parse_retry_after(retry_after_header)
+            logging.warning(f"{service}/{endpoint} ответил {status} (попытка {attempt + 1})")
+
+        attempt += 1
+        delay = retry_after if retry_after is not None else backoff(attempt)
+        budget = remaining()
+
+        if attempt > retries or delay > MAX_RETRY_AFTER or (budget is not None and delay >= budget):
+            raise ServiceUnavailable(f"{service} не ответил: {reason}")
+
+        EXTERNAL_RETRIES_TOTAL.inc(service, endpoint, reason)
+        await asyncio.sleep(delay)
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, delete, func, case, or_, not_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import RETENTION_DAYS, RETENTION_INTERVAL, RETENTION_BATCH_SIZE, RETENTION_BATCH_PAUSE
+from database import async_session, current_engine, current_tenant, use_tenant, tenants, TENANT_SCHEMA
+from models.models import PhishingLog, PhishingCampaign, PhishingDailyStat, TestResult, TestDailyStat
+from services.campaigns import answered_filter
+from services.metrics import RETENTION_ROWS, RETENTION_RECLAIMED, RETENTION_DURATION
+
+# Сколько страниц освобождать за один вызов incremental_vacuum
+VACUUM_PAGES_PER_STEP = 1000
+
+_task: Optional[asyncio.Task] = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _rollup_phishing(ids: List[int]):
+    answered = answered_filter()
+    columns = ["day", "user_id", "scenario_id", "answered", "clicked", "unanswered"]
+    query = select(
+        func.date(PhishingLog.date),
+        PhishingLog.user_id,
+        func.coalesce(PhishingLog.scenario_id, ""),
+        func.sum(case((answered, 1), else_=0)),
+        func.sum(case((answered & PhishingLog.clicked.is_(True), 1), else_=0)),
+        func.sum(case((not_(answered), 1), else_=0)),
+    ).where(PhishingLog.id.in_(ids)).group_by(
+        func.date(PhishingLog.date), PhishingLog.user_id, func.coalesce(PhishingLog.scenario_id, "")
+    )
+
+    stmt = sqlite_insert(PhishingDailyStat).from_select(columns, query)
+    return stmt.on_conflict_do_update(
+        index_elements=["day", "user_id", "scenario_id"],
+        set_={
+            "answered": PhishingDailyStat.answered + stmt.excluded.answered,
+            "clicked": PhishingDailyStat.clicked + stmt.excluded.clicked,
+            "unanswered": PhishingDailyStat.unanswered + stmt.excluded.unanswered,
+        }
+    )
+
+
+def _rollup_tests(ids: List[int]):
+    columns = ["day", "user_id", "theme", "attempts", "score_sum", "best_score"]
+    query = select(
+        func.date(TestResult.date),
+        TestResult.user_id,
+        TestResult.theme,
+        func.count(),
+        func.sum(TestResult.score),
+        func.max(TestResult.score),
+    ).where(TestResult.id.in_(ids)).group_by(func.date(TestResult.date), TestResult.user_id, TestResult.theme)
+
+    stmt = sqlite_insert(TestDailyStat).from_select(columns, query)
+    return stmt.on_conflict_do_update(
+        index_elements=["day", "user_id", "theme"],
+        set_={
+            "attempts": TestDailyStat.attempts + stmt.excluded.attempts,
+            "score_sum": TestDailyStat.score_sum + stmt.excluded.score_sum,
+            "best_score": func.max(TestDailyStat.best_score, stmt.excluded.best_score),
+        }
+    )
+
+
+# Таблица -> (модель, построитель INSERT свёртки по списку id)
+ROLLUPS = {
+    "phishing_logs": (PhishingLog, _rollup_phishing),
+    "test_results": (TestResult, _rollup_tests),
+}
+
+
+def _expired(model, cutoff: datetime):
+    condition = model.date < cutoff
+    if model is PhishingLog:
+        # Письма идущих кампаний ещё ждут ответа, их не трогаем
+        active = select(PhishingCampaign.id).where(PhishingCampaign.status.in_(("scheduled", "running")))
+        condition &= or_(PhishingLog.campaign_id.is_(None), PhishingLog.campaign_id.notin_(active))
+    return condition
+
+
+async def rollup_table(table_name: str, cutoff: datetime, batch_size: int = RETENTION_BATCH_SIZE,
+                       pause: float = RETENTION_BATCH_PAUSE) -> int:
+    """
+    Сворачивает записи старше cutoff в дневные итоги и удаляет их
+
+    Каждая пачка — отдельная короткая транзакция: свёртка и удаление
+    одних и тех же id. Между пачками обслуживание уступает базу
+    обработчикам, поэтому запись ответов и переходов не ждёт долго.
+    """
+    model, rollup = ROLLUPS[table_name]
+    total = 0
+
+    while True:
+        async with async_session() as session:
+            ids = (await session.scalars(
+                select(model.id).where(_expired(model, cutoff)).order_by(model.id).limit(batch_size)
+            )).all()
+            if not ids:
+                break
+
+            await session.execute(rollup(ids))
+            await session.execute(delete(model).where(model.id.in_(ids)))
+            await session.commit()
+
+        total += len(ids)
+        RETENTION_ROWS.inc(table_name, value=len(ids))
+        if len(ids) < batch_size:
+            break
+        await asyncio.sleep(pause)
+
+    return total
+
+
+async def _pragma(conn, schema: str, name: str) -> int:
+    return (await conn.exec_driver_sql(f"PRAGMA {schema}{name}")).scalar() or 0
+
+
+async def compact() -> Dict[str, int]:
+    """
+    Возвращает свободные страницы файловой системе и обновляет статистику планировщика
+
+    В базе без auto_vacuum=INCREMENTAL освободить место частями нельзя:
+    режим включается один раз полным VACUUM, дальше хватает incremental_vacuum.
+    """
+    schema = f"{TENANT_SCHEMA}." if current_tenant.get() else ""
+
+    async with current_engine().connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        page_size = await _pragma(conn, schema, "page_size")
+        size_before = await _pragma(conn, schema, "page_count") * page_size
+
+        if await _pragma(conn, schema, "auto_vacuum") != 2:
+            logging.warning("Включаю auto_vacuum=INCREMENTAL: база будет один раз пересобрана через VACUUM")
+            await conn.exec_driver_sql(f"PRAGMA {schema}auto_vacuum = INCREMENTAL")
+            await conn.exec_driver_sql(f"VACUUM {schema.rstrip('.')}")
+
+        # Освобождаем страницы частями, чтобы не держать блокировку записи долго
+        free_pages = await _pragma(conn, schema, "freelist_count")
+        while free_pages > 0:
+            (await conn.exec_driver_sql(f"PRAGMA {schema}incremental_vacuum({VACUUM_PAGES_PER_STEP})")).fetchall()
+            remaining = await _pragma(conn, schema, "freelist_count")
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+            await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+        size_after = await _pragma(conn, schema, "page_count") * page_size
+        await conn.exec_driver_sql(f"PRAGMA {schema}optimize")
+
+    return {"size_before": size_before, "size_after": size_after, "reclaimed": max(size_before - size_after, 0)}
+
+
+async def run_maintenance(retention_days: int = RETENTION_DAYS) -> Dict[str, Any]:
+    """Свёртка старых записей и сжатие базы текущей организации"""
+    started = time.perf_counter()
+    cutoff = _utcnow() - timedelta(days=retention_days)
+
+    rows = {table_name: await rollup_table(table_name, cutoff) for table_name in ROLLUPS}
+    space = await compact()
+
+    seconds = time.perf_counter() - started
+    RETENTION_RECLAIMED.inc(value=space["reclaimed"])
+    RETENTION_DURATION.observe(seconds)
+
+    report = {"tenant": current_tenant.get(), "rows": rows, **space, "seconds": seconds}
+    logging.info(
+        f"Обслуживание базы{' ' + report['tenant'] if report['tenant'] else ''}: свёрнуто "
+        f"{', '.join(f'{name} {count}' for name, count in rows.items())}, "
+        f"освобождено {space['reclaimed'] // 1024} КБ за {seconds:.1f} с"
+    )
+    return report
+
+
+def format_maintenance(report: Dict[str, Any]) -> str:
+    rows = "".join(f"• {name}: {count:,}\n" for name, count in report["rows"].items())
+    return (
+        f"<b>Обслуживание базы{' ' + report['tenant'] if report['tenant'] else ''}</b>\n\n"
+        f"Свёрнуто в дневные итоги:\n{rows}"
+        f"Размер: {report['size_before'] // 1024} КБ → {report['size_after'] // 1024} КБ "
+        f"(освобождено {report['reclaimed'] // 1024} КБ)\n"
+        f"Время: {report['seconds']:.1f} с"
+    )
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        # Основная база и базы всех организаций
+        for tenant in (None, *tenants()):
+            with use_tenant(tenant):
+                try:
+                    await run_maintenance()
+                except Exception as e:
+                    logging.exception(f"Ошибка обслуживания базы: {str(e)}")
+
+
+def start_maintenance():
+    global _task
+    if RETENTION_DAYS > 0 and _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop_maintenance():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,113 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import HISTORY_PAGE_SIZE, KNOWN_FILES_SIZE, KNOWN_FILES_TTL
+from models.models import ScanReport
+from services.cache import TTLCache
+
+# Отчёт VirusTotal с полным списком антивирусов сжимается в 5–10 раз
+COMPRESSION_LEVEL = 6
+
+# Колонки для списка: сжатый отчёт читается только при открытии
+_SUMMARY_COLUMNS = (
+    ScanReport.id, ScanReport.file_name, ScanReport.threat_level,
+    ScanReport.detection_ratio, ScanReport.created_at
+)
+
+# file_unique_id -> последний вердикт: пересланные копии файла не скачиваются заново.
+# file_unique_id одинаков у всех ботов, а отчёт хранится сжатым
+KNOWN_FILES = TTLCache(KNOWN_FILES_SIZE, KNOWN_FILES_TTL)
+
+
+def compress_report(report: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(report, ensure_ascii=False, separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+
+
+def decompress_report(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data))
+
+
+async def save_report(session: AsyncSession, user_id: int, file_name: str, sha256: str,
+                      threat_level: str, detection_ratio: Optional[str], report: Dict[str, Any]) -> ScanReport:
+    record = ScanReport(
+        user_id=user_id,
+        file_name=file_name,
+        sha256=sha256,
+        threat_level=threat_level,
+        detection_ratio=detection_ratio,
+        report=compress_report(report)
+    )
+    session.add(record)
+    await session.commit()
+    return record
+
+
+async def get_history_page(session: AsyncSession, user_id: int, at_id: Optional[int] = None,
+                           newer_than: Optional[int] = None,
+                           limit: int = HISTORY_PAGE_SIZE) -> Tuple[List[Any], bool, bool]:
+    """
+    Страница истории проверок, от новых к старым, с keyset-пагинацией
+
+    Страница начинается с отчёта at_id (или с самого нового) либо идёт сразу
+    после newer_than в сторону новых. Запрос читает limit + 1 строк по индексу
+    (user_id, id) без OFFSET, поэтому любая страница стоит как первая.
+
+    Returns:
+        Строки страницы, есть ли более новые и есть ли более старые отчёты
+    """
+    query = select(*_SUMMARY_COLUMNS).where(ScanReport.user_id == user_id)
+
+    if newer_than is not None:
+        rows = (await session.execute(
+            query.where(ScanReport.id > newer_than).order_by(ScanReport.id).limit(limit + 1)
+        )).all()
+        if len(rows) > limit:
+            return list(reversed(rows[:limit])), True, True
+        # Дошли до самых новых — показываем полную первую страницу
+        at_id = None
+
+    if at_id is not None:
+        query = query.where(ScanReport.id <= at_id)
+    rows = (await session.execute(query.order_by(ScanReport.id.desc()).limit(limit + 1))).all()
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+
+    has_newer = False
+    if at_id is not None and rows:
+        has_newer = (await session.scalar(
+            select(ScanReport.id).where(ScanReport.user_id == user_id, ScanReport.id > rows[0].id).limit(1)
+        )) is not None
+
+    return rows, has_newer, has_older
+
+
+async def get_report(session: AsyncSession, user_id: int, report_id: int) -> Optional[Tuple[ScanReport, Dict[str, Any]]]:
+    record = await session.scalar(
+        select(ScanReport).where(ScanReport.id == report_id, ScanReport.user_id == user_id)
+    )
+    if record is None:
+        return None
+    return record, decompress_report(record.report)
+
+
+def remember_file(file_unique_id: str, sha256: str, threat_level: str, detection_ratio: Optional[str],
+                  report: Dict[str, Any], text: str):
+    KNOWN_FILES.set(file_unique_id, {
+        "sha256": sha256,
+        "threat_level": threat_level,
+        "detection_ratio": detection_ratio,
+        "report": compress_report(report),
+        "text": text,
+    })
+
+
+def recall_file(file_unique_id: str) -> Optional[Dict[str, Any]]:
+    """Последний вердикт по файлу, если он ещё не устарел; отчёт уже распакован"""
+    known = KNOWN_FILES.get(file_unique_id)
+    if known is None:
+        return None
+    return {**known, "report": decompress_report(known["report"])}
@@ -0,0 +1,233 @@
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+from config import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_RATE_LIMITS, LOG_SAMPLING, LOG_REDACT
+from services.metrics import LOG_DROPPED
+
+# update_id, user_id, handler и tenant текущего обновления; заполняет LogContextMiddleware
+log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+# Чувствительные значения передаются через extra и в журнал попадают только в скрытом виде
+SENSITIVE_FIELDS = ("file_name", "response")
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TOKEN_PATTERNS = (
+    # Токены ботов Telegram
+    (re.compile(r"\b\d{6,}:[A-Za-z0-9_-]{30,}\b"), "[token]"),
+    # Ключи API в заголовках и параметрах
+    (re.compile(r"(?i)\b(x-apikey|api[_-]?key|apikey|secret)(['\"]?\s*[:=]\s*['\"]?)[^\s'\",}]+"), r"\1\2[скрыто]"),
+)
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "source"}
+_sources: Dict[str, str] = {}
+_listener: Optional[QueueListener] = None
+
+
+def parse_rules(spec: str) -> Dict[str, float]:
+    """'aiogram.event=20,services=100' -> {'aiogram.event': 20.0, 'services': 100.0}"""
+    rules = {}
+    for item in spec.replace(" ", "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            rules[name] = float(value)
+    return rules
+
+
+def record_source(record: logging.LogRecord) -> str:
+    """
+    Источник записи для лимитов и поля source
+
+    Модули бота пишут в корневой логгер, поэтому для них источником
+    считается путь модуля (services.virus_total), а не имя логгера.
+    """
+    if record.name != "root":
+        return record.name
+
+    source = _sources.get(record.pathname)
+    if source is None:
+        path = os.path.relpath(os.path.splitext(os.path.abspath(record.pathname))[0], _PROJECT_ROOT)
+        source = _sources[record.pathname] = "root" if path.startswith("..") else path.replace(os.sep, ".")
+    return source
+
+
+def _match(rules: Dict[str, float], source: str) -> Optional[float]:
+    # Самое длинное совпадение по префиксу: services.analysis_poller важнее services
+    best = None
+    for name, value in rules.items():
+        if (source == name or source.startswith(name + ".")) and (best is None or len(name) > len(best)):
+            best = name
+    return rules[best] if best is not None else None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает шумные источники: выборка и лимит записей в секунду
+
+    Работает в потоке, который пишет запись, поэтому должен быть дешёвым:
+    словари и арифметика, без блокировок (гонки между потоками лишь немного
+    сдвигают лимит). Предупреждения и ошибки не отбрасываются никогда.
+    Число пропущенных записей добавляется к следующей записи источника.
+    """
+
+    def __init__(self, rate_limits: Dict[str, float], sampling: Dict[str, float]):
+        super().__init__()
+        self.rate_limits = rate_limits
+        self.sampling = sampling
+        self._rules: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        # Источник -> (доступно записей, время последнего пополнения)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        source = record_source(record)
+        record.source = source
+
+        if record.levelno >= logging.WARNING:
+            self._attach_suppressed(record, source)
+            return True
+
+        rules = self._rules.get(source)
+        if rules is None:
+            rules = self._rules[source] = (_match(self.rate_limits, source), _match(self.sampling, source))
+        rate, sample = rules
+
+        if sample is not None and random.random() >= sample:
+            # Выборка — обычный режим, а не потеря: в suppressed не считаем
+            return False
+
+        if rate is not None:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(source, (rate, now))
+            tokens = min(rate, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[source] = (tokens, now)
+                self._suppressed[source] = self._suppressed.get(source, 0) + 1
+                LOG_DROPPED.inc(source, "rate_limit")
+                return False
+            self._buckets[source] = (tokens - 1, now)
+
+        self._attach_suppressed(record, source)
+        return True
+
+    def _attach_suppressed(self, record: logging.LogRecord, source: str):
+        suppressed = self._suppressed.pop(source, 0)
+        if suppressed:
+            record.suppressed = suppressed
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь, не дожидаясь записи в stdout
+
+    В вызывающем потоке только подставляются аргументы сообщения и
+    контекст обновления; JSON, трассировки и запись делает поток
+    QueueListener. Если очередь переполнена, запись отбрасывается.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.context = log_context.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(getattr(record, "source", record.name), "queue_full")
+
+
+def _redact_value(name: str, value: Any) -> str:
+    text = str(value)
+    if name == "file_name":
+        # Одинаковые имена дают одинаковую метку, чтобы записи можно было связать
+        return f"file:{hashlib.sha256(text.encode()).hexdigest()[:10]}{os.path.splitext(text)[1][:8]}"
+    return f"[скрыто, {len(text)} симв.]"
+
+
+def redact_text(text: str) -> str:
+    for pattern, replacement in _TOKEN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, источник, сообщение, контекст обновления и поля из extra"""
+
+    def __init__(self, redact: bool = LOG_REDACT):
+        super().__init__()
+        self.redact = redact
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "source": getattr(record, "source", record.name),
+            "message": redact_text(message) if self.redact else message,
+        }
+        entry.update(getattr(record, "context", {}))
+
+        for name, value in vars(record).items():
+            if name in _STANDARD_ATTRIBUTES or name == "context":
+                continue
+            if self.redact and name in SENSITIVE_FIELDS:
+                value = _redact_value(name, value)
+            entry[name] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+            if self.redact:
+                entry["exception"] = redact_text(entry["exception"])
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = LOG_LEVEL, stream=None):
+    """
+    Переводит корневой логгер на очередь с фоновой записью JSON в stdout
+
+    Обработчик корневого логгера только фильтрует запись и кладёт её в
+    очередь, поэтому логирование из event loop не блокируется на выводе.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    handler = ContextQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(parse_rules(LOG_RATE_LIMITS), parse_rules(LOG_SAMPLING)))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
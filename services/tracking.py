@@ -0,0 +1,201 @@
+import asyncio
+import html
+import logging
+from collections import OrderedDict
+from itertools import groupby
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote
+
+from aiohttp import web
+from sqlalchemy import insert
+
+from config import (
+    TRACKING_HOST, TRACKING_PORT, TRACKING_TRAINING_URL,
+    TRACKING_FLUSH_INTERVAL, TRACKING_BATCH_SIZE
+)
+from database import async_session, use_tenant, tenants
+from models.models import PhishingLog
+from services.phishing_scenarios import get_scenario
+from services.percentiles import record_phishing_answers
+from utils.helpers import parse_tracking_token
+
+# Сколько последних токенов помнить для отсева повторных переходов
+DEDUP_WINDOW = 100_000
+# Сколько событий держать в памяти, если БД недоступна
+MAX_PENDING_EVENTS = 100_000
+
+# Превью ссылок Telegram и другие роботы не должны считаться переходами
+BOT_USER_AGENTS = ("telegrambot", "bot", "crawler", "spider", "preview")
+
+
+class ClickWriter:
+    """
+    Пакетная запись переходов в PhishingLog
+
+    record() только добавляет событие в буфер и не обращается к БД; фоновая задача
+    раз в TRACKING_FLUSH_INTERVAL секунд (или при заполнении пачки) вставляет
+    накопленные события одним INSERT. Записи только добавляются, без обновлений.
+    События разных организаций пишутся в их базы отдельными INSERT.
+    """
+
+    def __init__(self, flush_interval: float = TRACKING_FLUSH_INTERVAL, batch_size: int = TRACKING_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[Tuple[Optional[str], Dict[str, Any]]] = []
+        self._seen: "OrderedDict[Tuple[Optional[str], str], None]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, token: str, user_id: int, scenario_id: str, campaign_id: int, tenant: Optional[str] = None) -> bool:
+        key = (tenant, token)
+        if key in self._seen:
+            return False
+
+        self._seen[key] = None
+        if len(self._seen) > DEDUP_WINDOW:
+            self._seen.popitem(last=False)
+
+        self._pending.append((tenant, {
+            "user_id": user_id,
+            "clicked": True,
+            "scenario_id": scenario_id,
+            "campaign_id": campaign_id or None,
+            "status": "clicked"
+        }))
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        failed = []
+
+        for tenant, group in groupby(sorted(batch, key=lambda item: item[0] or ""), key=lambda item: item[0]):
+            events = list(group)
+            try:
+                with use_tenant(tenant):
+                    async with async_session() as session:
+                        await session.execute(insert(PhishingLog), [event for _, event in events])
+                        await session.commit()
+                        await record_phishing_answers(session, [event["user_id"] for _, event in events])
+                self.written += len(events)
+            except Exception as e:
+                logging.exception(f"Не удалось записать {len(events)} переходов: {str(e)}")
+                failed.extend(events)
+
+        if failed:
+            # Возвращаем события в буфер, но не даём ему расти бесконечно
+            self._pending = failed + self._pending
+            overflow = len(self._pending) - MAX_PENDING_EVENTS
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+CLICK_WRITER = web.AppKey("click_writer", ClickWriter)
+
+_training_pages: Dict[str, bytes] = {}
+
+
+def _render_training_page(scenario_id: str) -> bytes:
+    scenario = get_scenario(scenario_id)
+    if not scenario:
+        # Не кэшируем произвольные значения из запроса
+        scenario_id = ""
+
+    if scenario_id not in _training_pages:
+        signs = "".join(f"<li>{html.escape(sign)}</li>" for sign in scenario.get("signs", []))
+        title = html.escape(scenario.get("name", "Фишинг"))
+
+        _training_pages[scenario_id] = (
+            f"<!doctype html><html lang=\"ru\"><head><meta charset=\"utf-8\">"
+            f"<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
+            f"<title>Это была учебная фишинговая ссылка</title></head><body>"
+            f"<h1>Это была учебная фишинговая ссылка</h1>"
+            f"<p>Вы перешли по ссылке из симуляции «{title}». В реальной атаке здесь "
+            f"могли украсть ваши данные или заразить устройство.</p>"
+            f"{f'<h2>Признаки, которые стоило заметить</h2><ul>{signs}</ul>' if signs else ''}"
+            f"<p>Вернитесь в бота и нажмите «Это фишинг?», чтобы разобрать сценарий.</p>"
+            f"</body></html>"
+        ).encode()
+
+    return _training_pages[scenario_id]
+
+
+async def handle_click(request: web.Request) -> web.StreamResponse:
+    token = request.match_info["token"]
+    tenant = request.match_info.get("tenant")
+    if tenant is not None and tenant not in tenants():
+        raise web.HTTPNotFound()
+
+    parsed = parse_tracking_token(token, tenant)
+
+    if parsed is None:
+        raise web.HTTPNotFound()
+
+    user_id, scenario_id, campaign_id = parsed
+    user_agent = request.headers.get("User-Agent", "").lower()
+
+    if not any(marker in user_agent for marker in BOT_USER_AGENTS):
+        request.app[CLICK_WRITER].record(token, user_id, scenario_id, campaign_id, tenant)
+
+    raise web.HTTPFound(f"{TRACKING_TRAINING_URL}?s={quote(scenario_id)}")
+
+
+async def handle_training(request: web.Request) -> web.Response:
+    scenario_id = request.query.get("s", "")
+    return web.Response(body=_render_training_page(scenario_id), content_type="text/html", charset="utf-8")
+
+
+def create_app(writer: ClickWriter) -> web.Application:
+    app = web.Application()
+    app[CLICK_WRITER] = writer
+    app.router.add_get("/c/{token}", handle_click)
+    app.router.add_get("/c/{tenant}/{token}", handle_click)
+    app.router.add_get("/training", handle_training)
+    return app
+
+
+async def start_tracking_server(host: str = TRACKING_HOST, port: int = TRACKING_PORT) -> web.AppRunner:
+    writer = ClickWriter()
+    writer.start()
+
+    runner = web.AppRunner(create_app(writer), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    logging.info(f"Сервер учёта переходов запущен на {host}:{port}")
+    return runner
+
+
+async def stop_tracking_server(runner: web.AppRunner):
+    writer = runner.app[CLICK_WRITER]
+    await runner.cleanup()
+    await writer.stop()
@@ -0,0 +1,306 @@
+import ipaddress
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# У каждого признака фишинга есть вес; ссылка с суммой от MALICIOUS_SCORE
+# считается фишинговой без VirusTotal
+MALICIOUS_SCORE = 3
+# Похожесть на бренд по одному расстоянию бывает и у обычных доменов (stream.com
+# и steam), поэтому сама по себе она только отправляет ссылку в VirusTotal
+LOOKALIKE_WEIGHT = 2
+
+# Бренды, которые чаще всего подделывают, и их официальные домены
+BRANDS: Dict[str, Tuple[str, ...]] = {
+    "google": ("google.com", "google.ru", "googleapis.com", "googleusercontent.com", "gstatic.com", "youtube.com"),
+    "gmail": ("gmail.com",),
+    "yandex": ("yandex.ru", "yandex.com", "ya.ru", "yandex.net", "yastatic.net"),
+    "mail": ("mail.ru",),
+    "vk": ("vk.com", "vk.ru", "vk.me", "userapi.com"),
+    "sberbank": ("sberbank.ru", "sberbank.com", "sber.ru"),
+    "sber": ("sber.ru", "sberbank.ru"),
+    "tinkoff": ("tinkoff.ru", "tbank.ru"),
+    "alfabank": ("alfabank.ru",),
+    "vtb": ("vtb.ru",),
+    "gosuslugi": ("gosuslugi.ru",),
+    "ozon": ("ozon.ru",),
+    "wildberries": ("wildberries.ru", "wb.ru"),
+    "avito": ("avito.ru",),
+    "telegram": ("telegram.org", "telegram.me", "t.me"),
+    "whatsapp": ("whatsapp.com", "whatsapp.net"),
+    "paypal": ("paypal.com", "paypalobjects.com", "paypal.me"),
+    "apple": ("apple.com", "icloud.com", "cdn-apple.com", "mzstatic.com"),
+    "icloud": ("icloud.com", "icloud-content.com"),
+    "microsoft": (
+        "microsoft.com", "live.com", "office.com", "microsoftonline.com", "office365.com", "outlook.com",
+        "windows.net", "azure.com", "sharepoint.com", "msn.com", "bing.com",
+    ),
+    "amazon": ("amazon.com", "amazonaws.com", "media-amazon.com", "ssl-images-amazon.com"),
+    "facebook": ("facebook.com", "fbcdn.net", "facebook.net"),
+    "instagram": ("instagram.com", "cdninstagram.com"),
+    "netflix": ("netflix.com",),
+    "steam": ("steampowered.com", "steamcommunity.com", "steamstatic.com"),
+    "github": ("github.com", "githubusercontent.com", "github.io"),
+}
+
+# Домены брендов, на которых размещаются чужие сайты и файлы: подделкой бренда они
+# не считаются, но и официальным сайтом тоже — такие ссылки проверяет VirusTotal
+USER_CONTENT_DOMAINS = frozenset({
+    "googleapis.com", "googleusercontent.com", "userapi.com", "windows.net", "sharepoint.com",
+    "amazonaws.com", "githubusercontent.com", "github.io",
+})
+
+# Зоны, где регистрируют больше всего фишинговых доменов
+SUSPICIOUS_TLDS = frozenset({
+    "zip", "mov", "xyz", "top", "tk", "ml", "ga", "cf", "gq", "click", "link", "work", "rest", "country",
+    "kim", "loan", "review", "buzz", "icu", "cam", "monster", "quest", "support", "sbs", "cfd", "lol",
+})
+
+URL_SHORTENERS = frozenset({
+    "bit.ly", "tinyurl.com", "t.co", "goo.gl", "is.gd", "cutt.ly", "clck.ru", "goo.su", "ow.ly", "rb.gy",
+    "shorturl.at", "tiny.cc", "v.gd",
+})
+
+# Зоны второго уровня, в которых регистрируемый домен состоит из трёх меток
+MULTI_PART_SUFFIXES = frozenset({
+    "co.uk", "org.uk", "com.ru", "net.ru", "org.ru", "msk.ru", "spb.ru", "com.ua", "com.br", "co.jp",
+    "com.au", "com.tr", "co.in",
+})
+
+CREDENTIAL_WORDS = re.compile(r"login|signin|verif|secure|account|update|support|password|wallet|bonus|unlock")
+HOST_CHARS = re.compile(r"^[^\s/\\?#@:]+\.[^\s/\\?#@:]+$")
+URL_IN_TEXT = re.compile(r"(?:[a-z][a-z0-9+.-]*://)?[^\s<>\"']+\.[^\s<>\"']+", re.IGNORECASE)
+
+# Символы других алфавитов, неотличимые от латинских, и цифры вместо похожих букв
+HOMOGLYPHS = {
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "і": "i", "ї": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w",
+    "ɡ": "g", "ɑ": "a", "ı": "i", "ℓ": "l",
+    "α": "a", "β": "b", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t", "υ": "u",
+    "χ": "x", "ω": "w",
+    "0": "o", "1": "l",
+}
+
+# Таблицы собираются один раз при импорте: проверка ссылки — только поиск по ним
+SKELETON_TABLE = str.maketrans(HOMOGLYPHS)
+SCRIPT_TABLE: Dict[int, str] = {
+    **{code: "latin" for code in range(ord("a"), ord("z") + 1)},
+    **{code: "latin" for code in range(0x00C0, 0x0250)},
+    **{code: "greek" for code in range(0x0370, 0x0400)},
+    **{code: "cyrillic" for code in range(0x0400, 0x0530)},
+}
+OFFICIAL_DOMAINS: Dict[str, str] = {domain: brand for brand, domains in BRANDS.items() for domain in domains}
+# Короткие названия ищем только целым словом, иначе «mail» найдётся в «gmail»
+BRAND_WORDS = frozenset(brand for brand in BRANDS if len(brand) < 5)
+BRAND_SUBSTRINGS = re.compile("|".join(sorted((re.escape(b) for b in BRANDS if len(b) >= 5), key=len, reverse=True)))
+# Допустимое число правок: две — только для длинных названий, у коротких это почти любое слово
+BRAND_DISTANCE: Dict[str, int] = {brand: 2 if len(brand) >= 9 else 1 for brand in BRANDS if len(brand) >= 5}
+# Бренды по длине названия: расстояние считается только с близкими по длине
+BRANDS_BY_LENGTH: Dict[int, List[str]] = {}
+for _brand, _limit in BRAND_DISTANCE.items():
+    for _length in range(len(_brand) - _limit, len(_brand) + _limit + 1):
+        BRANDS_BY_LENGTH.setdefault(_length, []).append(_brand)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау–Левенштейна (с перестановкой соседних букв); больше limit не считается"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def skeleton(text: str) -> str:
+    return text.translate(SKELETON_TABLE)
+
+
+def scripts(label: str) -> set:
+    return {SCRIPT_TABLE.get(ord(char), "other") for char in label if char.isalpha()}
+
+
+def decode_host(host: str) -> Tuple[str, str]:
+    """Имя хоста в ASCII (punycode) и в Unicode"""
+    ascii_labels, unicode_labels = [], []
+    for label in host.strip(".").lower().split("."):
+        try:
+            if label.startswith("xn--"):
+                ascii_labels.append(label)
+                unicode_labels.append(label.encode("ascii").decode("idna"))
+            else:
+                ascii_labels.append(label.encode("idna").decode("ascii"))
+                unicode_labels.append(label)
+        except UnicodeError:
+            ascii_labels.append(label)
+            unicode_labels.append(label)
+    return ".".join(ascii_labels), ".".join(unicode_labels)
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def registered_domain(host: str) -> str:
+    labels = host.split(".")
+    if len(labels) >= 3 and ".".join(labels[-2:]) in MULTI_PART_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def extract_url(text: str) -> Optional[str]:
+    match = URL_IN_TEXT.search(text or "")
+    return match.group(0).rstrip(".,;:!?)") if match else None
+
+
+def normalize_url(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Разбирает ссылку и приводит её к одному виду
+
+    Хост переводится в punycode, схема и хост — в нижний регистр, фрагмент
+    отбрасывается. Нормализованная ссылка — ключ кэша и то, что уходит в
+    VirusTotal. Возвращает None, если это не ссылка.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    host = parts.hostname
+    if parts.scheme not in ("http", "https") or not host or not (HOST_CHARS.match(host) or is_ip_address(host)):
+        return None
+
+    ascii_host, unicode_host = decode_host(host)
+    netloc = f"[{ascii_host}]" if ":" in ascii_host else ascii_host
+    if port is not None:
+        netloc = f"{netloc}:{port}"
+    query = f"?{parts.query}" if parts.query else ""
+    return {
+        "url": f"{parts.scheme}://{netloc}{parts.path or '/'}{query}",
+        "host": ascii_host,
+        "unicode_host": unicode_host,
+        "userinfo": "@" in parts.netloc,
+    }
+
+
+def analyze_url(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Быстрая локальная проверка ссылки по эвристикам
+
+    Ищет смешение алфавитов и похожие символы в домене, punycode, домены,
+    похожие на известные бренды, и подозрительные зоны. conclusive=True
+    означает, что отправлять ссылку в VirusTotal не нужно: это официальный
+    домен бренда или явная подделка.
+    """
+    parsed = normalize_url(url)
+    if parsed is None:
+        return None
+
+    host, unicode_host = parsed["host"], parsed["unicode_host"]
+    reasons: List[Tuple[int, str]] = []
+
+    # Упоминание бренда, слова вроде login и поддомены есть и у служебных доменов самих
+    # брендов (login.microsoftonline.com), поэтому явной подделкой ссылка считается,
+    # только если подделан сам домен: похожие символы, смешение алфавитов, «имя@»,
+    # подозрительная зона, IP-адрес
+    forged = False
+
+    is_ip = is_ip_address(host)
+    if is_ip:
+        forged = True
+        reasons.append((2, "Вместо домена указан IP-адрес"))
+        domain = unicode_domain = host
+    else:
+        domain = registered_domain(host)
+        unicode_domain = registered_domain(unicode_host)
+
+    if parsed["userinfo"]:
+        forged = True
+        reasons.append((2, "Перед адресом стоит «имя@» — настоящий сайт указан после @"))
+
+    if not is_ip:
+        if host != unicode_host:
+            reasons.append((1, f"В домене не только латиница, настоящий адрес: {host}"))
+
+        for label in unicode_host.split("."):
+            if len(scripts(label) - {"other"}) > 1:
+                forged = True
+                reasons.append((3, f"В «{label}» смешаны буквы разных алфавитов"))
+                break
+
+        official = OFFICIAL_DOMAINS.get(domain)
+        name = unicode_domain.split(".")[0]
+        name_skeleton = skeleton(name)
+        words = set(re.split(r"[.\-]", skeleton(unicode_host)))
+
+        if official is None:
+            lookalike = None
+            if name_skeleton in BRANDS and name_skeleton != name:
+                lookalike = name_skeleton
+                forged = True
+                reasons.append((3, f"Домен подделывает {lookalike}: похожие символы вместо букв"))
+            else:
+                for brand in BRANDS_BY_LENGTH.get(len(name_skeleton), ()):
+                    limit = BRAND_DISTANCE[brand]
+                    if name_skeleton != brand and edit_distance(name_skeleton, brand, limit) <= limit:
+                        lookalike = brand
+                        forged = True
+                        reasons.append((LOOKALIKE_WEIGHT, f"Домен похож на {brand}, но это не {BRANDS[brand][0]}"))
+                        break
+
+            if lookalike is None:
+                mentioned = (words & BRAND_WORDS) or set(BRAND_SUBSTRINGS.findall(skeleton(unicode_host)))
+                if mentioned:
+                    brand = sorted(mentioned)[0]
+                    reasons.append((2, f"Упоминает {brand}, но это не {BRANDS[brand][0]}"))
+
+        tld = host.rsplit(".", 1)[-1]
+        if tld in SUSPICIOUS_TLDS:
+            forged = True
+            reasons.append((1, f"Зона .{tld} часто используется для фишинга"))
+        if domain in URL_SHORTENERS:
+            reasons.append((1, "Сокращённая ссылка скрывает настоящий адрес"))
+        if len(host.split(".")) - len(domain.split(".")) >= 3:
+            reasons.append((1, "Слишком много поддоменов"))
+        if official is None and CREDENTIAL_WORDS.search(skeleton(unicode_host)):
+            reasons.append((1, "В домене слова вроде login, verify, support"))
+
+    score = sum(weight for weight, _ in reasons)
+    official_brand = None if is_ip else OFFICIAL_DOMAINS.get(domain)
+    if score >= MALICIOUS_SCORE and forged:
+        verdict, conclusive = "malicious", True
+    elif official_brand and domain in USER_CONTENT_DOMAINS:
+        verdict, conclusive = ("suspicious" if score else "unknown"), False
+        reasons.append((0, f"Домен {official_brand}, но на нём размещают и чужие сайты"))
+    elif official_brand and not score:
+        verdict, conclusive = "clean", True
+        reasons.append((0, f"Официальный домен {official_brand}"))
+    elif score:
+        verdict, conclusive = "suspicious", False
+    else:
+        verdict, conclusive = "unknown", False
+
+    return {
+        "url": parsed["url"],
+        "host": unicode_host,
+        "verdict": verdict,
+        "conclusive": conclusive,
+        "score": score,
+        "reasons": [reason for _, reason in reasons],
+    }
@@ -1,13 +1,28 @@
 import aiohttp
-import asyncio
+import base64
+import hashlib
 import logging
 import json
 from typing import Dict, Any, Optional
 
-from config import VIRUSTOTAL_API_KEY
+from config import (
+    VIRUSTOTAL_API_KEY, VIRUSTOTAL_API_URL, VIRUSTOTAL_TIMEOUT,
+    VIRUSTOTAL_CACHE_SIZE, VIRUSTOTAL_CACHE_TTL
+)
+from services.cache import TTLCache
+from services.resilience import fetch, ServiceUnavailable
+from services.analysis_poller import POLLER, AnalysisError, ProgressCallback
 
+# Готовые вердикты по SHA-256 файла
+VERDICT_CACHE = TTLCache(VIRUSTOTAL_CACHE_SIZE, VIRUSTOTAL_CACHE_TTL)
+# Вердикты по нормализованной ссылке
+URL_VERDICT_CACHE = TTLCache(VIRUSTOTAL_CACHE_SIZE, VIRUSTOTAL_CACHE_TTL)
 
-async def scan_file(file_content: bytes, filename: str) -> Dict[str, Any]:
+# Порядок антивирусов в полном отчёте
+ENGINE_CATEGORY_ORDER = {"malicious": 0, "suspicious": 1, "undetected": 2, "harmless": 3}
+
+
+async def scan_file(file_content: bytes, filename: str, on_update: Optional[ProgressCallback] = None) -> Dict[str, Any]:
     if not VIRUSTOTAL_API_KEY:
         logging.error("API ключ VirusTotal не настроен")
         return {
@@ -16,52 +31,73 @@ async def scan_file(file_content: bytes, filename: str) -> Dict[str, Any]:
             "data": None
         }
     
+    # Одинаковые файлы не отправляем повторно
+    file_hash = hashlib.sha256(file_content).hexdigest()
+    cached = VERDICT_CACHE.get(file_hash)
+    if cached is not None:
+        logging.info(f"Результат для файла взят из кэша ({file_hash})", extra={"file_name": filename})
+        return cached
+    
     try:
-        logging.info(f"Начало сканирования файла: {filename} (размер: {len(file_content)} байт)")
-        url = "https://www.virustotal.com/api/v3/files"
+        logging.info(f"Начало сканирования файла (размер: {len(file_content)} байт)", extra={"file_name": filename})
+        url = f"{VIRUSTOTAL_API_URL}/files"
         headers = {
             "x-apikey": VIRUSTOTAL_API_KEY,
             "accept": "application/json"
         }
         
-        form_data = aiohttp.FormData()
-        form_data.add_field('file', file_content, filename=filename)
+        def form_data() -> aiohttp.FormData:
+            data = aiohttp.FormData()
+            data.add_field('file', file_content, filename=filename)
+            return data
         
-        timeout = aiohttp.ClientTimeout(total=300)
+        async with aiohttp.ClientSession() as session:
+            logging.info("Отправка файла на сервер VirusTotal...", extra={"file_name": filename})
+            status, body = await fetch(
+                session, "POST", url, service="virustotal", endpoint="files",
+                timeout=VIRUSTOTAL_TIMEOUT, headers=headers, data=form_data
+            )
+            logging.info(f"Получен ответ от VirusTotal: {status}")
+            
+            if status != 200:
+                logging.error(f"Ошибка при сканировании файла: {status}", extra={"file_name": filename, "response": body[:200]})
+                return {
+                    "error": True,
+                    "message": f"Ошибка при сканировании файла: {status}. Ответ: {body[:100]}",
+                    "data": None
+                }
+            
+            logging.info("Успешно получен ответ от VirusTotal API")
+            analysis_id = json.loads(body).get("data", {}).get("id")
+            
+            if not analysis_id:
+                logging.error("Не удалось получить ID анализа в ответе API")
+                return {
+                    "error": True,
+                    "message": "Не удалось получить ID анализа.",
+                    "data": None
+                }
+            
+        logging.info(f"Получен ID анализа: {analysis_id}")
+        result = process_completed_analysis(await POLLER.wait(analysis_id, len(file_content), on_update))
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            logging.info(f"Отправка файла {filename} на сервер VirusTotal...")
-            async with session.post(url, headers=headers, data=form_data) as response:
-                logging.info(f"Получен ответ от VirusTotal: {response.status}")
-                
-                if response.status == 200:
-                    result = await response.json()
-                    logging.info("Успешно получен ответ от VirusTotal API")
-                    analysis_id = result.get("data", {}).get("id")
-                    
-                    if analysis_id:
-                        logging.info(f"Получен ID анализа: {analysis_id}")
-                        return await get_analysis_result(analysis_id)
-                    else:
-                        logging.error("Не удалось получить ID анализа в ответе API")
-                        return {
-                            "error": True,
-                            "message": "Не удалось получить ID анализа.",
-                            "data": None
-                        }
-                else:
-                    response_text = await response.text()
-                    logging.error(f"Ошибка при сканировании файла: {response.status}, ответ: {response_text[:200]}")
-                    return {
-                        "error": True,
-                        "message": f"Ошибка при сканировании файла: {response.status}. Ответ: {response_text[:100]}",
-                        "data": None
-                    }
-    except asyncio.TimeoutError:
-        logging.error(f"Превышено время ожидания ответа от VirusTotal при сканировании файла {filename}")
+        if not result["error"]:
+            VERDICT_CACHE.set(file_hash, result)
+        return result
+    except AnalysisError as e:
+        return {
+            "error": True,
+            "message": str(e),
+            "data": None
+        }
+    except ServiceUnavailable as e:
+        logging.warning(f"VirusTotal недоступен при сканировании файла: {str(e)}", extra={"file_name": filename})
+        stale = VERDICT_CACHE.get_stale(file_hash)
+        if stale is not None:
+            return stale
         return {
             "error": True,
-            "message": "Превышено время ожидания ответа от сервера. Возможно, файл слишком большой.",
+            "message": "VirusTotal сейчас недоступен. Попробуйте позже.",
             "data": None
         }
     except Exception as e:
@@ -73,67 +109,162 @@ async def scan_file(file_content: bytes, filename: str) -> Dict[str, Any]:
         }
 
 
-async def get_analysis_result(analysis_id: str) -> Dict[str, Any]:
-    attempts = 0
-    max_attempts = 15
-    retry_delay = 10
+async def lookup_hash(sha256: str, session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
+    """
+    Ищет готовый отчёт VirusTotal по SHA-256, не загружая файл
     
-    logging.info(f"Запрашиваем результат анализа {analysis_id}, макс. попыток: {max_attempts}")
+    Returns:
+        Результат в формате scan_file; если VirusTotal файл не знает — data=None без ошибки
+    """
+    cached = VERDICT_CACHE.get(sha256)
+    if cached is not None:
+        return cached
     
-    while attempts < max_attempts:
-        try:
-            url = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
-            headers = {
-                "x-apikey": VIRUSTOTAL_API_KEY,
-                "accept": "application/json"
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                logging.info(f"Попытка {attempts+1}/{max_attempts} получения результата анализа")
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        status = result.get("data", {}).get("attributes", {}).get("status")
-                        logging.info(f"Статус анализа: {status}")
-                        
-                        if status == "completed":
-                            logging.info("Анализ завершен успешно")
-                            return process_completed_analysis(result)
-                        elif status == "queued" or status == "in-progress":
-                            attempts += 1
-                            wait_time = min(retry_delay * attempts, 30)
-                            logging.info(f"Анализ еще в процессе ({status}), ожидаем {wait_time} секунд")
-                            await asyncio.sleep(wait_time)
-                            continue
-                        else:
-                            logging.error(f"Неизвестный статус анализа: {status}")
-                            return {
-                                "error": True,
-                                "message": f"Неизвестный статус анализа: {status}",
-                                "data": None
-                            }
-                    else:
-                        response_text = await response.text()
-                        logging.error(f"Ошибка при получении результатов анализа: {response.status}, ответ: {response_text[:200]}")
-                        return {
-                            "error": True,
-                            "message": f"Ошибка при получении результатов анализа: {response.status}",
-                            "data": None
-                        }
-        except Exception as e:
-            logging.exception(f"Исключение при получении результатов анализа: {str(e)}")
-            return {
-                "error": True,
-                "message": f"Произошла ошибка при получении результатов анализа: {str(e)}",
-                "data": None
-            }
+    if not VIRUSTOTAL_API_KEY:
+        return {
+            "error": True,
+            "message": "API ключ VirusTotal не настроен.",
+            "data": None
+        }
+    
+    headers = {
+        "x-apikey": VIRUSTOTAL_API_KEY,
+        "accept": "application/json"
+    }
+    
+    try:
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await lookup_hash(sha256, own_session)
+        
+        status, body = await fetch(
+            session, "GET", f"{VIRUSTOTAL_API_URL}/files/{sha256}",
+            service="virustotal", endpoint="file_report", timeout=VIRUSTOTAL_TIMEOUT, headers=headers
+        )
+    except ServiceUnavailable as e:
+        stale = VERDICT_CACHE.get_stale(sha256)
+        if stale is not None:
+            return stale
+        return {
+            "error": True,
+            "message": "VirusTotal сейчас недоступен. Попробуйте позже.",
+            "data": None
+        }
+    
+    if status == 404:
+        return {
+            "error": False,
+            "message": "Файл неизвестен VirusTotal.",
+            "data": None
+        }
+    
+    if status != 200:
+        logging.error(f"Ошибка при поиске отчёта по хешу {sha256}: {status}", extra={"response": body[:200]})
+        return {
+            "error": True,
+            "message": f"Ошибка при поиске отчёта: {status}",
+            "data": None
+        }
+    
+    attributes = json.loads(body).get("data", {}).get("attributes", {})
+    result = process_completed_analysis({"data": {"attributes": {
+        "stats": attributes.get("last_analysis_stats", {}),
+        "results": attributes.get("last_analysis_results", {})
+    }}})
+    
+    if not result["error"]:
+        VERDICT_CACHE.set(sha256, result)
+    return result
+
+
+async def check_url(url: str, on_update: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Проверяет ссылку через VirusTotal: готовый отчёт или новый анализ
+
+    url должен быть нормализован (services.url_check.normalize_url) — он же
+    ключ кэша, поэтому одна ссылка в разной записи проверяется один раз.
+    
+    Returns:
+        Результат в формате scan_file
+    """
+    cached = URL_VERDICT_CACHE.get(url)
+    if cached is not None:
+        return cached
+    
+    if not VIRUSTOTAL_API_KEY:
+        return {
+            "error": True,
+            "message": "API ключ VirusTotal не настроен.",
+            "data": None
+        }
     
-    logging.warning(f"Превышено максимальное количество попыток ({max_attempts}) для получения результата анализа")
-    return {
-        "error": True,
-        "message": "Истекло время ожидания результатов анализа. Файл слишком большой или сервис перегружен.",
-        "data": None
+    headers = {
+        "x-apikey": VIRUSTOTAL_API_KEY,
+        "accept": "application/json"
     }
+    # Идентификатор ссылки в VirusTotal — base64url без выравнивания
+    url_id = base64.urlsafe_b64encode(url.encode()).decode().rstrip("=")
+    
+    try:
+        async with aiohttp.ClientSession() as session:
+            status, body = await fetch(
+                session, "GET", f"{VIRUSTOTAL_API_URL}/urls/{url_id}",
+                service="virustotal", endpoint="url_report", timeout=VIRUSTOTAL_TIMEOUT, headers=headers
+            )
+            
+            if status == 200:
+                attributes = json.loads(body).get("data", {}).get("attributes", {})
+                analysis = {"data": {"attributes": {
+                    "stats": attributes.get("last_analysis_stats", {}),
+                    "results": attributes.get("last_analysis_results", {})
+                }}}
+            elif status == 404:
+                # Ссылку ещё никто не проверял — отправляем на анализ
+                status, body = await fetch(
+                    session, "POST", f"{VIRUSTOTAL_API_URL}/urls",
+                    service="virustotal", endpoint="urls", timeout=VIRUSTOTAL_TIMEOUT, headers=headers,
+                    data={"url": url}
+                )
+                analysis_id = json.loads(body).get("data", {}).get("id") if status == 200 else None
+                if not analysis_id:
+                    logging.error(f"Ошибка при отправке ссылки на анализ: {status}", extra={"response": body[:200]})
+                    return {
+                        "error": True,
+                        "message": f"Ошибка при отправке ссылки на анализ: {status}",
+                        "data": None
+                    }
+                analysis = None
+            else:
+                logging.error(f"Ошибка при поиске отчёта по ссылке: {status}", extra={"response": body[:200]})
+                return {
+                    "error": True,
+                    "message": f"Ошибка при поиске отчёта: {status}",
+                    "data": None
+                }
+        
+        if analysis is None:
+            analysis = await POLLER.wait(analysis_id, 0, on_update)
+        result = process_completed_analysis(analysis)
+    except AnalysisError as e:
+        return {
+            "error": True,
+            "message": str(e),
+            "data": None
+        }
+    except ServiceUnavailable as e:
+        logging.warning(f"VirusTotal недоступен при проверке ссылки: {str(e)}")
+        stale = URL_VERDICT_CACHE.get_stale(url)
+        if stale is not None:
+            return stale
+        return {
+            "error": True,
+            "message": "VirusTotal сейчас недоступен. Попробуйте позже.",
+            "data": None
+        }
+    
+    if not result["error"]:
+        URL_VERDICT_CACHE.set(url, result)
+    return result
 
 
 def process_completed_analysis(result: Dict[str, Any]) -> Dict[str, Any]:
@@ -149,12 +280,21 @@ def process_completed_analysis(result: Dict[str, Any]) -> Dict[str, Any]:
         logging.info(f"Анализ обнаружил: malicious={malicious}, suspicious={suspicious}, total={total}")
         
         detection_engines = []
+        engines = []
         for engine, detection in results.items():
             if detection.get("category") in ["malicious", "suspicious"]:
                 detection_engines.append({
                     "name": engine,
                     "result": detection.get("result", "Неизвестно")
                 })
+            engines.append({
+                "name": engine,
+                "category": detection.get("category", "unknown"),
+                "result": detection.get("result")
+            })
+        
+        # Полный список для истории проверок: сначала обнаружения
+        engines.sort(key=lambda item: (ENGINE_CATEGORY_ORDER.get(item["category"], len(ENGINE_CATEGORY_ORDER)), item["name"]))
         
         threat_level = "Безопасно"
         if malicious > 0:
@@ -172,7 +312,8 @@ def process_completed_analysis(result: Dict[str, Any]) -> Dict[str, Any]:
                 "detection_ratio": detection_ratio,
                 "malicious": malicious,
                 "suspicious": suspicious,
-                "detection_engines": detection_engines[:5]
+                "detection_engines": detection_engines[:5],
+                "engines": engines
             }
         }
     except Exception as e:
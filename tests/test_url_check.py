@@ -0,0 +1,63 @@
+import pytest
+
+from services.url_check import analyze_url
+
+
+@pytest.mark.parametrize("url", [
+    "stream.com", "team.com", "steak.com", "email.com", "cloud.com",
+    "apply.com", "ample.com", "amazing.com", "telegraph.co.uk",
+])
+def test_lookalike_alone_is_not_conclusive(url):
+    # Обычные домены, похожие на бренд, уходят в VirusTotal, а не объявляются фишингом
+    result = analyze_url(url)
+    assert result["verdict"] != "malicious"
+    assert not result["conclusive"]
+
+
+@pytest.mark.parametrize("url", [
+    "mail-suрport.com", "paypa1.com", "https://оzon.ru", "yandx.top", "login.yandx.ru", "sberbank-online.xyz",
+])
+def test_lookalike_with_another_signal_is_malicious(url):
+    result = analyze_url(url)
+    assert result["verdict"] == "malicious"
+    assert result["conclusive"]
+
+
+def test_distance_only_lookalike_is_suspicious():
+    result = analyze_url("yandx.ru")
+    assert result["verdict"] == "suspicious"
+    assert not result["conclusive"]
+
+
+def test_official_domain_is_clean():
+    result = analyze_url("https://accounts.google.com/signin")
+    assert result["verdict"] == "clean"
+    assert result["conclusive"]
+
+
+@pytest.mark.parametrize("url", [
+    "login.microsoftonline.com", "update.googleapis.com", "securetoken.googleapis.com",
+    "accounts.googleusercontent.com", "updates.cdn-apple.com", "secure.paypalobjects.com",
+])
+def test_brand_service_domain_is_not_phishing(url):
+    result = analyze_url(url)
+    assert result["verdict"] != "malicious"
+
+
+@pytest.mark.parametrize("url", ["paypal-login.com", "secure-microsoft.net", "account.googlecheck.com"])
+def test_brand_mention_with_credential_word_goes_to_virustotal(url):
+    result = analyze_url(url)
+    assert result["verdict"] == "suspicious"
+    assert not result["conclusive"]
+
+
+@pytest.mark.parametrize("url", ["storage.googleapis.com/bucket/login.html", "evil.github.io"])
+def test_user_content_domain_goes_to_virustotal(url):
+    result = analyze_url(url)
+    assert not result["conclusive"]
+
+
+def test_brand_mention_with_suspicious_tld_is_malicious():
+    result = analyze_url("paypal-login.top")
+    assert result["verdict"] == "malicious"
+    assert result["conclusive"]
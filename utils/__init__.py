@@ -5,5 +5,6 @@ from .helpers import (
     save_test_result,
     get_user_progress,
     generate_phishing_link,
-    sanitize_filename
+    sanitize_filename,
+    is_admin
 ) 
\ No newline at end of file
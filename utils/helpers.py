@@ -1,11 +1,18 @@
+import base64
+import binascii
 import hashlib
+import hmac
+import struct
 import uuid
-from typing import Dict, List, Union, Any
+from typing import Dict, List, Union, Any, Optional, Tuple
 
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func
 from sqlalchemy.future import select
 
-from models.models import User, Session, TestResult
+from config import ADMIN_IDS, TRACKING_BASE_URL, TRACKING_SECRET
+from database import current_tenant
+from models.models import User, Session, TestResult, TestDailyStat
 
 
 async def get_or_create_user(session: AsyncSession, user_id: int, username: str = None) -> User:
@@ -62,6 +69,16 @@ async def get_user_progress(session: AsyncSession, user_id: int) -> Dict[str, An
         if result.theme not in themes or result.score > themes[result.theme]:
             themes[result.theme] = result.score
     
+    # Старые попытки свёрнуты обслуживанием базы в дневные итоги
+    rollups = await session.execute(
+        select(TestDailyStat.theme, func.max(TestDailyStat.best_score))
+        .where(TestDailyStat.user_id == user_id)
+        .group_by(TestDailyStat.theme)
+    )
+    for theme, best_score in rollups:
+        if theme not in themes or best_score > themes[theme]:
+            themes[theme] = best_score
+    
     return {
         "completed_themes": list(themes.keys()),
         "scores": themes,
@@ -69,10 +86,59 @@ async def get_user_progress(session: AsyncSession, user_id: int) -> Dict[str, An
     }
 
 
-def generate_phishing_link() -> str:
+# Токен: user_id (8 байт) + campaign_id (4 байта) + id сценария + усечённая HMAC-SHA256 подпись.
+# Организация в токен не входит (она есть в ссылке), но подписывается вместе с ним
+_TOKEN_HEADER = struct.Struct(">qI")
+_TOKEN_SIGNATURE_SIZE = 8
+
+
+def _sign(payload: bytes, tenant: Optional[str] = None) -> bytes:
+    if tenant:
+        payload = tenant.encode() + b"\0" + payload
+    return hmac.new(TRACKING_SECRET.encode(), payload, hashlib.sha256).digest()[:_TOKEN_SIGNATURE_SIZE]
+
+
+def make_tracking_token(user_id: int, scenario_id: str, campaign_id: int = 0, tenant: Optional[str] = None) -> str:
+    payload = _TOKEN_HEADER.pack(user_id, campaign_id) + scenario_id.encode()
+    return base64.urlsafe_b64encode(payload + _sign(payload, tenant)).rstrip(b"=").decode()
+
+
+def parse_tracking_token(token: str, tenant: Optional[str] = None) -> Optional[Tuple[int, str, int]]:
+    """Проверяет подпись токена и возвращает (user_id, scenario_id, campaign_id) или None"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, binascii.Error):
+        return None
+    
+    if len(raw) < _TOKEN_HEADER.size + _TOKEN_SIGNATURE_SIZE:
+        return None
+    
+    payload, signature = raw[:-_TOKEN_SIGNATURE_SIZE], raw[-_TOKEN_SIGNATURE_SIZE:]
+    if not hmac.compare_digest(signature, _sign(payload, tenant)):
+        return None
+    
+    user_id, campaign_id = _TOKEN_HEADER.unpack_from(payload)
+    try:
+        scenario_id = payload[_TOKEN_HEADER.size:].decode()
+    except UnicodeDecodeError:
+        return None
+    
+    return user_id, scenario_id, campaign_id
+
+
+def generate_phishing_link(user_id: int = None, scenario_id: str = None, campaign_id: int = 0) -> str:
+    if TRACKING_BASE_URL and user_id is not None and scenario_id:
+        tenant = current_tenant.get()
+        token = make_tracking_token(user_id, scenario_id, campaign_id, tenant)
+        return f"{TRACKING_BASE_URL}/c/{tenant}/{token}" if tenant else f"{TRACKING_BASE_URL}/c/{token}"
+    
     unique_id = hashlib.md5(str(uuid.uuid4()).encode()).hexdigest()[:8]
     return f"https://example-simulation-only.edu/{unique_id}"
 
 
 def sanitize_filename(filename: str) -> str:
-    return "".join(c for c in filename if c.isalnum() or c in "._- ").strip() 
\ No newline at end of file
+    return "".join(c for c in filename if c.isalnum() or c in "._- ").strip()
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS